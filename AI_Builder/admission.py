@@ -0,0 +1,269 @@
+"""
+Admission control for LLM-bound work in AI Builder Version 2
+Per-provider concurrency caps with priority lanes, weighted fair queuing across users,
+queue-position events and load shedding
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv, find_dotenv
+
+from .metrics import increment, observe
+from .rate_limiter import provider_for_model, agent_model_name
+
+_ = load_dotenv(find_dotenv())
+
+# Concurrent agent runs per provider in one worker
+DEFAULT_PROVIDER_CONCURRENCY = {"anthropic": 24, "gemini": 48, "openai": 24}
+PROVIDER_CONCURRENCY = {**DEFAULT_PROVIDER_CONCURRENCY, **json.loads(os.getenv("PROVIDER_CONCURRENCY", "{}"))}
+# New requests are rejected with 429 when their expected queue wait exceeds this
+ADMISSION_SLO_SECONDS = float(os.getenv("ADMISSION_SLO_SECONDS", "20"))
+
+# Lower lanes are served first: plan lane, then task lane. PLAN_PRIORITIES maps plan_id -> lane
+PLAN_PRIORITIES = {str(plan): lane for plan, lane in json.loads(os.getenv("PLAN_PRIORITIES", "{}")).items()}
+DEFAULT_PLAN_LANE = 1
+# Short interactive runs go ahead of long generations
+TASK_LANES = {
+    "Manager": 0,
+    "FirstTurnRouter": 0,
+    "NameSuggestion": 0,
+    "ProjectSummary": 0,
+    "UpdatingAndErrorSummary": 0,
+    "CodeConversation": 1,
+    "ProjectPlanner": 1,
+    "ProjectPlannerWithSummary": 1,
+    "ChangeCodeAgent": 1,
+    "ErrorFilesFinder": 1,
+}
+DEFAULT_TASK_LANE = 2
+# Share of a provider each user gets within a lane when queues form; PLAN_WEIGHTS maps plan_id -> weight
+PLAN_WEIGHTS = {str(plan): float(weight) for plan, weight in json.loads(os.getenv("PLAN_WEIGHTS", "{}")).items()}
+DEFAULT_USER_WEIGHT = 1.0
+MAX_FAIRNESS_TAGS = 10000
+
+# Initial guess of how long an agent run holds its slot, refined as runs complete
+DEFAULT_RUN_SECONDS = 15.0
+HOLD_SMOOTHING = 0.2
+# How often a waiting request is told its queue position
+QUEUE_UPDATE_SECONDS = 2.0
+
+_current_admission = contextvars.ContextVar("request_admission", default=None)
+_sequence = itertools.count()
+
+
+class AdmissionRejected(Exception):
+    """The provider queue is beyond the latency SLO; retry after ``retry_after`` seconds"""
+
+    def __init__(self, provider, retry_after):
+        super().__init__(f"{provider} queue is full, retry in {retry_after}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class RequestAdmission:
+    """Per-request admission state: priority lane, fair-share identity and where queue events go"""
+
+    def __init__(self, plan_lane, user_id=None, weight=DEFAULT_USER_WEIGHT):
+        self.plan_lane = plan_lane
+        self.user_id = user_id
+        self.weight = weight
+        self.events = None  # asyncio.Queue once the SSE stream has started
+
+
+class ProviderQueue:
+    """Concurrency cap for one provider; waiting runs are served by lane, then fair share, then arrival.
+
+    Fair share is start-time fair queuing: each user's runs get virtual start
+    tags spaced 1/weight apart, so a user with many queued runs alternates
+    with other users instead of going first with all of them.
+    """
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self.waiters = []  # heap of ((plan lane, task lane, virtual start), sequence, future)
+        self.avg_hold = DEFAULT_RUN_SECONDS
+        self.virtual_time = 0.0
+        self.finish_tags = {}
+
+    def fair_start(self, admission):
+        """Virtual start tag of a new run for the admission's user"""
+        if admission is None or admission.user_id is None:
+            return self.virtual_time
+        start = max(self.virtual_time, self.finish_tags.get(admission.user_id, 0.0))
+        self.finish_tags[admission.user_id] = start + 1.0 / admission.weight
+        if len(self.finish_tags) > MAX_FAIRNESS_TAGS:
+            self.finish_tags = {user: tag for user, tag in self.finish_tags.items() if tag > self.virtual_time}
+        return start
+
+    def waiting(self):
+        return sum(1 for *_, future in self.waiters if not future.done())
+
+    def position(self, entry):
+        """1-based place of ``entry`` among the runs still waiting"""
+        return 1 + sum(1 for other in self.waiters if other[:2] < entry[:2] and not other[2].done())
+
+    def estimated_wait(self, ahead):
+        if self.active < self.limit and not ahead:
+            return 0.0
+        return (ahead + 1) / self.limit * self.avg_hold
+
+    async def acquire(self, priority, admission=None):
+        start_tag = self.fair_start(admission)
+        if self.active < self.limit and not self.waiting():
+            self.active += 1
+            self.virtual_time = max(self.virtual_time, start_tag)
+            return
+        loop = asyncio.get_running_loop()
+        entry = ((*priority, start_tag), next(_sequence), loop.create_future())
+        heapq.heappush(self.waiters, entry)
+        increment(f"admission.{self.name}.queued")
+        start = time.monotonic()
+        last_position = None
+        try:
+            while not entry[2].done():
+                position = self.position(entry)
+                if admission is not None and admission.events is not None and position != last_position:
+                    admission.events.put_nowait({
+                        "type": "queue_position",
+                        "provider": self.name,
+                        "position": position,
+                        "estimated_wait": round(self.estimated_wait(position - 1), 1),
+                    })
+                    last_position = position
+                try:
+                    await asyncio.wait_for(asyncio.shield(entry[2]), QUEUE_UPDATE_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            if entry[2].done() and not entry[2].cancelled():
+                self.release()  # the slot was handed over just as we gave up
+            else:
+                entry[2].cancel()
+            raise
+        finally:
+            observe(f"admission.{self.name}.wait", time.monotonic() - start)
+
+    def release(self, held_seconds=None):
+        if held_seconds is not None:
+            self.avg_hold += HOLD_SMOOTHING * (held_seconds - self.avg_hold)
+        while self.waiters:
+            priority, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                self.virtual_time = max(self.virtual_time, priority[-1])
+                future.set_result(None)  # hand the slot over, active stays the same
+                return
+        self.active -= 1
+
+
+_queues = {}
+
+
+def get_queue(provider):
+    queue = _queues.get(provider)
+    if queue is None:
+        queue = _queues[provider] = ProviderQueue(provider, int(PROVIDER_CONCURRENCY.get(provider, DEFAULT_PROVIDER_CONCURRENCY["openai"])))
+    return queue
+
+
+def start_admission(plan_id=None, user_id=None):
+    """Begin admission tracking for the current request (lane and weight from the subscription plan)"""
+    admission = RequestAdmission(
+        PLAN_PRIORITIES.get(str(plan_id), DEFAULT_PLAN_LANE),
+        user_id,
+        PLAN_WEIGHTS.get(str(plan_id), DEFAULT_USER_WEIGHT),
+    )
+    _current_admission.set(admission)
+    return admission
+
+
+def current_admission():
+    return _current_admission.get()
+
+
+def check_admission(providers=("anthropic", "gemini")):
+    """Reject a new request up front when its expected queue wait is beyond the SLO"""
+    admission = current_admission()
+    plan_lane = admission.plan_lane if admission else DEFAULT_PLAN_LANE
+    for provider in providers:
+        queue = get_queue(provider)
+        ahead = sum(1 for (lane, *_), _, future in queue.waiters if lane <= plan_lane and not future.done())
+        wait = queue.estimated_wait(ahead)
+        if wait > ADMISSION_SLO_SECONDS:
+            increment(f"admission.{provider}.rejected")
+            raise AdmissionRejected(provider, math.ceil(wait))
+
+
+@asynccontextmanager
+async def admit(agent):
+    """Hold a provider slot for one agent run, waiting in the request's priority lane"""
+    queue = get_queue(provider_for_model(agent_model_name(agent)))
+    admission = current_admission()
+    plan_lane = admission.plan_lane if admission else DEFAULT_PLAN_LANE
+    await queue.acquire((plan_lane, TASK_LANES.get(agent.name, DEFAULT_TASK_LANE)), admission)
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        queue.release(time.monotonic() - start)
+
+
+async def stream_with_queue_events(stream):
+    """Relay an SSE stream, adding queue_position events while its agent runs wait for a slot"""
+    admission = current_admission()
+    if admission is None:
+        async for item in stream:
+            yield item
+        return
+
+    admission.events = asyncio.Queue()
+    next_item = asyncio.ensure_future(stream.__anext__())
+    next_event = None
+    try:
+        while True:
+            next_event = asyncio.ensure_future(admission.events.get())
+            done, _ = await asyncio.wait({next_item, next_event}, return_when=asyncio.FIRST_COMPLETED)
+            if next_event in done:
+                yield f"data: {json.dumps(next_event.result())}\n\n"
+            else:
+                next_event.cancel()
+            if next_item in done:
+                try:
+                    item = next_item.result()
+                except StopAsyncIteration:
+                    break
+                yield item
+                next_item = asyncio.ensure_future(stream.__anext__())
+    finally:
+        admission.events = None
+        if next_event is not None:
+            next_event.cancel()
+        if not next_item.done():
+            # Client went away mid-run: stop the inner stream before closing it
+            next_item.cancel()
+            try:
+                await next_item
+            except BaseException:
+                pass
+        await stream.aclose()
+
+
+def admission_stats():
+    return {
+        provider: {
+            "active": queue.active,
+            "waiting": queue.waiting(),
+            "limit": queue.limit,
+            "avg_run_seconds": round(queue.avg_hold, 2),
+        }
+        for provider, queue in _queues.items()
+    }
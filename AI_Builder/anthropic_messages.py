@@ -0,0 +1,235 @@
+"""
+Native Anthropic Messages API client for AI Builder Version 2
+Serves the ``chat.completions.create`` calls of OpenAIChatCompletionsModel from /v1/messages,
+because the OpenAI-compatible endpoint ignores prompt-caching markers (see prompt_cache.py)
+"""
+
+import asyncio
+import json
+import os
+import time
+
+import httpx
+from dotenv import load_dotenv, find_dotenv
+from openai import NotGiven, Omit
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from .metrics import increment
+from .prompt_cache import PROMPT_CACHE_ENABLED, add_cache_markers
+
+_ = load_dotenv(find_dotenv())
+
+ANTHROPIC_BASE_URL = "https://api.anthropic.com/v1/"
+ANTHROPIC_VERSION = "2023-06-01"
+# /v1/messages requires max_tokens; used when the agent's ModelSettings leave it unset
+ANTHROPIC_MAX_TOKENS = int(os.getenv("ANTHROPIC_MAX_TOKENS", "32000"))
+MAX_RETRIES = 2
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504, 529}
+
+FINISH_REASONS = {"end_turn": "stop", "stop_sequence": "stop", "max_tokens": "length", "tool_use": "tool_calls", "refusal": "content_filter"}
+# Chat completion arguments with no Messages API equivalent in this client (none of the Claude agents use them)
+UNSUPPORTED_ARGUMENTS = ("tools", "response_format", "n")
+
+
+class AnthropicAPIError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(f"Anthropic API error {status_code}: {message}")
+        self.status_code = status_code
+
+
+def _given(value):
+    return value is not None and not isinstance(value, (Omit, NotGiven))
+
+
+def _content_blocks(content):
+    """Anthropic content blocks from chat completion message content (text and images)"""
+    if isinstance(content, str):
+        return [{"type": "text", "text": content}] if content else []
+    blocks = []
+    for part in content or []:
+        if part.get("type") == "text" and part.get("text"):
+            block = {"type": "text", "text": part["text"]}
+            if "cache_control" in part:
+                block["cache_control"] = part["cache_control"]
+            blocks.append(block)
+        elif part.get("type") == "image_url":
+            url = part["image_url"]["url"]
+            if url.startswith("data:") and ";base64," in url:
+                media_type, data = url[len("data:"):].split(";base64,", 1)
+                blocks.append({"type": "image", "source": {"type": "base64", "media_type": media_type, "data": data}})
+            else:
+                blocks.append({"type": "image", "source": {"type": "url", "url": url}})
+    return blocks
+
+
+def messages_request(create_kwargs):
+    """/v1/messages request body for a chat.completions.create call"""
+    unsupported = [name for name in UNSUPPORTED_ARGUMENTS if _given(create_kwargs.get(name))]
+    if unsupported:
+        raise ValueError(f"Native Anthropic client does not support {', '.join(unsupported)}")
+    messages = [dict(message) for message in create_kwargs["messages"]]
+    if PROMPT_CACHE_ENABLED:
+        markers = add_cache_markers(messages)
+        if markers:
+            increment("prompt_cache.marked_requests")
+            increment("prompt_cache.markers", markers)
+
+    system = []
+    conversation = []
+    for message in messages:
+        role = message.get("role")
+        if role in ("system", "developer"):
+            system.extend(_content_blocks(message.get("content")))
+        elif role in ("user", "assistant") and not message.get("tool_calls"):
+            blocks = _content_blocks(message.get("content"))
+            if blocks:
+                conversation.append({"role": role, "content": blocks})
+        else:
+            raise ValueError(f"Native Anthropic client does not support {role} messages with tool calls")
+
+    body = {
+        "model": create_kwargs["model"],
+        "messages": conversation,
+        "max_tokens": create_kwargs.get("max_tokens") if _given(create_kwargs.get("max_tokens")) else ANTHROPIC_MAX_TOKENS,
+    }
+    if system:
+        body["system"] = system
+    for name in ("temperature", "top_p"):
+        if _given(create_kwargs.get(name)):
+            body[name] = create_kwargs[name]
+    stop = create_kwargs.get("stop")
+    if _given(stop):
+        body["stop_sequences"] = [stop] if isinstance(stop, str) else list(stop)
+    if _given(create_kwargs.get("stream")):
+        body["stream"] = bool(create_kwargs["stream"])
+    if _given(create_kwargs.get("extra_body")):
+        body.update(create_kwargs["extra_body"])
+    return body
+
+
+def chat_usage(usage, output_tokens=None):
+    """Chat completion usage from Messages API usage; cache reads are reported as cached prompt tokens"""
+    cached_tokens = usage.get("cache_read_input_tokens") or 0
+    prompt_tokens = (usage.get("input_tokens") or 0) + cached_tokens + (usage.get("cache_creation_input_tokens") or 0)
+    completion_tokens = output_tokens if output_tokens is not None else usage.get("output_tokens") or 0
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": cached_tokens},
+    }
+
+
+def chat_completion(message):
+    """ChatCompletion from a /v1/messages response"""
+    text = "".join(block.get("text", "") for block in message.get("content", []) if block.get("type") == "text")
+    return ChatCompletion.model_validate({
+        "id": message.get("id", ""),
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": message.get("model", ""),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": FINISH_REASONS.get(message.get("stop_reason"), "stop"),
+        }],
+        "usage": chat_usage(message.get("usage") or {}),
+    })
+
+
+def _chunk(message_id, created, model, delta=None, finish_reason=None, usage=None):
+    choices = [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+    return ChatCompletionChunk.model_validate({
+        "id": message_id, "object": "chat.completion.chunk", "created": created, "model": model,
+        "choices": choices, "usage": usage,
+    })
+
+
+async def _server_sent_events(response):
+    data = []
+    async for line in response.aiter_lines():
+        if line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+        elif not line and data:
+            yield json.loads("\n".join(data))
+            data = []
+    if data:
+        yield json.loads("\n".join(data))
+
+
+async def chat_completion_chunks(response, model):
+    """ChatCompletionChunks from a streaming /v1/messages response, closing it when done"""
+    message_id, created = "", int(time.time())
+    usage, output_tokens, finish_reason = {}, 0, "stop"
+    try:
+        async for event in _server_sent_events(response):
+            kind = event.get("type")
+            if kind == "message_start":
+                message = event.get("message") or {}
+                message_id, model = message.get("id", ""), message.get("model") or model
+                usage = message.get("usage") or {}
+                yield _chunk(message_id, created, model, {"role": "assistant", "content": ""})
+            elif kind == "content_block_delta" and event["delta"].get("type") == "text_delta":
+                yield _chunk(message_id, created, model, {"content": event["delta"]["text"]})
+            elif kind == "message_delta":
+                finish_reason = FINISH_REASONS.get(event["delta"].get("stop_reason"), "stop")
+                output_tokens = (event.get("usage") or {}).get("output_tokens", output_tokens)
+            elif kind == "error":
+                error = event.get("error") or {}
+                raise AnthropicAPIError(error.get("type", "stream"), error.get("message", ""))
+        yield _chunk(message_id, created, model, {}, finish_reason)
+        yield _chunk(message_id, created, model, usage=chat_usage(usage, output_tokens))
+    finally:
+        await response.aclose()
+
+
+class _Completions:
+    def __init__(self, client):
+        self._client = client
+
+    async def create(self, **create_kwargs):
+        body = messages_request(create_kwargs)
+        response = await self._client.send(body, create_kwargs.get("extra_headers"), create_kwargs.get("extra_query"))
+        if body.get("stream"):
+            return chat_completion_chunks(response, body["model"])
+        return chat_completion(response.json())
+
+
+class _Chat:
+    def __init__(self, client):
+        self.completions = _Completions(client)
+
+
+class AnthropicChatClient:
+    """Stand-in for AsyncOpenAI in OpenAIChatCompletionsModel that talks to the native Messages API"""
+
+    def __init__(self, api_key, http_client, base_url=ANTHROPIC_BASE_URL):
+        self.api_key = api_key
+        self.base_url = httpx.URL(base_url.rstrip("/") + "/")
+        self.http_client = http_client
+        self.chat = _Chat(self)
+
+    async def send(self, body, extra_headers=None, extra_query=None):
+        """POST /messages with retries on overload and rate limits; the response is left open when streaming"""
+        headers = {"x-api-key": self.api_key, "anthropic-version": ANTHROPIC_VERSION, "content-type": "application/json"}
+        headers.update({name: value for name, value in (extra_headers or {}).items() if isinstance(value, str)})
+        request = self.http_client.build_request("POST", self.base_url.join("messages"), headers=headers, json=body, params=extra_query or None)
+        for attempt in range(MAX_RETRIES + 1):
+            response = await self.http_client.send(request, stream=True)
+            if response.status_code < 400:
+                if not body.get("stream"):
+                    await response.aread()
+                    await response.aclose()
+                return response
+            await response.aread()
+            await response.aclose()
+            if response.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+                break
+            increment("clients.anthropic.retries")
+            retry_after = response.headers.get("retry-after", "")
+            await asyncio.sleep(min(float(retry_after), 10.0) if retry_after.isdigit() else 0.5 * 2 ** attempt)
+        try:
+            message = response.json().get("error", {}).get("message", response.text)
+        except ValueError:
+            message = response.text
+        raise AnthropicAPIError(response.status_code, message)
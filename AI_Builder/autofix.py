@@ -0,0 +1,364 @@
+"""
+Deterministic auto-fix rules for common generated-project errors
+Runs before any LLM call; a matching rule resolves the error on its own
+"""
+
+import json
+import posixpath
+import re
+import time
+from collections import namedtuple
+
+from .error_parser import MISSING_EXPORT_PATTERN, RESOLVE_IMPORT_PATTERN, parse_error_message
+from .import_graph import find_project_path
+from .metrics import increment, get_counter, observe
+
+# name: metrics label, triggers: lowercase error substrings, fix(error_text, files) -> {path: content or None} or None
+AutofixRule = namedtuple("AutofixRule", ["name", "triggers", "fix", "description"])
+
+ROUTER_COMPONENTS = ("BrowserRouter", "HashRouter")
+ROUTER_IMPORT_PATTERN = re.compile(r"""import\s*\{([^}]*)\}\s*from\s*['"]react-router-dom['"]\s*;?""")
+LUCIDE_IMPORT_PATTERN = re.compile(r"""import\s*\{([^}]*)\}\s*from\s*['"]lucide-react['"]""")
+# esbuild: No matching export in "src/components/Hero.jsx" for import "default"
+NO_MATCHING_EXPORT_PATTERN = re.compile(r"""No matching export in\s+["']([^"']+)["']\s+for import\s+["']([^"']+)["']""", re.IGNORECASE)
+# Cannot find module 'x' / Can't resolve 'x' / Could not resolve "x"
+MISSING_MODULE_PATTERN = re.compile(r"""(?:Cannot find module|Can't resolve|Could not resolve)\s+["']([^"']+)["']""", re.IGNORECASE)
+
+# Icon names models invent (mostly brand logos lucide-react doesn't ship) -> real lucide icons
+LUCIDE_ICON_ALIASES = {
+    "Tiktok": "Music", "TikTok": "Music", "Spotify": "Music", "Soundcloud": "Music",
+    "Whatsapp": "MessageCircle", "WhatsApp": "MessageCircle", "Reddit": "MessageCircle",
+    "Discord": "MessageSquare", "Slack": "MessageSquare", "Telegram": "Send",
+    "Google": "Globe", "Microsoft": "Monitor", "Apple": "Smartphone", "Android": "Smartphone",
+    "Pinterest": "Image", "Snapchat": "Camera", "Medium": "BookOpen", "Behance": "Palette",
+    "Paypal": "CreditCard", "PayPal": "CreditCard", "Stripe": "CreditCard", "Amazon": "ShoppingCart",
+    "Cart": "ShoppingCart", "Close": "X", "Hamburger": "Menu", "Spinner": "Loader",
+    "Gear": "Settings", "Email": "Mail", "Envelope": "Mail", "Location": "MapPin",
+    "Profile": "User", "Dollar": "DollarSign", "Logout": "LogOut", "Login": "LogIn",
+    "Checkmark": "Check", "Delete": "Trash2", "Notification": "Bell", "Notifications": "Bell",
+}
+FALLBACK_LUCIDE_ICON = "Circle"
+
+# Packages the missing-dependency fix may add, with their pinned versions (others go to the resolver)
+KNOWN_PACKAGE_VERSIONS = {
+    "react-router-dom": "^6.26.2",
+    "lucide-react": "^0.441.0",
+    "framer-motion": "^11.3.31",
+    "axios": "^1.7.7",
+    "react-icons": "^5.3.0",
+    "clsx": "^2.1.1",
+    "tailwind-merge": "^2.5.2",
+    "zustand": "^4.5.5",
+    "react-hot-toast": "^2.4.1",
+    "react-toastify": "^10.0.5",
+    "date-fns": "^3.6.0",
+    "recharts": "^2.12.7",
+    "uuid": "^10.0.0",
+    "@headlessui/react": "^2.1.8",
+    "@heroicons/react": "^2.1.5",
+}
+
+VOID_ELEMENTS = "area|base|br|col|embed|hr|img|input|link|meta|source|track|wbr"
+JSX_ATTRIBUTES = r"""(?:[^<>"'{}/]|"[^"]*"|'[^']*'|\{(?:[^{}]|\{[^{}]*\})*\})*?"""
+# <App \n </BrowserRouter>  ->  <App />\n </BrowserRouter>
+UNCLOSED_TAG_PATTERN = re.compile(
+    r"""<([A-Za-z][\w.]*)((?:\s+[\w:-]+(?:=(?:"[^"]*"|'[^']*'|\{(?:[^{}]|\{[^{}]*\})*\}))?)*)[ \t]*\n([ \t]*)</"""
+)
+# <img src={x}>  ->  <img src={x} />
+UNCLOSED_VOID_PATTERN = re.compile(rf"<({VOID_ELEMENTS})\b({JSX_ATTRIBUTES})(?<!/)>")
+PACKAGE_KEY_TYPOS = ("package.", "package", "package.jsn", "packages.json", "package.JSON")
+
+
+def _is_jsx_file(file_path):
+    return file_path.endswith((".jsx", ".tsx", ".js"))
+
+
+def _import_items(import_body):
+    return [item.strip() for item in import_body.split(",") if item.strip()]
+
+
+def _local_names(import_body, exported_names):
+    """Local names bound by ``import { A as B }`` for the given exported names"""
+    names = []
+    for item in _import_items(import_body):
+        parts = [part.strip() for part in item.split(" as ")]
+        if parts[0] in exported_names:
+            names.append(parts[-1])
+    return names
+
+
+# -------------------
+# Nested BrowserRouter
+# -------------------
+
+def _router_names(content):
+    names = []
+    for match in ROUTER_IMPORT_PATTERN.finditer(content):
+        names.extend(_local_names(match.group(1), ROUTER_COMPONENTS))
+    return [name for name in names if re.search(rf"<{re.escape(name)}[\s>]", content)]
+
+
+def _entry_file(files):
+    for file_path, content in files.items():
+        if _is_jsx_file(file_path) and isinstance(content, str) and ("createRoot(" in content or "ReactDOM.render(" in content):
+            return file_path
+    return "src/main.jsx"
+
+
+def _remove_router(content, local_names):
+    """Replace router wrappers with fragments and drop their import"""
+    for name in local_names:
+        content = re.sub(rf"<{re.escape(name)}(?:\s[^>]*)?>", "<>", content)
+        content = content.replace(f"</{name}>", "</>")
+
+    def strip_import(match):
+        items = [item for item in _import_items(match.group(1)) if item.split(" as ")[0].strip() not in ROUTER_COMPONENTS]
+        if not items:
+            return ""
+        return match.group(0).replace(match.group(1), " " + ", ".join(items) + " ")
+
+    content = ROUTER_IMPORT_PATTERN.sub(strip_import, content)
+    return re.sub(r"\n{3,}", "\n\n", content.lstrip("\n"))
+
+
+def fix_nested_router(error_text, files):
+    routers = {path: _router_names(content) for path, content in files.items() if _is_jsx_file(path) and isinstance(content, str)}
+    routers = {path: names for path, names in routers.items() if names}
+    if len(routers) < 2:
+        return None
+
+    # Keep the outermost router: the entry file's if it has one, otherwise App
+    entry = _entry_file(files)
+    keep = entry if entry in routers else find_project_path("App.jsx", routers) or sorted(routers)[0]
+    return {path: _remove_router(files[path], names) for path, names in routers.items() if path != keep}
+
+
+# -------------------
+# Missing default export
+# -------------------
+
+def _missing_default_export_module(error_text, files):
+    match = MISSING_EXPORT_PATTERN.search(error_text)
+    if match and match.group(2) == "default":
+        return find_project_path(match.group(1).split("?")[0], files)
+    match = NO_MATCHING_EXPORT_PATTERN.search(error_text)
+    if match and match.group(2) == "default":
+        return find_project_path(match.group(1), files)
+    return None
+
+
+def fix_missing_default_export(error_text, files):
+    file_path = _missing_default_export_module(error_text, files)
+    content = files.get(file_path) if file_path else None
+    if not isinstance(content, str) or re.search(r"export\s+default\b", content):
+        return None
+
+    declared = re.findall(r"(?:^|\n)\s*(?:export\s+)?(?:function|class|const|let)\s+([A-Z][\w$]*)", content)
+    basename = posixpath.splitext(posixpath.basename(file_path))[0]
+    if basename in declared:
+        name = basename
+    elif len(set(declared)) == 1:
+        name = declared[0]
+    else:
+        return None
+    return {file_path: content.rstrip() + f"\n\nexport default {name};\n"}
+
+
+# -------------------
+# Unknown lucide-react icons
+# -------------------
+
+def _unknown_lucide_icon(error_text):
+    match = MISSING_EXPORT_PATTERN.search(error_text)
+    if match and "lucide-react" in match.group(1):
+        return match.group(2)
+    match = NO_MATCHING_EXPORT_PATTERN.search(error_text)
+    if match and "lucide-react" in match.group(1):
+        return match.group(2)
+    return None
+
+
+def fix_unknown_lucide_icon(error_text, files):
+    icon = _unknown_lucide_icon(error_text)
+    if not icon or icon == "default":
+        return None
+    replacement = LUCIDE_ICON_ALIASES.get(icon, FALLBACK_LUCIDE_ICON)
+
+    def alias_icon(match):
+        items = []
+        for item in _import_items(match.group(1)):
+            parts = [part.strip() for part in item.split(" as ")]
+            if parts[0] == icon:
+                item = f"{replacement} as {parts[-1]}"
+            items.append(item)
+        return match.group(0).replace(match.group(1), " " + ", ".join(items) + " ")
+
+    fixed = {}
+    for file_path, content in files.items():
+        if not _is_jsx_file(file_path) or not isinstance(content, str):
+            continue
+        if any(_local_names(match.group(1), (icon,)) for match in LUCIDE_IMPORT_PATTERN.finditer(content)):
+            fixed[file_path] = LUCIDE_IMPORT_PATTERN.sub(alias_icon, content)
+    return fixed or None
+
+
+# -------------------
+# package.json problems
+# -------------------
+
+def fix_package_key(error_text, files):
+    if "package.json" in files:
+        return None
+    for typo in PACKAGE_KEY_TYPOS:
+        if typo in files:
+            return {typo: None, "package.json": files[typo]}
+    return None
+
+
+def _missing_package(error_text):
+    for pattern in (RESOLVE_IMPORT_PATTERN, MISSING_MODULE_PATTERN):
+        match = pattern.search(error_text)
+        if match and not match.group(1).startswith((".", "/", "@/", "~/")):
+            specifier = match.group(1)
+            return "/".join(specifier.split("/")[:2]) if specifier.startswith("@") else specifier.split("/")[0]
+    return None
+
+
+def fix_missing_dependency(error_text, files):
+    package_name = _missing_package(error_text)
+    package_json = files.get("package.json")
+    # Unknown packages are left to the resolver rather than added unpinned
+    if package_name not in KNOWN_PACKAGE_VERSIONS or package_json is None:
+        return None
+
+    try:
+        package = json.loads(package_json) if isinstance(package_json, str) else dict(package_json)
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return None
+    if package_name in package.get("dependencies", {}) or package_name in package.get("devDependencies", {}):
+        return None
+
+    package.setdefault("dependencies", {})[package_name] = KNOWN_PACKAGE_VERSIONS[package_name]
+    if isinstance(package_json, str):
+        return {"package.json": json.dumps(package, indent=2) + "\n"}
+    return {"package.json": package}
+
+
+# -------------------
+# Unbalanced JSX tags
+# -------------------
+
+def close_unbalanced_tags(content):
+    """Self-close opening tags cut off before a closing tag, and void elements"""
+    content = UNCLOSED_TAG_PATTERN.sub(lambda m: f"<{m.group(1)}{m.group(2)} />\n{m.group(3)}</", content)
+    return UNCLOSED_VOID_PATTERN.sub(lambda m: f"<{m.group(1)}{m.group(2).rstrip()} />", content)
+
+
+def fix_unbalanced_jsx(error_text, files):
+    # Only the files named in the error: rewriting an unrelated file would hide the real problem
+    located = [location["path"] for location in parse_error_message(error_text, files)["locations"]]
+    if not located:
+        return None
+
+    fixed = {}
+    for file_path in located:
+        content = files.get(file_path)
+        if not _is_jsx_file(file_path) or not isinstance(content, str):
+            continue
+        new_content = close_unbalanced_tags(content)
+        if new_content != content:
+            fixed[file_path] = new_content
+    return fixed or None
+
+
+# Most specific first: the first rule that produces a change wins
+AUTOFIX_RULES = (
+    AutofixRule(
+        "nested_router",
+        ("inside another <router>", "<router> inside", "router inside"),
+        fix_nested_router,
+        "Removed a nested router so the app has a single <BrowserRouter>.",
+    ),
+    AutofixRule(
+        "missing_default_export",
+        ("export named 'default'", 'export named "default"', 'for import "default"'),
+        fix_missing_default_export,
+        "Added the missing default export.",
+    ),
+    AutofixRule(
+        "unknown_lucide_icon",
+        ("lucide-react",),
+        fix_unknown_lucide_icon,
+        "Replaced an icon that lucide-react doesn't provide.",
+    ),
+    AutofixRule(
+        "package_key",
+        ("package.json", "npm", "enoent", "failed to resolve", "module not found", "cannot find module"),
+        fix_package_key,
+        "Renamed the misnamed package.json file.",
+    ),
+    AutofixRule(
+        "missing_dependency",
+        ("failed to resolve import", "cannot find module", "can't resolve", "could not resolve"),
+        fix_missing_dependency,
+        "Added the missing package to package.json.",
+    ),
+    AutofixRule(
+        "unbalanced_jsx",
+        ("unterminated jsx", "expected corresponding jsx closing tag", "jsx element", "adjacent jsx"),
+        fix_unbalanced_jsx,
+        "Closed an unterminated JSX tag.",
+    ),
+)
+
+
+def run_autofix_rules(error_text, files):
+    """Try each rule whose triggers appear in the error.
+
+    Returns ``{"rule", "description", "files"}`` for the first rule that
+    changes something (``files`` maps path -> new content, None = delete),
+    or None when no rule applies.
+    """
+    start = time.perf_counter()
+    error_text = error_text or ""
+    text = error_text.lower()
+    increment("autofix.runs")
+
+    result = None
+    for rule in AUTOFIX_RULES:
+        if not any(trigger in text for trigger in rule.triggers):
+            continue
+        increment(f"autofix.{rule.name}.triggered")
+        try:
+            changes = rule.fix(error_text, files)
+        except Exception as e:
+            print(f"⚠️ Autofix rule {rule.name} failed: {e}")
+            changes = None
+        if changes:
+            increment(f"autofix.{rule.name}.hits")
+            result = {"rule": rule.name, "description": rule.description, "files": changes}
+            break
+
+    increment("autofix.hits" if result else "autofix.misses")
+    observe("autofix.seconds", time.perf_counter() - start)
+    return result
+
+
+def autofix_stats():
+    """Per-rule trigger/hit counts and hit rates for the metrics endpoint"""
+    runs = get_counter("autofix.runs")
+    stats = {
+        "runs": runs,
+        "hits": get_counter("autofix.hits"),
+        "hit_rate": get_counter("autofix.hits") / runs if runs else 0.0,
+        "rules": {},
+    }
+    for rule in AUTOFIX_RULES:
+        triggered = get_counter(f"autofix.{rule.name}.triggered")
+        hits = get_counter(f"autofix.{rule.name}.hits")
+        stats["rules"][rule.name] = {
+            "triggered": triggered,
+            "hits": hits,
+            "hit_rate": hits / triggered if triggered else 0.0,
+        }
+    return stats
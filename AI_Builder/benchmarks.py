@@ -0,0 +1,327 @@
+"""
+Benchmarks module for AI Builder Version 2
+Run from the repository root: python -m AI_Builder.benchmarks <command> --help
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+
+from agents import ModelSettings, OpenAIChatCompletionsModel, Runner
+
+from .clients import get_anthropic_chat_client
+from .functions import token_manager, stream_file_updates_with_fallback
+from .models import (
+    modifier_agent, patch_modifier_agent, codegen_agent, error_resolver_agent, manager_agent, llm_model,
+    SLICE_MIN_FILE_CHARS, MANAGER_DECISION_LOG,
+)
+from .project_index import build_project_index
+from .slicing import slice_files
+from .credit_calculator import count_tokens
+from .task_classifier import NaiveBayesClassifier, classify, load_decisions, TASKS
+from .token_counter import TOKEN_CALIBRATION_FACTOR, REQUEST_OVERHEAD_TOKENS, MESSAGE_OVERHEAD_TOKENS, raw_token_count
+from . import prompts
+
+
+def load_project(project_path):
+    """Load a project JSON file (either the project itself or {"current_json": project})"""
+    with open(project_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict) and "current_json" in data:
+        data = data["current_json"]
+    return data
+
+
+# -------------------
+# Patch mode vs full-file mode
+# -------------------
+
+async def _run_modifier(agent, fallback_agent, files, query):
+    """Run one modifier pass and measure latency and output tokens"""
+    output_pieces = []
+    updated = {}
+
+    def make_input(batch):
+        return json.dumps({"files": batch, "query": query, "summary": ""})
+
+    start = time.perf_counter()
+    first_file_seconds = None
+    async for file_path, content in stream_file_updates_with_fallback(agent, fallback_agent, make_input, files, output_pieces):
+        if first_file_seconds is None:
+            first_file_seconds = time.perf_counter() - start
+        updated[file_path] = content
+    total_seconds = time.perf_counter() - start
+
+    return {
+        "seconds": round(total_seconds, 2),
+        "first_file_seconds": round(first_file_seconds, 2) if first_file_seconds is not None else None,
+        "output_tokens": token_manager.count_tokens("".join(output_pieces)),
+        "files_updated": len(updated),
+    }
+
+
+async def benchmark_patch_mode(project_path, query, file_paths):
+    project = load_project(project_path)
+    files = {path: project["files"][path] for path in file_paths}
+
+    print(f"📊 Benchmarking modifier on {len(files)} files for: {query}")
+    full = await _run_modifier(modifier_agent, None, files, query)
+    patch = await _run_modifier(patch_modifier_agent, modifier_agent, files, query)
+
+    print(f"{'mode':<8}{'seconds':>10}{'first file':>12}{'out tokens':>12}{'files':>7}")
+    for name, row in (("full", full), ("patch", patch)):
+        print(f"{name:<8}{row['seconds']:>10}{str(row['first_file_seconds']):>12}{row['output_tokens']:>12}{row['files_updated']:>7}")
+    if full["output_tokens"]:
+        print(f"💰 Output tokens saved: {100 * (1 - patch['output_tokens'] / full['output_tokens']):.1f}%")
+    return {"full": full, "patch": patch}
+
+
+# -------------------
+# Files finder input footprint
+# -------------------
+
+def benchmark_finder_index(project_paths):
+    """Compare finder input tokens: full project vs compact project index"""
+    print(f"{'project':<40}{'full tokens':>14}{'index tokens':>14}{'ratio':>8}")
+    for project_path in project_paths:
+        project = load_project(project_path)
+        full_tokens = token_manager.count_tokens(json.dumps({"project": project, "query": ""}))
+        index_tokens = token_manager.count_tokens(json.dumps({"project_index": build_project_index(project), "query": ""}))
+        ratio = full_tokens / index_tokens if index_tokens else 0
+        print(f"{project_path[-40:]:<40}{full_tokens:>14}{index_tokens:>14}{ratio:>7.1f}x")
+
+
+# -------------------
+# Relevance slicing footprint
+# -------------------
+
+def benchmark_slicing(project_path, query, file_paths, min_chars):
+    """Compare modifier input tokens with whole files vs relevant excerpts"""
+    project = load_project(project_path)
+    file_paths = file_paths or list(project["files"].keys())
+    print(f"{'file':<40}{'full tokens':>14}{'sliced tokens':>15}{'excerpts':>10}")
+    totals = [0, 0]
+    for file_path in file_paths:
+        content = project["files"][file_path]
+        agent_files, sliced = slice_files({file_path: content}, min_chars, query)
+        full_tokens = token_manager.count_tokens(json.dumps({file_path: content}))
+        sliced_tokens = token_manager.count_tokens(json.dumps(agent_files))
+        totals[0] += full_tokens
+        totals[1] += sliced_tokens
+        print(f"{file_path[-40:]:<40}{full_tokens:>14}{sliced_tokens:>15}{len(sliced.get(file_path, [])):>10}")
+    if totals[0]:
+        print(f"💰 Input tokens saved: {100 * (1 - totals[1] / totals[0]):.1f}%")
+
+
+# -------------------
+# Local token counter calibration
+# -------------------
+
+def _error_bounds(errors):
+    errors = sorted(abs(e) for e in errors)
+    if not errors:
+        return {"mean": 0.0, "p95": 0.0, "max": 0.0}
+    return {
+        "mean": sum(errors) / len(errors),
+        "p95": errors[min(len(errors) - 1, int(0.95 * len(errors)))],
+        "max": errors[-1],
+    }
+
+
+def calibrate_token_counter(project_paths, model, limit):
+    """Compare local cl100k counts with the count_tokens API over prompts and project files"""
+    samples = [value for name, value in vars(prompts).items() if name.endswith("_prompt") and isinstance(value, str)]
+    for project_path in project_paths:
+        project = load_project(project_path)
+        samples.extend(content if isinstance(content, str) else json.dumps(content) for content in project.get("files", {}).values())
+        samples.append(json.dumps(project, indent=2))
+    samples = [sample for sample in samples if sample.strip()][:limit]
+
+    fixed_overhead = REQUEST_OVERHEAD_TOKENS + MESSAGE_OVERHEAD_TOKENS
+    rows = []
+    for sample in samples:
+        messages = [{"role": "user", "content": [{"type": "text", "text": sample}]}]
+        api_tokens = count_tokens(model, "", messages)
+        rows.append((raw_token_count(sample), api_tokens - fixed_overhead))
+
+    total_raw = sum(raw for raw, _ in rows)
+    fitted = sum(api for _, api in rows) / total_raw if total_raw else TOKEN_CALIBRATION_FACTOR
+    print(f"📏 {len(rows)} samples, {total_raw} local tokens")
+    for label, factor in (("current", TOKEN_CALIBRATION_FACTOR), ("fitted", fitted)):
+        bounds = _error_bounds([(raw * factor - api) / api for raw, api in rows if api > 0])
+        print(f"{label:<8} factor={factor:.4f}  relative error mean={bounds['mean']:.2%} p95={bounds['p95']:.2%} max={bounds['max']:.2%}")
+    print(f"👉 Set TOKEN_CALIBRATION_FACTOR={fitted:.4f}")
+    return fitted
+
+
+# -------------------
+# Local task classifier vs manager agent
+# -------------------
+
+def evaluate_task_classifier(log_path, folds, thresholds):
+    """Cross-validated agreement of the local classifier with logged manager decisions"""
+    examples = load_decisions(log_path)
+    if len(examples) < folds:
+        print(f"❌ Only {len(examples)} logged decisions in {log_path}")
+        return None
+
+    predictions = []  # (logged task, predicted task, confidence, source)
+    start = time.perf_counter()
+    for fold in range(folds):
+        model = NaiveBayesClassifier().fit(example for index, example in enumerate(examples) if index % folds != fold)
+        for text, has_project, task in examples[fold::folds]:
+            predicted, confidence, source = classify(text, has_project, model)
+            predictions.append((task, predicted, confidence, source.split(":")[0]))
+    per_call_us = 1e6 * (time.perf_counter() - start) / len(predictions)
+
+    print(f"📊 {len(examples)} logged decisions, {folds}-fold cross-validation, {per_call_us:.0f}µs per decision")
+    print(f"{'threshold':>10}{'answered':>10}{'agreement':>11}{'rules':>8}{'model':>8}")
+    for threshold in thresholds:
+        answered = [row for row in predictions if row[1] is not None and row[2] >= threshold]
+        agreed = sum(1 for task, predicted, *_ in answered if task == predicted)
+        by_source = Counter(source for *_, source in answered)
+        agreement = agreed / len(answered) if answered else 0.0
+        print(f"{threshold:>10.2f}{len(answered) / len(predictions):>10.1%}{agreement:>11.1%}{by_source['rule']:>8}{by_source['model']:>8}")
+
+    print("Confusion at the lowest threshold (rows: manager, columns: local)")
+    answered = [row for row in predictions if row[1] is not None and row[2] >= min(thresholds)]
+    confusion = Counter((task, predicted) for task, predicted, *_ in answered)
+    print(f"{'':<20}" + "".join(f"{task.replace('code_', ''):>18}" for task in TASKS))
+    for task in TASKS:
+        print(f"{task:<20}" + "".join(f"{confusion[(task, predicted)]:>18}" for predicted in TASKS))
+    return predictions
+
+
+# -------------------
+# Prompt caching
+# -------------------
+
+CACHE_PROBE_AGENTS = {agent.name: agent for agent in (codegen_agent, modifier_agent, error_resolver_agent, manager_agent)}
+STAND_IN_MESSAGE = {
+    "id": "msg_stand_in",
+    "type": "message",
+    "role": "assistant",
+    "model": "stand-in",
+    "content": [{"type": "text", "text": "OK"}],
+    "stop_reason": "end_turn",
+    "usage": {"input_tokens": 1, "output_tokens": 1},
+}
+
+
+async def _start_stand_in_server(received):
+    """Local Messages API endpoint that records request bodies and returns a canned message"""
+    async def handle(reader, writer):
+        head = await reader.readuntil(b"\r\n\r\n")
+        length = next((int(line.split(b":", 1)[1]) for line in head.split(b"\r\n") if line.lower().startswith(b"content-length:")), 0)
+        received.append(json.loads(await reader.readexactly(length)))
+        body = json.dumps(STAND_IN_MESSAGE).encode()
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: close\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+        await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+def _cache_markers(body):
+    """Where a /v1/messages request body has cache breakpoints: "system" and "<index>:<role>" entries"""
+    markers = ["system"] if any("cache_control" in block for block in body.get("system", [])) else []
+    return markers + [
+        f"{index}:{message['role']}"
+        for index, message in enumerate(body["messages"])
+        if any("cache_control" in block for block in message["content"])
+    ]
+
+
+async def check_cache_markers(agent_names):
+    """Send each agent's request to a local stand-in server and report where cache markers were placed"""
+    received = []
+    server = await _start_stand_in_server(received)
+    port = server.sockets[0].getsockname()[1]
+    client = get_anthropic_chat_client("stand-in", f"http://127.0.0.1:{port}/v1/")
+    history = [
+        {"role": "user", "content": "Build a landing page for a coffee shop"},
+        {"role": "assistant", "content": "Here is the landing page. " * 400},
+    ]
+    print(f"{'agent':<20}{'system chars':>14}{'messages':>10}  markers")
+    try:
+        for name in agent_names:
+            agent = CACHE_PROBE_AGENTS[name].clone(model=OpenAIChatCompletionsModel(model=llm_model.model, openai_client=client))
+            await Runner.run(agent, history + [{"role": "user", "content": "Add a footer"}])
+            body = received[-1]
+            system_chars = len(agent.instructions) if isinstance(agent.instructions, str) else 0
+            print(f"{name:<20}{system_chars:>14}{len(body['messages']):>10}  {', '.join(_cache_markers(body)) or 'none'}")
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+async def measure_prompt_cache(agent_names, repeats):
+    """Call each agent repeatedly on the live provider and report its cache reads (cache_read_input_tokens)"""
+    print(f"{'agent':<20}{'call':>6}{'input':>10}{'cache read':>12}")
+    for name in agent_names:
+        agent = CACHE_PROBE_AGENTS[name].clone(model_settings=ModelSettings(max_tokens=16, include_usage=True))
+        cached = 0
+        for attempt in range(1, repeats + 1):
+            result = await Runner.run(agent, "Reply with OK only.")
+            usage = result.context_wrapper.usage
+            cached = getattr(usage.input_tokens_details, "cached_tokens", 0) or 0
+            print(f"{name:<20}{attempt:>6}{usage.input_tokens:>10}{cached:>12}")
+        if repeats > 1 and not cached:
+            print(f"⚠️ {name}: no cache reads on repeat calls (system prompt below PROMPT_CACHE_MIN_CHARS or the model's minimum?)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Builder benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    patch_cmd = commands.add_parser("patch-mode", help="Compare modifier output tokens/latency in full-file vs patch mode")
+    patch_cmd.add_argument("project", help="Path to a project JSON file")
+    patch_cmd.add_argument("query", help="Change request sent to the modifier")
+    patch_cmd.add_argument("--files", nargs="+", required=True, help="Project files given to the modifier")
+
+    index_cmd = commands.add_parser("finder-index", help="Compare finder input tokens for full project vs project index")
+    index_cmd.add_argument("projects", nargs="+", help="Paths to project JSON files")
+
+    slicing_cmd = commands.add_parser("slicing", help="Compare modifier input tokens for whole files vs relevant excerpts")
+    slicing_cmd.add_argument("project", help="Path to a project JSON file")
+    slicing_cmd.add_argument("query", help="Change request or error message used to pick excerpts")
+    slicing_cmd.add_argument("--files", nargs="+", help="Files to slice (default: all)")
+    slicing_cmd.add_argument("--min-chars", type=int, default=SLICE_MIN_FILE_CHARS, help="Only slice files at least this large")
+
+    calibrate_cmd = commands.add_parser("calibrate", help="Fit the local token counter against the count_tokens API and report error bounds")
+    calibrate_cmd.add_argument("projects", nargs="*", help="Project JSON files added to the sample corpus (system prompts are always included)")
+    calibrate_cmd.add_argument("--model", default="claude-sonnet-4-20250514")
+    calibrate_cmd.add_argument("--limit", type=int, default=200, help="Maximum number of samples sent to the API")
+
+    classifier_cmd = commands.add_parser("classifier-eval", help="Measure agreement of the local task classifier with logged manager decisions")
+    classifier_cmd.add_argument("--log", default=MANAGER_DECISION_LOG, help="Manager decision log (JSONL)")
+    classifier_cmd.add_argument("--folds", type=int, default=5)
+    classifier_cmd.add_argument("--thresholds", nargs="+", type=float, default=[0.8, 0.9, 0.95, 0.99], help="Confidence thresholds to report")
+
+    cache_cmd = commands.add_parser("prompt-cache", help="Check prompt-cache markers against a local stand-in server, or measure cache hits on the live provider")
+    cache_cmd.add_argument("--agents", nargs="+", default=list(CACHE_PROBE_AGENTS), choices=list(CACHE_PROBE_AGENTS))
+    cache_cmd.add_argument("--live", action="store_true", help="Call the real provider instead of the local stand-in")
+    cache_cmd.add_argument("--repeats", type=int, default=2, help="Calls per agent in --live mode")
+
+    args = parser.parse_args()
+    if args.command == "patch-mode":
+        asyncio.run(benchmark_patch_mode(args.project, args.query, args.files))
+    elif args.command == "finder-index":
+        benchmark_finder_index(args.projects)
+    elif args.command == "slicing":
+        benchmark_slicing(args.project, args.query, args.files, args.min_chars)
+    elif args.command == "calibrate":
+        calibrate_token_counter(args.projects, args.model, args.limit)
+    elif args.command == "classifier-eval":
+        evaluate_task_classifier(args.log, args.folds, args.thresholds)
+    elif args.command == "prompt-cache":
+        if args.live:
+            asyncio.run(measure_prompt_cache(args.agents, args.repeats))
+        else:
+            asyncio.run(check_cache_markers(args.agents))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Process-wide HTTP client registry for AI Builder Version 2
+Keep-alive connection pools (HTTP/2 when available) shared by every outbound call
+"""
+
+import importlib.util
+import os
+import time
+
+import anthropic
+import httpx
+from dotenv import load_dotenv, find_dotenv
+from openai import AsyncOpenAI
+
+from .anthropic_messages import ANTHROPIC_BASE_URL, AnthropicChatClient
+from .metrics import increment, observe
+
+_ = load_dotenv(find_dotenv())
+
+# Connection limits per provider pool
+PROVIDER_MAX_CONNECTIONS = int(os.getenv("PROVIDER_MAX_CONNECTIONS", "100"))
+PROVIDER_MAX_KEEPALIVE = int(os.getenv("PROVIDER_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("KEEPALIVE_EXPIRY_SECONDS", "120"))
+# Long read timeout: code generation streams for minutes
+PROVIDER_TIMEOUT = httpx.Timeout(connect=10.0, read=600.0, write=30.0, pool=30.0)
+NOTIFICATION_TIMEOUT = httpx.Timeout(5.0)
+
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]")
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_limits = httpx.Limits(
+    max_connections=PROVIDER_MAX_CONNECTIONS,
+    max_keepalive_connections=PROVIDER_MAX_KEEPALIVE,
+    keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+)
+
+_http_clients = {}
+_openai_clients = {}
+_anthropic_chat_clients = {}
+_anthropic_clients = {}
+_warm_up_urls = {}
+
+
+class _MeteredTransport(httpx.AsyncHTTPTransport):
+    """Async transport that counts requests and time-to-headers per pool"""
+
+    def __init__(self, pool_name, **kwargs):
+        super().__init__(**kwargs)
+        self.pool_name = pool_name
+
+    async def handle_async_request(self, request):
+        start = time.perf_counter()
+        increment(f"clients.{self.pool_name}.requests")
+        try:
+            return await super().handle_async_request(request)
+        except Exception:
+            increment(f"clients.{self.pool_name}.errors")
+            raise
+        finally:
+            observe(f"clients.{self.pool_name}.time_to_headers", time.perf_counter() - start)
+
+
+def get_http_client(pool_name, base_url=None):
+    """Shared keep-alive AsyncClient for one upstream; ``base_url`` is used for warm-up"""
+    client = _http_clients.get(pool_name)
+    if client is None:
+        transport = _MeteredTransport(pool_name, http2=HTTP2_AVAILABLE, limits=_limits, retries=1)
+        client = httpx.AsyncClient(transport=transport, timeout=PROVIDER_TIMEOUT)
+        _http_clients[pool_name] = client
+    if base_url:
+        _warm_up_urls[pool_name] = base_url
+    return client
+
+
+def get_openai_client(pool_name, api_key, base_url):
+    """Shared AsyncOpenAI client (OpenAI-compatible provider endpoint) on a pooled connection"""
+    key = (pool_name, api_key, base_url)
+    client = _openai_clients.get(key)
+    if client is None:
+        client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=get_http_client(pool_name, base_url))
+        _openai_clients[key] = client
+    return client
+
+
+def get_anthropic_chat_client(api_key, base_url=ANTHROPIC_BASE_URL):
+    """Shared native Messages API client, usable as the openai_client of OpenAIChatCompletionsModel"""
+    key = (api_key, base_url)
+    client = _anthropic_chat_clients.get(key)
+    if client is None:
+        client = AnthropicChatClient(api_key, get_http_client("anthropic", base_url), base_url)
+        _anthropic_chat_clients[key] = client
+    return client
+
+
+def get_anthropic_client(api_key):
+    """Shared synchronous Anthropic client (count_tokens, billing fallbacks)"""
+    client = _anthropic_clients.get(api_key)
+    if client is None:
+        client = anthropic.Anthropic(
+            api_key=api_key,
+            http_client=httpx.Client(http2=HTTP2_AVAILABLE, limits=_limits, timeout=PROVIDER_TIMEOUT),
+        )
+        _anthropic_clients[api_key] = client
+    return client
+
+
+def get_notification_client():
+    """Shared AsyncClient for calls to our own backend (e.g. credit notifications)"""
+    client = _http_clients.get("notifications")
+    if client is None:
+        client = httpx.AsyncClient(http2=HTTP2_AVAILABLE, limits=_limits, timeout=NOTIFICATION_TIMEOUT)
+        _http_clients["notifications"] = client
+    return client
+
+
+async def warm_up_clients():
+    """Open a connection (DNS + TCP + TLS) to every registered provider before the first request"""
+    for pool_name, base_url in _warm_up_urls.items():
+        start = time.perf_counter()
+        try:
+            # Any response, even 401/404, leaves a warm keep-alive connection in the pool
+            await _http_clients[pool_name].head(base_url, timeout=5.0)
+            print(f"🔥 Warmed up {pool_name} connection in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            print(f"⚠️ Warm-up failed for {pool_name}: {e}")
+
+
+async def close_clients():
+    for client in _http_clients.values():
+        await client.aclose()
+    for client in _anthropic_clients.values():
+        client.close()
+
+
+def _pool_connections(client):
+    transport = getattr(client, "_transport", None)
+    pool = getattr(transport, "_pool", None)
+    return list(getattr(pool, "connections", []) or [])
+
+
+def client_pool_stats():
+    """Open/idle/HTTP2 connection counts per pool (reads httpcore pool state)"""
+    stats = {"http2_available": HTTP2_AVAILABLE, "pools": {}}
+    for pool_name, client in _http_clients.items():
+        connections = _pool_connections(client)
+        stats["pools"][pool_name] = {
+            "connections": len(connections),
+            "idle": sum(1 for connection in connections if connection.is_idle()),
+            "http2": sum(1 for connection in connections if "HTTP/2" in repr(connection)),
+            "max_connections": PROVIDER_MAX_CONNECTIONS,
+        }
+    return stats
@@ -0,0 +1,106 @@
+"""
+Adaptive pipeline depth for AI Builder Version 2
+Scores a new-project request locally and decides which optional stages (planner, summary) to run
+"""
+
+import html
+import re
+
+from .metrics import increment, observe, get_timing_avg
+from .models import PIPELINE_GATE_ENABLED, PIPELINE_SIMPLE_MAX_SCORE
+
+# Score: one point per 25 words, per distinct feature keyword, half a point per extra listed item
+WORDS_UNIT = 25
+LIST_ITEM_WEIGHT = 0.5
+# Features that imply several pages, shared state or a backend-like flow
+FEATURE_KEYWORDS = (
+    "admin", "analytics", "api", "auth", "authentication", "booking", "cart", "chat", "checkout",
+    "crm", "dashboard", "database", "e-commerce", "ecommerce", "login", "marketplace", "multi-page",
+    "multiple pages", "pages", "payment", "profile", "register", "routing", "search", "signup",
+    "sign up", "subscription", "upload",
+)
+KEYWORD_PATTERN = re.compile(r"\b(" + "|".join(re.escape(keyword) for keyword in FEATURE_KEYWORDS) + r")\b", re.IGNORECASE)
+LIST_SEPARATOR_PATTERN = re.compile(r",|;|\n|\band\b|\bplus\b", re.IGNORECASE)
+# The local summary template is English; other languages still go to the summary agent
+ENGLISH_MARKERS = {"the", "with", "for", "and", "make", "create", "build", "that", "simple", "website", "please", "want", "need"}
+
+# Stage durations assumed before the first real sample, for the saved-latency estimate
+DEFAULT_STAGE_SECONDS = {"planner": 10.0, "summary": 5.0}
+
+LEADING_REQUEST_PATTERN = re.compile(
+    r"^\s*(please\s+)?(can you\s+|could you\s+|i want\s+|i need\s+)?(to\s+)?"
+    r"(create|build|make|generate|design|develop|code)?\s*(me\s+)?(a|an|the)?\s+",
+    re.IGNORECASE,
+)
+SUBJECT_SPLIT_PATTERN = re.compile(r"\s+(with|that has|which has|including)\s+", re.IGNORECASE)
+FEATURE_SPLIT_PATTERN = re.compile(r",|;|\band\b|\bplus\b", re.IGNORECASE)
+
+
+def score_new_project(user_input):
+    """Complexity score of a new-project request and the feature keywords found"""
+    text = user_input or ""
+    keywords = sorted({match.lower() for match in KEYWORD_PATTERN.findall(text)})
+    list_items = len(LIST_SEPARATOR_PATTERN.findall(text))
+    score = len(text.split()) / WORDS_UNIT + len(keywords) + LIST_ITEM_WEIGHT * max(0, list_items - 1)
+    return round(score, 2), keywords
+
+
+def looks_english(user_input):
+    words = set(re.findall(r"[a-z]+", (user_input or "").lower()))
+    return user_input.isascii() and bool(words & ENGLISH_MARKERS)
+
+
+def assess_new_project(user_input):
+    """Which optional stages a new project needs: {"plan", "summary", "score", "keywords"}"""
+    score, keywords = score_new_project(user_input)
+    simple = PIPELINE_GATE_ENABLED and score <= PIPELINE_SIMPLE_MAX_SCORE
+    decision = {
+        "plan": not simple,
+        "summary": not (simple and looks_english(user_input)),
+        "score": score,
+        "keywords": keywords,
+    }
+    print(f"🚦 Pipeline gate: score {score}, planner {'on' if decision['plan'] else 'off'}, summary {'on' if decision['summary'] else 'off'}")
+    return decision
+
+
+def _title_and_features(user_input):
+    request = LEADING_REQUEST_PATTERN.sub("", (user_input or "").strip().rstrip(".!"), count=1)
+    subject, _, feature_text = (SUBJECT_SPLIT_PATTERN.split(request, maxsplit=1) + ["", ""])[:3]
+    title = " ".join(subject.split()[:8]).title() or "New Project"
+    features = [item.strip() for item in FEATURE_SPLIT_PATTERN.split(feature_text) if item.strip()]
+    return title, [feature[0].upper() + feature[1:] for feature in features]
+
+
+def local_project_summary(user_input):
+    """Project summary HTML in the summary agent's format, built from the request alone"""
+    title, features = _title_and_features(user_input)
+    if not features:
+        features = [f"A focused {title.lower()} experience on a single page"]
+    features.append("Responsive layout that works on mobile and desktop")
+    feature_items = "\n".join(f"    <li>{html.escape(feature)}</li>" for feature in features)
+    return f"""<article>
+  <h2>{html.escape(title)}</h2>
+  <h3>Design Direction</h3>
+  <ul>
+    <li>Clean, modern layout that keeps the main action front and center</li>
+    <li>Clear typography, generous spacing and a calm color palette</li>
+    <li>Subtle hover and transition effects for a polished feel</li>
+  </ul>
+  <h3>Features</h3>
+  <ul>
+{feature_items}
+  </ul>
+  <h3>Design Inspiration</h3>
+  <p>Minimal, focused tools that do one thing well, with a friendly and uncluttered interface.</p>
+</article>"""
+
+
+def record_stage(stage, seconds):
+    observe(f"pipeline.{stage}", seconds)
+
+
+def record_skipped_stage(stage, reason="skipped"):
+    """Count a skipped (or merged) stage and the latency it saved (its average duration when it does run)"""
+    increment(f"pipeline.{stage}_{reason}")
+    observe("pipeline.saved", get_timing_avg(f"pipeline.{stage}", DEFAULT_STAGE_SECONDS[stage]))
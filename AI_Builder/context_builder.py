@@ -0,0 +1,146 @@
+"""
+Token-budgeted conversation context for chat-history agents
+Keeps the last turns verbatim and folds older turns into a rolling summary
+"""
+
+import re
+
+from .functions import token_manager
+from .simple_database import get_conversation_messages
+from .state_store import get_json, set_json
+
+# Input token budget per agent (history + summary + new user message)
+AGENT_CONTEXT_BUDGETS = {
+    "Manager": 1500,
+    "FirstTurnRouter": 1500,
+    "ProjectPlanner": 4000,
+    "ProjectPlannerWithSummary": 4000,
+    "CodeConversation": 6000,
+}
+DEFAULT_CONTEXT_BUDGET = 3000
+
+# Turns (user message + assistant reply) kept verbatim
+RECENT_TURNS = 3
+# Rolling summary size limits
+MAX_SUMMARY_LINES = 40
+SUMMARY_SNIPPET_CHARS = 160
+SUMMARY_TTL_SECONDS = 30 * 24 * 3600
+
+CODE_BLOCK_PATTERN = re.compile(r"```.*?(?:```|$)", re.DOTALL)
+HTML_TAG_PATTERN = re.compile(r"<[^>]+>")
+
+
+def strip_code(text):
+    """Drop code blocks and HTML markup from an assistant message"""
+    text = CODE_BLOCK_PATTERN.sub(" [code omitted] ", text or "")
+    text = HTML_TAG_PATTERN.sub(" ", text)
+    return " ".join(text.split())
+
+
+def _shorten(text, limit):
+    return text if len(text) <= limit else text[:limit].rsplit(" ", 1)[0] + "…"
+
+
+def split_turns(chat_history):
+    """Group messages into [user message, assistant reply...] turns"""
+    turns = []
+    for message in chat_history or []:
+        if message.get("role") == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def summarize_turn(turn):
+    """One summary line for a turn: what the user asked and what was answered"""
+    parts = []
+    for message in turn:
+        text = strip_code(message.get("content", "")) if message.get("role") == "assistant" else " ".join(str(message.get("content", "")).split())
+        if text:
+            label = "User" if message.get("role") == "user" else "Assistant"
+            parts.append(f"{label}: {_shorten(text, SUMMARY_SNIPPET_CHARS)}")
+    return "- " + " | ".join(parts) if parts else ""
+
+
+async def load_rolling_summary(conversation_id, older_turns):
+    """Summary lines covering ``older_turns``, updated incrementally and persisted.
+
+    Only turns that aged out since the last call are summarized; if the
+    stored state doesn't match the history (e.g. after deletions) it is rebuilt.
+    """
+    key = f"context_summary:{conversation_id}"
+    state = await get_json(key) or {}
+    covered = state.get("turns", 0)
+    lines = state.get("lines", [])
+    if covered > len(older_turns) or state.get("last_user") != _turn_marker(older_turns, covered):
+        covered, lines = 0, []
+
+    if covered < len(older_turns):
+        lines.extend(line for line in (summarize_turn(turn) for turn in older_turns[covered:]) if line)
+        lines = lines[-MAX_SUMMARY_LINES:]
+        covered = len(older_turns)
+        await set_json(key, {"turns": covered, "lines": lines, "last_user": _turn_marker(older_turns, covered)}, ttl=SUMMARY_TTL_SECONDS)
+    return lines
+
+
+def _turn_marker(turns, count):
+    """Short fingerprint of the last summarized turn, to detect a changed history"""
+    if not count or count > len(turns):
+        return ""
+    return str(turns[count - 1][0].get("content", ""))[:80]
+
+
+def _messages_tokens(messages):
+    return sum(token_manager.count_tokens(message.get("content", "")) + 4 for message in messages)
+
+
+def _summary_message(lines):
+    return {"role": "user", "content": "Summary of the earlier conversation:\n" + "\n".join(lines)}
+
+
+async def build_conversation_input(conversation_id, user_input, agent_name, chat_history=None):
+    """Conversation input for ``agent_name`` that fits its token budget.
+
+    Last RECENT_TURNS turns are verbatim (older assistant replies without
+    code), earlier turns come from the rolling summary. If still over budget,
+    the oldest verbatim turns are folded into the summary, then the summary
+    is trimmed from the oldest line.
+    """
+    if chat_history is None:
+        chat_history = get_conversation_messages(conversation_id)
+    user_message = {"role": "user", "content": user_input}
+    turns = split_turns(chat_history)
+    if not turns:
+        return [user_message]
+
+    budget = AGENT_CONTEXT_BUDGETS.get(agent_name, DEFAULT_CONTEXT_BUDGET)
+    older, recent = turns[:-RECENT_TURNS], turns[-RECENT_TURNS:]
+    summary_lines = await load_rolling_summary(conversation_id, older) if older else []
+
+    # Only the latest reply keeps its code; earlier replies are stripped
+    recent = [
+        [
+            {**message, "content": strip_code(message.get("content", ""))}
+            if message.get("role") == "assistant" and index < len(recent) - 1 else message
+            for message in turn
+        ]
+        for index, turn in enumerate(recent)
+    ]
+
+    def assemble():
+        messages = [_summary_message(summary_lines)] if summary_lines else []
+        return messages + [message for turn in recent for message in turn] + [user_message]
+
+    messages = assemble()
+    while _messages_tokens(messages) > budget and len(recent) > 1:
+        summary_lines = (summary_lines + [summarize_turn(recent.pop(0))])[-MAX_SUMMARY_LINES:]
+        messages = assemble()
+    while _messages_tokens(messages) > budget and summary_lines:
+        summary_lines = summary_lines[1:]
+        messages = assemble()
+    if _messages_tokens(messages) > budget and recent:
+        # A single huge reply: keep its tail, which holds the latest state
+        allowance = max(budget - _messages_tokens([user_message]), 200) * 4
+        recent = [[{**message, "content": "…" + message["content"][-allowance:]} if len(message.get("content", "")) > allowance else message for message in recent[-1]]]
+        messages = assemble()
+    return messages
@@ -2,14 +2,18 @@ import os
 import math
 from typing import List, Dict, Any, Optional
 
-import anthropic
+from .clients import get_anthropic_client
+from .token_counter import TOKEN_COUNT_MODE, count_messages_locally, content_text
+
+# Share of a cache-read input token that is billed (1.0 = same as uncached input)
+CACHED_TOKEN_BILLING_WEIGHT = float(os.getenv("CACHED_TOKEN_BILLING_WEIGHT", "1.0"))
 
 
 def count_tokens(model: str, system: str, messages: List[Dict[str, Any]], api_key: Optional[str] = None) -> int:
     key = api_key or os.getenv("CLAUDE_API_KEY") or os.getenv("ANTHROPIC_API_KEY")
     if not key:
         raise RuntimeError("Missing Anthropic API key")
-    client = anthropic.Anthropic(api_key=key)
+    client = get_anthropic_client(key)
     result = client.messages.count_tokens(
         model=model,
         system=system,
@@ -23,16 +27,28 @@ def count_tokens(model: str, system: str, messages: List[Dict[str, Any]], api_ke
     return 0
 
 
-def credits_for_messages(
+def count_billing_tokens(
     model: str,
     system: str,
     messages: List[Dict[str, Any]],
     api_key: Optional[str] = None,
-    tokens_per_credit: int = 350,
-    rounding: str = "ceil",
-) -> float:
-    tokens = count_tokens(model, system, messages, api_key=api_key)
-    print("[DB] Tokens:", tokens)
+    exact: bool = False,
+) -> int:
+    """Local calibrated count by default; the count_tokens API when exact or the local tokenizer is unavailable."""
+    if not exact and TOKEN_COUNT_MODE != "api":
+        try:
+            return count_messages_locally(system, messages)
+        except RuntimeError:
+            pass
+    try:
+        return count_tokens(model, system, messages, api_key=api_key)
+    except Exception as e:
+        print(f"⚠️ count_tokens API failed, using a character estimate: {e}")
+        characters = len(system or "") + sum(len(text) for message in messages for text in content_text(message.get("content")))
+        return max(1, characters // 4)
+
+
+def credits_for_tokens(tokens: float, tokens_per_credit: int = 350, rounding: str = "ceil") -> float:
     if tokens_per_credit <= 0:
         tokens_per_credit = 350
     value = tokens / tokens_per_credit
@@ -44,3 +60,25 @@ def credits_for_messages(
     if rounding == "round":
         return float(round(value, 4))
     return value
+
+
+def credits_for_messages(
+    model: str,
+    system: str,
+    messages: List[Dict[str, Any]],
+    api_key: Optional[str] = None,
+    tokens_per_credit: int = 350,
+    rounding: str = "ceil",
+    exact: bool = False,
+) -> float:
+    tokens = count_billing_tokens(model, system, messages, api_key=api_key, exact=exact)
+    print("[DB] Tokens:", tokens)
+    return credits_for_tokens(tokens, tokens_per_credit, rounding)
+
+
+def credits_for_usage(usage, tokens_per_credit: int = 350, rounding: str = "ceil") -> float:
+    """Credits from a request's provider-reported UsageRecord (all agents, input + output)."""
+    uncached_input = usage.input_tokens - usage.cached_tokens
+    tokens = uncached_input + usage.cached_tokens * CACHED_TOKEN_BILLING_WEIGHT + usage.output_tokens
+    print("[DB] Tokens:", tokens, usage.summary())
+    return credits_for_tokens(tokens, tokens_per_credit, rounding)
@@ -0,0 +1,102 @@
+"""
+Local parser for pasted Vite / Babel / browser error messages
+Extracts failing files, line numbers and the error class without an LLM call
+"""
+
+import re
+
+from .import_graph import find_project_path
+
+# Any source-looking path, optionally followed by ?query and :line:column
+PATH_PATTERN = re.compile(
+    r"((?:[A-Za-z]:)?[\w./@~-]*?[\w@~-]+\.(?:json|jsx|js|tsx|ts|mjs|css|html)\b)"
+    r"(?:\?[^\s:)'\"]*)?"
+    r"(?::(\d+)(?::(\d+))?)?"
+)
+# Babel style "file.jsx: Unexpected token (12:5)"
+BABEL_LOCATION_PATTERN = re.compile(r"\.(?:jsx|js|tsx|ts):\s[^\n]*?\((\d+):(\d+)\)")
+# Failed to resolve import "./x" from "src/App.jsx"
+RESOLVE_IMPORT_PATTERN = re.compile(r"""Failed to resolve import\s+["']([^"']+)["']\s+from\s+["']([^"']+)["']""", re.IGNORECASE)
+# The requested module '/src/x.jsx' does not provide an export named 'Foo'
+MISSING_EXPORT_PATTERN = re.compile(r"""requested module\s+["']([^"']+)["']\s+does not provide an export named\s+["']([^"']+)["']""", re.IGNORECASE)
+ERROR_CLASS_PATTERN = re.compile(r"\b((?:Syntax|Type|Reference|Range)Error|Error)\b")
+
+# Ordered (keywords, error_type) rules matching the finder agent's error types
+ERROR_TYPE_RULES = (
+    (("inside another <router>", "<router> inside", "router inside", "usenavigate() may be used only", "useroutes() may be used only"), "router_error"),
+    (("invalid hook call", "rendered more hooks", "rendered fewer hooks", "hooks can only be called"), "hook_error"),
+    (("failed to resolve import", "does not provide an export", "module not found", "cannot find module", "is not exported", "import-analysis"), "import_error"),
+    (("unexpected token", "syntaxerror", "transform failed", "unterminated", "adjacent jsx elements", "expected corresponding jsx closing tag", "react-babel", "internal server error"), "build_error"),
+    (("tailwind", "postcss", "css"), "styling_error"),
+    (("cannot read properties of undefined", "cannot read properties of null", "too many re-renders", "maximum update depth"), "state_error"),
+)
+
+IGNORED_PATH_PARTS = ("node_modules/", "/.vite/", "/@vite/", "/@react-refresh", "chunk-")
+
+
+def classify_error(error_text):
+    """Map an error message to one of the finder agent's error types"""
+    text = error_text.lower()
+    for keywords, error_type in ERROR_TYPE_RULES:
+        if any(keyword in text for keyword in keywords):
+            return error_type
+    return "runtime_error"
+
+
+def _add_location(locations, project_path, line=None, column=None):
+    for location in locations:
+        if location["path"] == project_path:
+            if location["line"] is None and line is not None:
+                location["line"], location["column"] = line, column
+            return
+    locations.append({"path": project_path, "line": line, "column": column})
+
+
+def parse_error_message(error_text, project_files):
+    """Extract project file locations and error class from an error message.
+
+    Returns a dict with ``locations`` ([{path, line, column}], most relevant
+    first), ``primary_error_file``, ``error_type``, ``error_class`` and
+    ``confident`` (True when at least one project file was identified).
+    """
+    error_text = error_text or ""
+    locations = []
+
+    # Format-specific anchors first: they name the file to fix, not just any file
+    match = RESOLVE_IMPORT_PATTERN.search(error_text)
+    if match:
+        importer = find_project_path(match.group(2), project_files)
+        if importer:
+            _add_location(locations, importer)
+
+    match = MISSING_EXPORT_PATTERN.search(error_text)
+    if match:
+        exporter = find_project_path(match.group(1).split("?")[0], project_files)
+        if exporter:
+            _add_location(locations, exporter)
+
+    for match in PATH_PATTERN.finditer(error_text):
+        raw_path = match.group(1)
+        if any(part in raw_path for part in IGNORED_PATH_PARTS):
+            continue
+        # Strip a URL origin (http://localhost:5173/src/App.jsx)
+        raw_path = re.sub(r"^[a-z]+://[^/]+/", "", raw_path)
+        project_path = find_project_path(raw_path, project_files)
+        if not project_path:
+            continue
+        line = int(match.group(2)) if match.group(2) else None
+        column = int(match.group(3)) if match.group(3) else None
+        if line is None:
+            babel = BABEL_LOCATION_PATTERN.match(error_text, match.start(1) + match.group(1).rfind("."))
+            if babel:
+                line, column = int(babel.group(1)), int(babel.group(2))
+        _add_location(locations, project_path, line, column)
+
+    class_match = ERROR_CLASS_PATTERN.search(error_text)
+    return {
+        "locations": locations,
+        "primary_error_file": locations[0]["path"] if locations else "",
+        "error_type": classify_error(error_text),
+        "error_class": class_match.group(1) if class_match else "",
+        "confident": bool(locations),
+    }
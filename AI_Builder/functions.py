@@ -5,18 +5,41 @@ Contains all utility functions and core functionality
 
 import json
 import asyncio
+import time
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from agents import Runner
 from .models import (
     TokenManager, ProjectContext,
     manager_agent, codegen_agent,
     error_files_finder_agent, error_resolver_agent,
-    modifier_files_finder_agent, modifier_agent
+    modifier_files_finder_agent, modifier_agent,
+    patch_modifier_agent, patch_error_resolver_agent, EDIT_OUTPUT_MODE,
+    MODIFIER_MAX_PARALLEL_GROUPS, MODIFIER_FANOUT_MIN_FILES, SLICE_MIN_FILE_CHARS,
+    RETRIEVAL_SKIP_FINDER, HEDGE_ENABLED, HEDGE_FIRST_TOKEN_SECONDS, hedge_agents
 )
+from .import_graph import partition_by_imports, cached_import_graph, dependency_chain as build_dependency_chain, find_project_path
+from .error_parser import parse_error_message
+from .autofix import run_autofix_rules, close_unbalanced_tags
+from .patches import resolve_file_output
+from .project_index import build_project_index
+from .stream_parser import ProjectStreamParser
+from .slicing import slice_files, splice_slices, split_slice_key
+from .retrieval import retrieve_files, narrow_project_index
+from .metrics import increment, observe
+from .usage import usage_from_stream_event, record_usage
+from .rate_limiter import reserve
+from .admission import admit
+from .routing import route_edit, validate_edit_output, record_route_latency, record_escalation
 import os
-import anthropic
+from .clients import get_anthropic_client
 
 import traceback
+# Ranked retrieval candidates shown to the files finder agent
+RETRIEVAL_CANDIDATES = 10
+# Smoothed first-token time of primaries that missed their hedge threshold, per agent
+_slow_primary_first_token = {}
+
 # Global instances
 token_manager = TokenManager()
 project_context = ProjectContext()
@@ -51,6 +74,37 @@ def extract_text_from_event(event):
     return ""
 
 
+def capture_stream_usage(agent, event, reservation=None):
+    """Record provider usage from a response.completed event; True if the event carried usage"""
+    usage = usage_from_stream_event(event)
+    if usage is None:
+        return False
+    record_usage(agent.name, usage)
+    if reservation is not None:
+        reservation.add_usage(usage)
+    return True
+
+
+def record_run_usage(agent, stream_result, reservation=None):
+    """Fallback when no response.completed event was seen: use the run's aggregated usage"""
+    context_wrapper = getattr(stream_result, "context_wrapper", None)
+    usage = getattr(context_wrapper, "usage", None)
+    record_usage(agent.name, usage)
+    if reservation is not None and usage is not None and (usage.input_tokens or usage.output_tokens):
+        reservation.add_usage(usage)
+
+
+@asynccontextmanager
+async def agent_capacity(agent, input_data, output_tokens=None):
+    """Provider slot plus rate-limit reservation for one agent run; settles usage on exit"""
+    async with admit(agent):
+        reservation = await reserve(agent, input_data, output_tokens)
+        try:
+            yield reservation
+        finally:
+            await reservation.settle()
+
+
 def extract_text_from_result_object(result_obj):
     """Extract text from result objects"""
     try:
@@ -194,7 +248,7 @@ def count_input_tokens_anthropic(text: str) -> int:
         api_key = os.getenv("CLAUDE_API_KEY")
         if not api_key:
             return 0
-        client = anthropic.Anthropic(api_key=api_key)
+        client = get_anthropic_client(api_key)
         messages = [
             {
                 "role": "user",
@@ -251,6 +305,20 @@ def create_structure_only(project_data):
 
 
 
+def build_project_manifest(full_project, updated_files, removed_files=()):
+    """Lightweight final SSE payload listing what changed instead of the whole project"""
+    files = full_project.get("files", {}) if isinstance(full_project, dict) else {}
+    manifest = {
+        'type': 'project_manifest',
+        'project_name': full_project.get("project_name", "") if isinstance(full_project, dict) else "",
+        'updated_files': list(updated_files),
+        'file_count': len(files),
+    }
+    if removed_files:
+        manifest['removed_files'] = list(removed_files)
+    return manifest
+
+
 # -------------------
 # COST-OPTIMIZED Error Resolution Function
 # -------------------
@@ -382,24 +450,31 @@ async def handle_error_resolution(user_input, code):
 async def stream_codegen_async(agent, user_input):
     print("🚀 Generating code (streaming async)...")
     print("-" * 60)
-    try:
-        stream_result = Runner.run_streamed(agent, input=user_input)
-        full_output = ""
-
-        if hasattr(stream_result, "stream_events"):
-            async for event in stream_result.stream_events():
-                text_piece = extract_text_from_event(event)
-                if text_piece:
-                    full_output += text_piece
-
-        print("\n" + "-" * 60)
-        print("✅ Code generation completed!")
-        return full_output
+    async with agent_capacity(agent, user_input) as reservation:
+        try:
+            stream_result = Runner.run_streamed(agent, input=user_input)
+            full_output = ""
+            usage_seen = False
+
+            if hasattr(stream_result, "stream_events"):
+                async for event in stream_result.stream_events():
+                    if capture_stream_usage(agent, event, reservation):
+                        usage_seen = True
+                        continue
+                    text_piece = extract_text_from_event(event)
+                    if text_piece:
+                        full_output += text_piece
+            if not usage_seen:
+                record_run_usage(agent, stream_result, reservation)
+
+            print("\n" + "-" * 60)
+            print("✅ Code generation completed!")
+            return full_output
 
-    except Exception as e:
-        print(f"\n❌ Streaming error: {type(e).__name__}: {str(e)}")
-        # Re-raise the exception so it can be caught by the calling function
-        raise e
+        except Exception as e:
+            print(f"\n❌ Streaming error: {type(e).__name__}: {str(e)}")
+            # Re-raise the exception so it can be caught by the calling function
+            raise e
 
 # dummy json for testing purposes
 # async def stream_codegen_chunks(agent, user_input):
@@ -427,47 +502,68 @@ async def stream_codegen_chunks(agent, user_input):
     """
     print("🚀 Generating code (chunk streaming)...")
     print("-" * 60)
-    stream_result = Runner.run_streamed(agent, input=user_input)
-    # Case 1: async stream events (agent live streaming)
-    if hasattr(stream_result, "stream_events"):
-        async for event in stream_result.stream_events():
-            text_piece = extract_text_from_event(event)
-            print(text_piece)
-            if text_piece:
-                yield text_piece
-        return
+    async with agent_capacity(agent, user_input) as reservation:
+        stream_result = Runner.run_streamed(agent, input=user_input)
+        # Case 1: async stream events (agent live streaming)
+        if hasattr(stream_result, "stream_events"):
+            usage_seen = False
+            async for event in stream_result.stream_events():
+                if capture_stream_usage(agent, event, reservation):
+                    usage_seen = True
+                    continue
+                text_piece = extract_text_from_event(event)
+                print(text_piece)
+                if text_piece:
+                    yield text_piece
+            if not usage_seen:
+                record_run_usage(agent, stream_result, reservation)
     
+class ResultWrapper:
+    def __init__(self, raw, text):
+        self.raw = raw
+        self.final_output = text
+
+
 async def  run_agent_with_token_limit(agent, input_data):
     print(f"🚀 Running {agent.name} agent...")
     print("-" * 60)
-    print("-----------------------324234234324------------------")
-    try:
-        stream_result = Runner.run_streamed(agent, input=input_data)
+    if agent.name in hedge_agents and HEDGE_ENABLED:
         full_output = ""
-        if hasattr(stream_result, "stream_events"):
-            async for event in stream_result.stream_events():
-                text_piece = extract_text_from_event(event)
-                if text_piece:
-                    # Only remove markdown code fences, not the word "json" from actual content
-                    if text_piece.strip() in ["```json", "```", "json"]:
-                        continue  # Skip these markers entirely
-                    print(text_piece)
-                    full_output += text_piece
-
-        print("\n" + "-" * 60)
-
-        class ResultWrapper:
-            def __init__(self, raw, text):
-                self.raw = raw
-                self.final_output = text
+        async for text_piece in hedged_agent_stream(agent, input_data):
+            # Only remove markdown code fences, not the word "json" from actual content
+            if text_piece.strip() not in ["```json", "```", "json"]:
+                full_output += text_piece
+        return ResultWrapper(None, full_output)
+    print("-----------------------324234234324------------------")
+    async with agent_capacity(agent, input_data) as reservation:
+        try:
+            stream_result = Runner.run_streamed(agent, input=input_data)
+            full_output = ""
+            usage_seen = False
+            if hasattr(stream_result, "stream_events"):
+                async for event in stream_result.stream_events():
+                    if capture_stream_usage(agent, event, reservation):
+                        usage_seen = True
+                        continue
+                    text_piece = extract_text_from_event(event)
+                    if text_piece:
+                        # Only remove markdown code fences, not the word "json" from actual content
+                        if text_piece.strip() in ["```json", "```", "json"]:
+                            continue  # Skip these markers entirely
+                        print(text_piece)
+                        full_output += text_piece
+            if not usage_seen:
+                record_run_usage(agent, stream_result, reservation)
+
+            print("\n" + "-" * 60)
         
-        result = ResultWrapper(stream_result, full_output)
+            result = ResultWrapper(stream_result, full_output)
         
-        return result
-    except Exception as e:
-        print(f"\n❌ Streaming error: {type(e).__name__}: {str(e)}")
-        # Re-raise the exception so it can be caught by the calling function
-        raise e
+            return result
+        except Exception as e:
+            print(f"\n❌ Streaming error: {type(e).__name__}: {str(e)}")
+            # Re-raise the exception so it can be caught by the calling function
+            raise e
 
 # async def run_agent_with_token_limit(agent, input_data):
 #     """Run agent with token management"""
@@ -544,22 +640,41 @@ async def  run_agent_with_token_limit(agent, input_data):
 #         # Re-raise the exception so it can be caught by the calling function
 #         raise e
 
-async def code_update(user_input, full_project):
+async def code_update(user_input, full_project, conversation_id=None):
     """Code update with AI content tracking for token counting"""
     
     print(f"🔍 Starting code update for: {user_input[:100]}...")
     
     try:
-        change_input = json.dumps({"project": full_project, "query": user_input})
-        change_result = await run_agent_with_token_limit(modifier_files_finder_agent, change_input)
-        
-        raw_text = change_result.final_output if hasattr(change_result, 'final_output') else str(change_result)
-        try:
-            files_info = extract_json_from_text(raw_text)
-        except json.JSONDecodeError as e:
-            print(f"❌ Failed to parse JSON from modifier output: {e}")
-            yield {'type': 'error', 'chunk': f"❌ Failed to parse files info: {e}\n"}, None, ""
-            return
+        # Local retrieval first: a confident match replaces the finder agent entirely
+        retrieval = retrieve_files(conversation_id, full_project["files"], user_input)
+        if retrieval["confident"] and RETRIEVAL_SKIP_FINDER:
+            increment("retrieval.finder_skipped")
+            files_info = {
+                "files_to_modify": retrieval["files_to_modify"],
+                "new_files_to_create": [],
+                "related_files_to_update": retrieval["related_files_to_update"],
+                "summary": "",
+            }
+            print(f"⚡ Files picked by local retrieval, skipping finder agent: {retrieval['files_to_modify']}")
+        else:
+            increment("retrieval.finder_called")
+            # File bodies are not needed to pick filenames - send the compact index, narrowed for large projects
+            project_index = narrow_project_index(build_project_index(full_project), retrieval["ranked"])
+            change_input = json.dumps({
+                "project_index": project_index,
+                "retrieval_candidates": retrieval["ranked"][:RETRIEVAL_CANDIDATES],
+                "query": user_input,
+            })
+            change_result = await run_agent_with_token_limit(modifier_files_finder_agent, change_input)
+            
+            raw_text = change_result.final_output if hasattr(change_result, 'final_output') else str(change_result)
+            try:
+                files_info = extract_json_from_text(raw_text)
+            except json.JSONDecodeError as e:
+                print(f"❌ Failed to parse JSON from modifier output: {e}")
+                yield {'type': 'error', 'chunk': f"❌ Failed to parse files info: {e}\n"}, None, ""
+                return
 
         files_to_modify = files_info.get("files_to_modify", [])
         new_files_to_create = files_info.get("new_files_to_create", [])
@@ -581,47 +696,73 @@ async def code_update(user_input, full_project):
             else:
                 yield {'type': 'warning', 'chunk': f"⚠️ Related file not found in project: {fname}\n"}, None, ""
 
-        modifier_input = json.dumps({
-            "files": target_files,
-            "query": user_input,
-            "summary": files_info.get("summary", "")
-        })
-
-        print("🔄 Calling modifier agent...")
-        modifier_result = await run_agent_with_token_limit(modifier_agent, modifier_input)
-        updated_files_output_json = modifier_result.final_output  # ✅ AI-generated content for token counting
-
-        print('updated_files_output_json    =====   ',type(updated_files_output_json))
-
-        print("3333333333333333333333333333333333333333333333333333333333333333333333333333333333333333333")
+        summary = files_info.get("summary", "")
+
+        # Split large requests into import-independent groups run concurrently
+        groups = plan_modifier_groups(target_files, full_project["files"])
+        if len(groups) > 1:
+            print(f"🔀 Fanning out modifier across {len(groups)} file groups: {groups}")
+
+        def make_group_input(index):
+            contract = build_group_contract(groups, index, new_files_to_create) if len(groups) > 1 else None
+
+            def make_modifier_input(files):
+                payload = {
+                    "files": files,
+                    "query": user_input,
+                    "summary": summary
+                }
+                if contract:
+                    payload["parallel_contract"] = contract
+                return json.dumps(payload)
+            return make_modifier_input
+
+        use_patches = EDIT_OUTPUT_MODE == "patch"
+        agent = patch_modifier_agent if use_patches else modifier_agent
+        fallback_agent = modifier_agent if use_patches else None
+        route_name = agent.name
+        agent, fallback_agent, escalation_agent, route = route_edit(agent, fallback_agent, target_files, user_input)
+        validate = validate_edit_output if route == "fast" else None
+        print(f"🔄 Calling modifier agent ({'patch' if use_patches else 'full-file'} mode)...")
+
+        output_pieces = []
+        group_updates = [{} for _ in groups]
+        unresolved = []
+        failed_groups = []
+        emitted = set()
+        started = time.monotonic()
         try:
-            print('**** Modifier output:', updated_files_output_json[:200] + "..." if len(updated_files_output_json) > 200 else updated_files_output_json)
-            print("===============================================================================================================")
-            
-            try:
-                updated_files = extract_json_from_text(updated_files_output_json)
-                print("akash",updated_files)
-            except:
-                updated_files = updated_files_output_json
-
-                print('*************************************************************')
-                print(type(updated_files))
-                print('*************************************************************')
-        
-        except Exception as e:
+            async for index, file_path, fixed_content in stream_file_updates_parallel(agent, fallback_agent, make_group_input, groups, target_files, output_pieces, {"query": user_input}, escalation_agent, validate, unresolved, failed_groups):
+                group_updates[index][file_path] = fixed_content
+                if file_path in groups[index]:
+                    emitted.add(file_path)
+                    yield {'type': 'file_complete', 'path': file_path, 'content': fixed_content}, None, ""
+        except ValueError as e:
             print(f"❌ Failed to parse JSON from modifier output: {e}")
             yield {'type': 'error', 'chunk': f"❌ Failed to parse modifier output: {e}\n"}, None, ""
             return
-            
-        print("444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444444")
-        
+        finally:
+            record_route_latency(route_name, route, time.monotonic() - started)
+
+        updated_files = merge_group_updates(groups, group_updates)
         for file_path, fixed_content in updated_files.items():
             full_project["files"][file_path] = fixed_content
-        
-        print(f"🔍 code_update returning full_project type: {type(full_project)}")
-
-        # ✅ SINGLE FINAL YIELD with all three values
-        yield {'type': 'json_chunk', 'chunk': full_project}, full_project, updated_files_output_json
+            # Files outside every group, or owned by a group that didn't return them, weren't streamed yet
+            if file_path not in emitted:
+                yield {'type': 'file_complete', 'path': file_path, 'content': fixed_content}, None, ""
+        for file_path in dict.fromkeys(unresolved):
+            if file_path not in updated_files:
+                yield {'type': 'warning', 'chunk': f"⚠️ Could not apply the changes to {file_path}, it was left unchanged\n"}, None, ""
+        for index in failed_groups:
+            missing = [file_path for file_path in groups[index] if file_path not in updated_files]
+            if missing:
+                yield {'type': 'warning', 'chunk': f"⚠️ Part of the update failed, these files were left unchanged: {', '.join(missing)}\n"}, None, ""
+
+        updated_files_output_json = "".join(output_pieces)  # ✅ AI-generated content for token counting
+        print(f"✅ Modifier updated files: {list(updated_files.keys())}")
+
+        # ✅ SINGLE FINAL YIELD - manifest for the client, full project for storage
+        yield build_project_manifest(full_project, updated_files), full_project, updated_files_output_json
         
     except Exception as e:
         print(f"❌ Error in code_update: {type(e)} - {e}")
@@ -631,54 +772,383 @@ async def code_update(user_input, full_project):
 
 
 
-async def run_agent_with_token_limit_streaming(agent, input_data, estimated_response_tokens=1000):
-    """Run agent with proper streaming token management"""
-    # input_tokens = token_manager.count_tokens(input_data)
-    # token_manager.check_and_wait(estimated_response_tokens)
+async def run_agent_with_token_limit_streaming(agent, input_data, estimated_response_tokens=None):
+    """Run agent with proper streaming token management (hedged for latency-sensitive agents)"""
+    if agent.name in hedge_agents and HEDGE_ENABLED:
+        stream = hedged_agent_stream(agent, input_data, estimated_response_tokens)
+    else:
+        stream = stream_agent_run(agent, input_data, estimated_response_tokens)
+    async for text_piece in stream:
+        yield text_piece
+
+
+async def hedged_agent_stream(agent, input_data, estimated_response_tokens=None):
+    """Stream ``agent``'s output, racing its alternate-provider copy if the first token is late.
+
+    The primary starts alone; if it has produced nothing after its
+    HEDGE_FIRST_TOKEN_SECONDS threshold the alternate is started too. The
+    first run to produce a token wins and the other is cancelled. A run that
+    fails before its first token leaves the race to the other one.
+    """
+    threshold = HEDGE_FIRST_TOKEN_SECONDS.get(agent.name, 3.0)
+    runs = {"primary": stream_agent_run(agent, input_data, estimated_response_tokens)}
+    pending = {asyncio.ensure_future(runs["primary"].__anext__()): "primary"}
+    start = time.monotonic()
+    increment(f"hedge.{agent.name}.calls")
+    winner, first_piece, errors = None, None, {}
+    try:
+        while winner is None and (pending or "alternate" not in runs):
+            timeout = None if "alternate" in runs else max(0.0, threshold - (time.monotonic() - start))
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED) if pending else (set(), set())
+            if not done:
+                print(f"⏱️ {agent.name} gave no first token within {threshold:.1f}s, hedging with the alternate provider")
+                increment(f"hedge.{agent.name}.fired")
+                runs["alternate"] = stream_agent_run(hedge_agents[agent.name], input_data, estimated_response_tokens)
+                pending[asyncio.ensure_future(runs["alternate"].__anext__())] = "alternate"
+                continue
+            for task in done:
+                name = pending.pop(task)
+                try:
+                    first_piece = task.result()
+                except StopAsyncIteration:
+                    first_piece = None
+                except Exception as e:
+                    errors[name] = e
+                    continue
+                winner = name
+                break
+        if winner is None:
+            raise errors.get("primary") or errors.get("alternate") or RuntimeError("hedged run produced no result")
+    finally:
+        # Cancel the losing run; closing its generator releases its provider slot and reservation
+        for task in pending:
+            task.cancel()
+        for task in pending:
+            try:
+                await task
+            except BaseException:
+                pass
+        for name, run in runs.items():
+            if name != winner:
+                await run.aclose()
+
+    first_token_seconds = time.monotonic() - start
+    observe(f"hedge.{agent.name}.{winner}_first_token", first_token_seconds)
+    if winner == "alternate":
+        increment(f"hedge.{agent.name}.alternate_won")
+        # The primary was still silent when cancelled: estimate its first token from slow primaries seen before
+        expected = max(first_token_seconds, _slow_primary_first_token.get(agent.name, first_token_seconds))
+        observe(f"hedge.{agent.name}.latency_saved", expected - first_token_seconds)
+    elif first_token_seconds > threshold:
+        previous = _slow_primary_first_token.get(agent.name, first_token_seconds)
+        _slow_primary_first_token[agent.name] = previous + 0.2 * (first_token_seconds - previous)
+
+    try:
+        if first_piece is None:
+            return
+        yield first_piece
+        async for text_piece in runs[winner]:
+            yield text_piece
+    finally:
+        await runs[winner].aclose()
+
 
+async def stream_agent_run(agent, input_data, estimated_response_tokens=None):
+    """Run agent with proper streaming token management"""
     print(f"🚀 Running {agent.name} agent...")
     print("-" * 60)
     print("🚀 Generating code (streaming with token management)...")
     
-    try:
+    async with agent_capacity(agent, input_data, estimated_response_tokens) as reservation:
+        try:
         
-        stream_result = Runner.run_streamed(agent, input=input_data) 
-        # accumulated_tokens = 0
-        # token_check_interval = 50  # Check tokens every ~50 tokens
-        # total_tokens = stream_result.raw_responses[0].usage.total_tokens
-        # print("-------------------✅ Agent Total Tokens Used: ", total_tokens, "-------------------")
-        if hasattr(stream_result, "stream_events"):
-            async for event in stream_result.stream_events():
-                text_piece = extract_text_from_event(event)
-                if text_piece:
-                    print(text_piece, end="", flush=True)
+            stream_result = Runner.run_streamed(agent, input=input_data) 
+            usage_seen = False
+            if hasattr(stream_result, "stream_events"):
+                async for event in stream_result.stream_events():
+                    if capture_stream_usage(agent, event, reservation):
+                        usage_seen = True
+                        continue
+                    text_piece = extract_text_from_event(event)
+                    if text_piece:
+                        print(text_piece, end="", flush=True)
                     
-                    # Yield the actual chunk for real streaming
-                    yield text_piece
-                    
-                    # # Track tokens for management
-                    # accumulated_tokens += token_manager.count_tokens(text_piece)
-                    
-                    # # Periodically check token usage
-                    # if accumulated_tokens >= token_check_interval:
-                    #     token_manager.add_tokens(accumulated_tokens)
-                    #     accumulated_tokens = 0
-                    #     # Re-check if we need to wait
-                    #     token_manager.check_and_wait(estimated_response_tokens - accumulated_tokens)
-
-        print("\n" + "-" * 60)
-        
-        # # Add any remaining tokens
-        # if accumulated_tokens > 0:
-        #     token_manager.add_tokens(accumulated_tokens)
+                        # Yield the actual chunk for real streaming
+                        yield text_piece
+            if not usage_seen:
+                record_run_usage(agent, stream_result, reservation)
 
-    except Exception as e:
-        print(f"\n❌ Streaming error: {type(e).__name__}: {str(e)}")
-        raise e
+            print("\n" + "-" * 60)
+
+        except Exception as e:
+            print(f"\n❌ Streaming error: {type(e).__name__}: {str(e)}")
+            raise e
+
+
+async def stream_file_updates(agent, input_data, originals, output_pieces, failed_files):
+    """Stream an agent's {path: content | {"edits": [...]}} output file by file.
+
+    Yields (path, content) as soon as each value closes. Edit blocks are applied
+    against ``originals``; paths whose patch cannot be applied are appended to
+    ``failed_files``. Raw text pieces go to ``output_pieces`` for billing.
+    Raises ValueError when nothing parseable came back.
+    """
+    parser = ProjectStreamParser(files_key=None)
+    async for piece in run_agent_with_token_limit_streaming(agent, input_data):
+        output_pieces.append(piece)
+        for file_path, value in parser.feed(piece):
+            content = resolve_file_output(file_path, value, originals)
+            if content is None:
+                failed_files.append(file_path)
+            else:
+                yield file_path, content
+
+    if parser.complete:
+        return
+
+    # Recover whatever the tolerant extractor can still find
+    try:
+        recovered = extract_json_from_text("".join(output_pieces))
+    except ValueError:
+        if not parser.files:
+            raise
+        return
+    for file_path, value in recovered.items():
+        if file_path in parser.files:
+            continue
+        content = resolve_file_output(file_path, value, originals)
+        if content is None:
+            failed_files.append(file_path)
+        else:
+            yield file_path, content
+
+
+async def stream_file_updates_with_fallback(agent, fallback_agent, make_input, originals, output_pieces, slice_hints=None, escalation_agent=None, validate=None, unresolved=None):
+    """Run ``agent`` over ``originals`` and retry failed patches in full-file mode.
+
+    ``make_input`` builds the agent input from a {path: content} dict, so the
+    fallback call only carries the files whose edit blocks did not apply.
+    With ``slice_hints`` ({"query", "locations"}) large files are sent as
+    relevant excerpts and yielded once their returned excerpts are spliced back;
+    a sliced file whose output can't be spliced is retried whole (with
+    ``agent`` when there is no fallback). Files rejected by
+    ``validate(key, content)`` are retried like failed patches; if nothing
+    parseable comes back and ``escalation_agent`` is set, the whole request
+    is run again with it. Paths left unchanged by a failure are appended to
+    ``unresolved``.
+    """
+    agent_files, sliced = originals, {}
+    if slice_hints is not None:
+        agent_files, sliced = slice_files(originals, SLICE_MIN_FILE_CHARS, slice_hints.get("query", ""), slice_hints.get("locations"))
+        if sliced:
+            print(f"✂️ Sending excerpts instead of full files: {sliced}")
+
+    excerpt_updates = {}
+    # Sliced files whose output named a range we never sent; they are retried as whole files
+    whole_file_retries = set()
+    # Sliced files returned whole; the agent only saw excerpts, so that output isn't used
+    ignored_whole_files = set()
+
+    def route(key, content):
+        """Return (path, content) to yield now, or None while excerpts are buffered"""
+        file_path, line_range = split_slice_key(key)
+        if line_range is not None and file_path in sliced:
+            if file_path in whole_file_retries:
+                return None
+            if key not in sliced[file_path]:
+                # An invented range can overlap the real excerpts and corrupt the splice
+                print(f"⚠️ {key} is not an excerpt that was sent, retrying {file_path} as a whole file")
+                excerpt_updates.pop(file_path, None)
+                whole_file_retries.add(file_path)
+                failed_files.append(file_path)
+                return None
+            excerpt_updates.setdefault(file_path, {})[key] = content
+            return None
+        if key in sliced and key not in whole_file_retries:
+            print(f"⚠️ Ignoring whole-file output for sliced file: {key}")
+            ignored_whole_files.add(key)
+            return None
+        return key, content
+
+    failed_files = []
+    try:
+        async for key, content in stream_file_updates(agent, make_input(agent_files), agent_files, output_pieces, failed_files):
+            if validate is not None and not validate(key, content):
+                print(f"⚠️ {agent.name} output for {key} failed validation")
+                failed_files.append(key)
+                continue
+            routed = route(key, content)
+            if routed:
+                yield routed
+    except ValueError as e:
+        if escalation_agent is None:
+            raise
+        print(f"⤴️ {agent.name} output could not be parsed ({e}), escalating to {escalation_agent.name}")
+        record_escalation(agent, "parse")
+        failed_files = []
+        async for key, content in stream_file_updates(escalation_agent, make_input(agent_files), agent_files, output_pieces, failed_files):
+            routed = route(key, content)
+            if routed:
+                yield routed
+
+    for file_path in sorted(ignored_whole_files - whole_file_retries - set(excerpt_updates)):
+        whole_file_retries.add(file_path)
+        failed_files.append(file_path)
+
+    retry_files = {
+        key: originals[key] if key in whole_file_retries else agent_files[key]
+        for key in dict.fromkeys(failed_files)
+        if key in whole_file_retries or (key in agent_files and split_slice_key(key)[0] not in whole_file_retries)
+    }
+    retry_agent = fallback_agent
+    if retry_agent is None:
+        # Full-file mode: only sliced files need a retry, as whole files with the same agent
+        retry_agent = agent
+        retry_files = {key: content for key, content in retry_files.items() if key in whole_file_retries}
+    retried = set()
+    if retry_files:
+        print(f"↩️ Edit failed, retrying with {retry_agent.name}: {list(retry_files.keys())}")
+        if escalation_agent is not None:
+            record_escalation(agent, "retry")
+        try:
+            async for key, content in stream_file_updates(retry_agent, make_input(retry_files), {**agent_files, **retry_files}, output_pieces, []):
+                routed = route(key, content)
+                if routed:
+                    retried.add(routed[0])
+                    yield routed
+        except ValueError as e:
+            print(f"❌ Full-file fallback failed: {e}")
+
+    for file_path, updates in excerpt_updates.items():
+        yield file_path, splice_slices(originals[file_path], updates)
+
+    if unresolved is not None:
+        for file_path in dict.fromkeys(split_slice_key(key)[0] for key in failed_files):
+            if file_path not in retried and file_path not in excerpt_updates:
+                unresolved.append(file_path)
+
+
+def plan_modifier_groups(target_files, project_files):
+    """Partition modifier targets into groups that can be edited concurrently"""
+    if len(target_files) < MODIFIER_FANOUT_MIN_FILES:
+        return [list(target_files.keys())]
+    return partition_by_imports(list(target_files.keys()), project_files, MODIFIER_MAX_PARALLEL_GROUPS)
+
+
+def build_group_contract(groups, index, new_files):
+    """Shared contract telling one modifier call what the parallel calls own"""
+    others = [path for i, group in enumerate(groups) if i != index for path in group]
+    return {
+        "your_files": groups[index],
+        "files_handled_in_parallel": others,
+        "new_file_default_exports": {
+            path: default_export_name(path) for path in new_files
+        },
+        "rules": (
+            "Only return files listed in your_files. Other listed files are being "
+            "updated at the same time by another developer: import them by their exact "
+            "path and the default export name given here, and do not re-implement them."
+        ),
+    }
+
+
+def default_export_name(file_path):
+    """PascalCase component name derived from a file path (src/pages/user-list.jsx -> UserList)"""
+    stem = file_path.rsplit("/", 1)[-1].split(".", 1)[0]
+    words = [w for w in stem.replace("-", " ").replace("_", " ").split() if w]
+    return "".join(w[:1].upper() + w[1:] for w in words) or stem
 
 
-async def handle_error_resolution_streaming(user_input, code, conversation_id):
-    """Streaming error resolution workflow - returns COMPLETE project JSON"""
+def merge_group_updates(groups, group_updates):
+    """Deterministically merge per-group outputs.
+
+    A group's output for its own files always wins; files a group returned
+    outside its assignment are taken from the lowest-index group only.
+    """
+    merged = {}
+    for group, updates in zip(groups, group_updates):
+        for path in sorted(updates):
+            if path in group:
+                merged[path] = updates[path]
+    for updates in group_updates:
+        for path in sorted(updates):
+            if path not in merged:
+                merged[path] = updates[path]
+    return merged
+
+
+async def stream_file_updates_parallel(agent, fallback_agent, make_input_for, groups, originals, output_pieces, slice_hints=None, escalation_agent=None, validate=None, unresolved=None, failed_groups=None):
+    """Run one agent call per file group concurrently, yielding (group_index, path, content).
+
+    ``make_input_for(index)`` returns the input builder for that group. Raw
+    output is appended to ``output_pieces`` in group order once all calls end.
+    A failing group doesn't stop the others; ValueError is raised only when no
+    group produced any file. Paths left unchanged by a failure go to ``unresolved``
+    and the indexes of failed groups to ``failed_groups``.
+    """
+    queue = asyncio.Queue()
+    group_pieces = [[] for _ in groups]
+
+    async def run_group(index, group):
+        files = {path: originals.get(path, "") for path in group}
+        try:
+            async for file_path, content in stream_file_updates_with_fallback(agent, fallback_agent, make_input_for(index), files, group_pieces[index], slice_hints, escalation_agent, validate, unresolved):
+                await queue.put(("file", index, file_path, content))
+        except Exception as e:
+            await queue.put(("error", index, e, None))
+        finally:
+            await queue.put(("done", index, None, None))
+
+    tasks = [asyncio.create_task(run_group(i, group)) for i, group in enumerate(groups)]
+    pending = len(tasks)
+    produced = 0
+    errors = []
+    try:
+        while pending:
+            kind, index, first, second = await queue.get()
+            if kind == "file":
+                produced += 1
+                yield index, first, second
+            elif kind == "error":
+                print(f"❌ Modifier group {index} failed: {first}")
+                errors.append(first)
+                if failed_groups is not None:
+                    failed_groups.append(index)
+            else:
+                pending -= 1
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+    for pieces in group_pieces:
+        output_pieces.extend(pieces)
+    if errors and not produced:
+        raise errors[0]
+
+
+async def stream_autofix_resolution(full_project, autofix):
+    """Apply a deterministic auto-fix and stream it like a resolver result"""
+    updated_files, removed_files = [], []
+    for file_path, content in autofix["files"].items():
+        if content is None:
+            full_project["files"].pop(file_path, None)
+            removed_files.append(file_path)
+            continue
+        full_project["files"][file_path] = content
+        updated_files.append(file_path)
+        yield {'type': 'file_complete', 'path': file_path, 'content': content}, None, ""
+
+    print(f"🛠️ Auto-fix '{autofix['rule']}' applied to {updated_files + removed_files}")
+    yield build_project_manifest(full_project, updated_files, removed_files), full_project, ""
+
+
+async def handle_error_resolution_streaming(user_input, code, conversation_id, try_autofix=True):
+    """Streaming error resolution workflow - streams fixed files, then a project manifest
+
+    Deterministic auto-fix rules run first; pass ``try_autofix=False`` when
+    the caller already ran them.
+    """
     
     # Step 1: Parse project structure
     try:
@@ -695,57 +1165,74 @@ async def handle_error_resolution_streaming(user_input, code, conversation_id):
     except (json.JSONDecodeError, TypeError) as e:
         yield {'type': 'error', 'chunk': f"❌ Error parsing project: {e}\n"}, None, ""
         return
+
+    if try_autofix:
+        autofix = run_autofix_rules(error_description, full_project.get("files", {}))
+        if autofix:
+            async for event in stream_autofix_resolution(full_project, autofix):
+                yield event
+            return
     
-    finder_input = {
-        "error_description": error_description,
-        "project_structure": project_structure
-    }
-    
-    try:
-        finder_result = await run_agent_with_token_limit(
-            error_files_finder_agent,
-            json.dumps(finder_input)
+    primary_error_file = ""
+    affected_files = []
+    error_type = "unknown"
+    root_cause_analysis = "No analysis"
+    fix_priority = []
+
+    # Fast path: most pasted errors already name the failing file and line
+    parsed_error = parse_error_message(error_description, full_project.get("files", {}))
+    if parsed_error["confident"]:
+        primary_error_file = parsed_error["primary_error_file"]
+        affected_files = [location["path"] for location in parsed_error["locations"]]
+        error_type = parsed_error["error_type"]
+        root_cause_analysis = f"{parsed_error['error_class'] or 'Error'} reported at " + ", ".join(
+            f"{location['path']}:{location['line']}" if location["line"] else location["path"]
+            for location in parsed_error["locations"]
         )
-    except Exception as e:
-        yield {'type': 'error', 'chunk': f"❌ Error in finder agent: {e}\n"}, None, ""
-        return
-    
-    try:
-        finder_output_text = clean_ai_output(finder_result.final_output)
-        finder_output = json.loads(finder_output_text)
-        # affected_files = finder_output.get("affected_files", [])
-        # error_type = finder_output.get("error_type", "unknown")
-        # analysis = finder_output.get("analysis", "No analysis provided")
-        # Support both old and new format
-        primary_error_file = finder_output.get("primary_error_file", "")
-        affected_files = finder_output.get("affected_files", [])
-        fix_priority = finder_output.get("fix_priority", affected_files)
-        dependency_chain = finder_output.get("dependency_chain", {})
-        error_type = finder_output.get("error_type", "unknown")
-        root_cause_analysis = finder_output.get("root_cause_analysis", finder_output.get("analysis", "No analysis"))
+        print(f"⚡ Error location parsed locally, skipping finder agent: {affected_files}")
+    else:
+        finder_input = {
+            "error_description": error_description,
+            "project_structure": project_structure
+        }
 
-        # Ensure primary file is in affected files
-        if primary_error_file and primary_error_file not in affected_files:
-            affected_files.insert(0, primary_error_file)
+        try:
+            finder_result = await run_agent_with_token_limit(
+                error_files_finder_agent,
+                json.dumps(finder_input)
+            )
+        except Exception as e:
+            yield {'type': 'error', 'chunk': f"❌ Error in finder agent: {e}\n"}, None, ""
+            return
 
-        # Add config files from dependency chain
-        config_files = dependency_chain.get("config_files", [])
-        for config_file in config_files:
-            if config_file not in affected_files:
-                affected_files.append(config_file)
+        try:
+            finder_output_text = clean_ai_output(finder_result.final_output)
+            finder_output = json.loads(finder_output_text)
+            primary_error_file = finder_output.get("primary_error_file", "")
+            affected_files = finder_output.get("affected_files", [])
+            error_type = finder_output.get("error_type", "unknown")
+            root_cause_analysis = finder_output.get("root_cause_analysis", finder_output.get("analysis", "No analysis"))
+            fix_priority = finder_output.get("fix_priority", [])
+        except json.JSONDecodeError as e:
+            yield {'type': 'error', 'chunk': f"❌ Error parsing finder result: {e}\n"}, None, ""
+            print("exectips = ",e )
+            print(f"Raw finder output: {finder_result.final_output}")
 
-        # Add upstream dependencies (imported_by)
-        imported_by = dependency_chain.get("imported_by", [])
-        for upstream_file in imported_by:
-            if upstream_file not in affected_files:
-                affected_files.append(upstream_file)
+    primary_error_file = find_project_path(primary_error_file, full_project["files"]) or "src/main.jsx"  # fallback
+
+    # Dependency chain comes from the local import graph, not the LLM
+    graph = cached_import_graph(conversation_id, full_project["files"])
+    dependency_chain = build_dependency_chain(graph, primary_error_file, error_description, full_project["files"])
+
+    # Ensure primary file is in affected files, then add config files and upstream importers
+    if primary_error_file not in affected_files:
+        affected_files.insert(0, primary_error_file)
+    for related_file in dependency_chain["config_files"] + dependency_chain["imported_by"]:
+        if related_file not in affected_files:
+            affected_files.append(related_file)
+    if not fix_priority:
+        fix_priority = list(affected_files)
 
-    except json.JSONDecodeError as e:
-        yield {'type': 'error', 'chunk': f"❌ Error parsing finder result: {e}\n"}, None, ""
-        print("exectips = ",e )
-        print(f"Raw finder output: {finder_result.final_output}")
-        affected_files = ["src/main.jsx"]  # fallback
-    
     affected_files_content = {}
     for file_name in affected_files:
         if file_name in full_project["files"]:
@@ -764,56 +1251,73 @@ async def handle_error_resolution_streaming(user_input, code, conversation_id):
         "error_type": error_type,
         "root_cause_analysis": root_cause_analysis,
         "primary_error_file": primary_error_file,
+        "error_locations": parsed_error["locations"],
+        "dependency_chain": dependency_chain,
         "fix_priority": fix_priority,
         "affected_files": affected_files_content,
     }
         
+    def make_resolver_input(files):
+        return json.dumps({**resolver_input, "affected_files": files})
+
+    use_patches = EDIT_OUTPUT_MODE == "patch"
+    agent = patch_error_resolver_agent if use_patches else error_resolver_agent
+    fallback_agent = error_resolver_agent if use_patches else None
+    route_name = agent.name
+    agent, fallback_agent, escalation_agent, route = route_edit(agent, fallback_agent, affected_files_content, error_description, error_type)
+    validate = validate_edit_output if route == "fast" else None
+
+    output_pieces = []
+    fixed_files = {}
+    unresolved = []
+    parse_error = None
+    started = time.monotonic()
     try:
-        resolver_result = await run_agent_with_token_limit(
-            error_resolver_agent,
-            json.dumps(resolver_input)
-        )
+        async for file_path, fixed_content in stream_file_updates_with_fallback(agent, fallback_agent, make_resolver_input, affected_files_content, output_pieces, {"query": error_description, "locations": parsed_error["locations"]}, escalation_agent, validate, unresolved):
+            fixed_files[file_path] = fixed_content
+            if file_path in full_project["files"]:
+                full_project["files"][file_path] = fixed_content
+                yield {'type': 'file_complete', 'path': file_path, 'content': fixed_content}, None, ""
+            else:
+                yield {'type': 'warning', 'chunk': f"⚠️ File path not in project: {file_path}\n"}, None, ""
+        for file_path in dict.fromkeys(unresolved):
+            if file_path not in fixed_files:
+                yield {'type': 'warning', 'chunk': f"⚠️ Could not apply the fix to {file_path}, it was left unchanged\n"}, None, ""
+    except ValueError as e:
+        parse_error = e
     except Exception as e:
         yield {'type': 'error', 'chunk': f"❌ Resolver agent failed: {e}\n"}, None, ""
         return
-    
+    finally:
+        record_route_latency(route_name, route, time.monotonic() - started)
+
+    resolver_output_text = "".join(output_pieces)
+
     try:
-        try:
-            resolver_output_text_cleaned = clean_ai_output(resolver_result.final_output)
-        except Exception as e:
-            resolver_output_text_cleaned = resolver_result.final_output.replace("```json", "").replace("```", "").strip()
-            yield {'type': 'error', 'chunk': f"❌ Error cleaning resolver output: {e}\n"}, None, ""   
-        
-        
-        fixed_files = json.loads(resolver_output_text_cleaned)
+        if parse_error is not None:
+            raise parse_error
+
         with open("AI_Builder/output.json", "w", encoding="utf-8") as f:
             json.dump(fixed_files, f, indent=4, ensure_ascii=False)
 
         print("JSON file saved successfully!")
-        fixed_count = 0
-        for file_path, fixed_content in fixed_files.items():
-            if file_path in full_project["files"]:
-                full_project["files"][file_path] = fixed_content
-                fixed_count += 1
-            else:
-                yield {'type': 'warning', 'chunk': f"⚠️ File path not in project: {file_path}\n"}, full_project, resolver_output_text_cleaned
+        applied_files = [path for path in fixed_files if path in full_project["files"]]
 
-        # ✅ SINGLE FINAL YIELD - This is the key fix
-        yield {'type': 'json_chunk', 'chunk': full_project}, full_project, resolver_output_text_cleaned
+        # ✅ SINGLE FINAL YIELD - manifest for the client, full project for storage
+        yield build_project_manifest(full_project, applied_files), full_project, resolver_output_text
         
     except (json.JSONDecodeError, ValueError) as e:
         yield {'type': 'error', 'chunk': f"❌ Error parsing resolver result: {e}\n"}, None, ""
         
         yield {'type': 'message', 'chunk': "🛠️ Applying manual fix for the error...\n"}, None, ""
         
-        if "src/main.jsx" in full_project["files"]:
-            original_content = full_project["files"]["src/main.jsx"]
-            fixed_content = original_content.replace(
-                "<BrowserRouter>\n      <App \n    </BrowserRouter>",
-                "<BrowserRouter>\n      <App />\n    </BrowserRouter>"
-            )
-            full_project["files"]["src/main.jsx"] = fixed_content
-            yield {'type': 'message', 'chunk': "📝 Manually fixed: src/main.jsx\n"}, None, ""
+        for file_path in dict.fromkeys(affected_files + ["src/main.jsx"]):
+            content = full_project["files"].get(file_path)
+            if isinstance(content, str) and file_path.endswith((".jsx", ".tsx", ".js")):
+                fixed_content = close_unbalanced_tags(content)
+                if fixed_content != content:
+                    full_project["files"][file_path] = fixed_content
+                    yield {'type': 'message', 'chunk': f"📝 Manually fixed: {file_path}\n"}, None, ""
         
 
         yield {'type': 'message', 'chunk': "Error resolution completed with manual fixes! 🚀\n"}, full_project, ""
\ No newline at end of file
@@ -0,0 +1,195 @@
+"""
+Per-user and per-workspace generation limits for AI Builder Version 2
+Concurrent /ai_chat generations are leases, shared across workers through Redis
+"""
+
+import asyncio
+import os
+import time
+import uuid
+
+from dotenv import load_dotenv, find_dotenv
+
+from .metrics import increment
+from .state_store import get_redis, mark_redis_failed
+
+_ = load_dotenv(find_dotenv())
+
+USER_MAX_CONCURRENT_GENERATIONS = int(os.getenv("USER_MAX_CONCURRENT_GENERATIONS", "2"))
+WORKSPACE_MAX_CONCURRENT_GENERATIONS = int(os.getenv("WORKSPACE_MAX_CONCURRENT_GENERATIONS", "6"))
+# A lease expires unless renewed, so a crashed worker can't hold a user's slot forever
+LEASE_TTL_SECONDS = 120
+LEASE_RENEW_SECONDS = 30
+# A lease whose stream hasn't started by then was dropped before Starlette iterated it
+# (e.g. the client left during routing), so its wrapper's finally never runs; release it here
+LEASE_START_TIMEOUT_SECONDS = float(os.getenv("LEASE_START_TIMEOUT_SECONDS", "60"))
+# Renewal stops after this, so a leaked lease expires at most LEASE_TTL_SECONDS later
+LEASE_MAX_SECONDS = float(os.getenv("LEASE_MAX_SECONDS", "1800"))
+
+# KEYS: lease sets. ARGV: now, expires_at, lease_id, then the limit for each key.
+# Adds the lease to every set or to none; returns the 1-based index of the full set, 0 when granted.
+ACQUIRE_LEASE_SCRIPT = """
+local now = tonumber(ARGV[1])
+for i, key in ipairs(KEYS) do
+  redis.call("ZREMRANGEBYSCORE", key, "-inf", now)
+  if redis.call("ZCARD", key) >= tonumber(ARGV[3 + i]) then
+    return i
+  end
+end
+for i, key in ipairs(KEYS) do
+  redis.call("ZADD", key, ARGV[2], ARGV[3])
+  redis.call("EXPIRE", key, math.ceil(tonumber(ARGV[2]) - now))
+end
+return 0
+"""
+
+_scripts = {}
+_local_leases = {}
+
+
+class GenerationLimitExceeded(Exception):
+    """The user or workspace already runs its maximum number of generations"""
+
+    def __init__(self, scope, limit):
+        super().__init__(f"Too many generations running for this {scope} (limit {limit}), please wait for one to finish")
+        self.scope = scope
+        self.limit = limit
+
+
+def _lease_scopes(user_id, workspace_id):
+    scopes = [("user", f"gen_leases:user:{user_id}", USER_MAX_CONCURRENT_GENERATIONS)]
+    if workspace_id:
+        scopes.append(("workspace", f"gen_leases:workspace:{workspace_id}", WORKSPACE_MAX_CONCURRENT_GENERATIONS))
+    return scopes
+
+
+def _local_acquire(keys, limits, lease_id, now, expires_at):
+    for index, (key, limit) in enumerate(zip(keys, limits), start=1):
+        leases = _local_leases.setdefault(key, {})
+        for expired in [lease for lease, expiry in leases.items() if expiry <= now]:
+            del leases[expired]
+        if len(leases) >= limit:
+            return index
+    for key in keys:
+        _local_leases[key][lease_id] = expires_at
+    return 0
+
+
+class GenerationLease:
+    """One running generation, counted against its user's and workspace's limits"""
+
+    def __init__(self, user_id, workspace_id=None):
+        self.user_id = user_id
+        self.workspace_id = workspace_id
+        self.lease_id = uuid.uuid4().hex
+        self.scopes = _lease_scopes(user_id, workspace_id)
+        self._renew_task = None
+        self._acquired_at = None
+        self.started = False
+        self.released = False
+
+    @property
+    def keys(self):
+        return [key for _, key, _ in self.scopes]
+
+    async def acquire(self):
+        """Take the lease or raise GenerationLimitExceeded"""
+        now = time.time()
+        expires_at = now + LEASE_TTL_SECONDS
+        limits = [limit for *_, limit in self.scopes]
+        full = None
+        client = get_redis()
+        if client is not None:
+            try:
+                script = _scripts.get(id(client))
+                if script is None:
+                    script = _scripts[id(client)] = client.register_script(ACQUIRE_LEASE_SCRIPT)
+                full = int(await script(keys=self.keys, args=[now, expires_at, self.lease_id, *limits]))
+            except Exception as e:
+                mark_redis_failed(e)
+        if full is None:
+            full = _local_acquire(self.keys, limits, self.lease_id, now, expires_at)
+        if full:
+            scope, _, limit = self.scopes[full - 1]
+            increment(f"generation_limits.rejected.{scope}")
+            raise GenerationLimitExceeded(scope, limit)
+        increment("generation_limits.granted")
+        self._acquired_at = time.monotonic()
+        self._renew_task = asyncio.create_task(self._renew_loop())
+        return self
+
+    async def _renew_loop(self):
+        while True:
+            await asyncio.sleep(LEASE_RENEW_SECONDS)
+            age = time.monotonic() - self._acquired_at
+            if not self.started and age >= LEASE_START_TIMEOUT_SECONDS:
+                increment("generation_limits.abandoned")
+                self._renew_task = None
+                await self.release()
+                return
+            if age >= LEASE_MAX_SECONDS:
+                increment("generation_limits.max_lifetime")
+                self._renew_task = None
+                return
+            expires_at = time.time() + LEASE_TTL_SECONDS
+            client = get_redis()
+            if client is not None:
+                try:
+                    for key in self.keys:
+                        await client.zadd(key, {self.lease_id: expires_at}, xx=True)
+                        await client.expire(key, LEASE_TTL_SECONDS)
+                    continue
+                except Exception as e:
+                    mark_redis_failed(e)
+            for key in self.keys:
+                if self.lease_id in _local_leases.get(key, {}):
+                    _local_leases[key][self.lease_id] = expires_at
+
+    async def release(self):
+        """Give the slot back; safe to call more than once"""
+        if self.released:
+            return
+        self.released = True
+        if self._renew_task is not None:
+            self._renew_task.cancel()
+            self._renew_task = None
+        client = get_redis()
+        if client is not None:
+            try:
+                for key in self.keys:
+                    await client.zrem(key, self.lease_id)
+            except Exception as e:
+                mark_redis_failed(e)
+        for key in self.keys:
+            leases = _local_leases.get(key)
+            if leases is not None:
+                leases.pop(self.lease_id, None)
+                if not leases:
+                    del _local_leases[key]
+
+
+async def stream_with_lease(stream, lease):
+    """Relay an SSE stream and release the generation lease when it ends or the client leaves.
+
+    Only runs once Starlette starts iterating; also set the response's background task to
+    ``lease.release`` and see LEASE_START_TIMEOUT_SECONDS for streams that never start.
+    """
+    lease.started = True
+    try:
+        async for item in stream:
+            yield item
+    finally:
+        try:
+            await stream.aclose()
+        finally:
+            await lease.release()
+
+
+def generation_limit_stats():
+    """Configured limits and the leases held through this worker's local fallback"""
+    return {
+        "user_limit": USER_MAX_CONCURRENT_GENERATIONS,
+        "workspace_limit": WORKSPACE_MAX_CONCURRENT_GENERATIONS,
+        "redis": get_redis() is not None,
+        "local_active_leases": sum(len(leases) for key, leases in _local_leases.items() if key.startswith("gen_leases:user:")),
+    }
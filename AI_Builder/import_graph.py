@@ -0,0 +1,213 @@
+"""
+Import graph utilities for generated React projects
+Parses import/export statements locally so file relationships don't need an LLM
+"""
+
+import hashlib
+import posixpath
+import re
+from collections import OrderedDict
+
+# import X from '...', import '...', export { X } from '...', import('...'), @import '...'
+IMPORT_PATTERN = re.compile(
+    r"""(?:^|[;\s])(?:import\s+(?:[\w*${}\s,]+?\s+from\s+)?|export\s+[\w*${}\s,]+?\s+from\s+)['"]([^'"\n]+)['"]"""
+    r"""|\bimport\s*\(\s*['"]([^'"\n]+)['"]\s*\)"""
+    r"""|@import\s+(?:url\(\s*)?['"]([^'"\n]+)['"]""",
+    re.MULTILINE,
+)
+
+RESOLVE_SUFFIXES = ("", ".jsx", ".js", ".tsx", ".ts", ".css", "/index.jsx", "/index.js", "/index.tsx", "/index.ts")
+SOURCE_EXTENSIONS = (".jsx", ".js", ".tsx", ".ts", ".css", ".mjs")
+
+# Size assumed for files that don't exist yet when balancing groups
+NEW_FILE_WEIGHT = 3000
+
+# Parsed imports per conversation, keyed by file content hash
+MAX_CACHED_CONVERSATIONS = 256
+_import_cache = OrderedDict()
+
+CONFIG_ERROR_KEYWORDS = {
+    "package.json": ("module not found", "failed to resolve", "cannot find module", "does not provide an export", "dependency", "npm"),
+    "vite.config.js": ("vite", "build", "plugin", "transform failed"),
+    "tailwind.config.js": ("tailwind", "style", "styling"),
+    "postcss.config.js": ("postcss", "tailwind", "css"),
+    "index.html": ("root element", "createroot", "index.html"),
+    "src/main.jsx": ("router", "browserrouter", "createroot", "render", "provider", "context"),
+}
+
+
+def parse_imports(content):
+    """Return the module specifiers imported by a source file, in order"""
+    if not content:
+        return []
+    specifiers = []
+    for match in IMPORT_PATTERN.finditer(content):
+        specifier = match.group(1) or match.group(2) or match.group(3)
+        if specifier and specifier not in specifiers:
+            specifiers.append(specifier)
+    return specifiers
+
+
+def resolve_import(from_path, specifier, project_files):
+    """Resolve a specifier to a project file path, or None for packages/unknown files"""
+    if specifier.startswith("./") or specifier.startswith("../"):
+        base = posixpath.normpath(posixpath.join(posixpath.dirname(from_path), specifier))
+    elif specifier.startswith("@/"):
+        base = "src/" + specifier[2:]
+    elif specifier.startswith("/"):
+        base = specifier.lstrip("/")
+    else:
+        return None
+
+    for suffix in RESOLVE_SUFFIXES:
+        candidate = base + suffix
+        if candidate in project_files:
+            return candidate
+    return None
+
+
+def find_project_path(name, project_files):
+    """Match a partial or absolute path (e.g. from an error message) to a project file"""
+    if not name:
+        return None
+    name = name.strip().replace("\\", "/")
+    while name.startswith("./"):
+        name = name[2:]
+    if name in project_files:
+        return name
+    candidates = [
+        path for path in project_files
+        if path.endswith("/" + name) or name.endswith("/" + path)
+    ]
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def is_source_file(file_path):
+    return file_path.endswith(SOURCE_EXTENSIONS)
+
+
+def _resolve_all(file_path, specifiers, project_files):
+    deps = []
+    for specifier in specifiers:
+        resolved = resolve_import(file_path, specifier, project_files)
+        if resolved and resolved != file_path and resolved not in deps:
+            deps.append(resolved)
+    return deps
+
+
+def build_import_graph(project_files):
+    """Map each source file to the project files it imports"""
+    graph = {}
+    for file_path, content in project_files.items():
+        if not is_source_file(file_path) or not isinstance(content, str):
+            continue
+        graph[file_path] = _resolve_all(file_path, parse_imports(content), project_files)
+    return graph
+
+
+def cached_import_graph(conversation_id, project_files):
+    """build_import_graph, reusing parsed imports for files whose content hash is unchanged.
+
+    Parse results are cached per conversation (LRU over conversations), so
+    after an edit only the touched files are re-parsed.
+    """
+    cache = _import_cache.pop(conversation_id, None) or {}
+    _import_cache[conversation_id] = cache
+    while len(_import_cache) > MAX_CACHED_CONVERSATIONS:
+        _import_cache.popitem(last=False)
+
+    graph = {}
+    for file_path, content in project_files.items():
+        if not is_source_file(file_path) or not isinstance(content, str):
+            continue
+        digest = hashlib.sha1(content.encode("utf-8")).hexdigest()
+        cached = cache.get(file_path)
+        if cached and cached[0] == digest:
+            specifiers = cached[1]
+        else:
+            specifiers = parse_imports(content)
+            cache[file_path] = (digest, specifiers)
+        graph[file_path] = _resolve_all(file_path, specifiers, project_files)
+
+    for stale_path in [path for path in cache if path not in graph]:
+        del cache[stale_path]
+    return graph
+
+
+def imported_by(graph, file_path):
+    """Files that import ``file_path``"""
+    return sorted(path for path, deps in graph.items() if file_path in deps)
+
+
+def config_files_for_error(error_description, file_path, project_files):
+    """Config files worth sending with an error, chosen by error keywords"""
+    text = (error_description or "").lower()
+    selected = []
+    for config_file, keywords in CONFIG_ERROR_KEYWORDS.items():
+        if config_file == file_path or config_file not in project_files:
+            continue
+        if any(keyword in text for keyword in keywords):
+            selected.append(config_file)
+
+    # A bare package import that package.json doesn't declare points at package.json
+    if "package.json" in project_files and "package.json" not in selected:
+        declared = project_files["package.json"]
+        for specifier in parse_imports(project_files.get(file_path) or ""):
+            if resolve_import(file_path, specifier, project_files) is None and not specifier.startswith((".", "/", "@/")):
+                package_name = "/".join(specifier.split("/")[:2]) if specifier.startswith("@") else specifier.split("/")[0]
+                if f'"{package_name}"' not in declared:
+                    selected.append("package.json")
+                    break
+    return selected
+
+
+def dependency_chain(graph, file_path, error_description, project_files):
+    """Local replacement for the finder agent's dependency_chain"""
+    return {
+        "imports_from": graph.get(file_path, []),
+        "imported_by": imported_by(graph, file_path),
+        "config_files": config_files_for_error(error_description, file_path, project_files),
+    }
+
+
+def partition_by_imports(target_paths, project_files, max_groups):
+    """Split target files into groups with no direct imports between groups.
+
+    Files connected through imports stay together; the resulting components
+    are then packed largest-first into at most ``max_groups`` groups so the
+    largest group (which bounds wall-clock time) stays as small as possible.
+    Output order is deterministic for a given input.
+    """
+    targets = list(dict.fromkeys(target_paths))
+    parent = {path: path for path in targets}
+
+    def find(path):
+        while parent[path] != path:
+            parent[path] = parent[parent[path]]
+            path = parent[path]
+        return path
+
+    graph = build_import_graph(project_files)
+    for path in targets:
+        for dep in graph.get(path, []):
+            if dep in parent:
+                root_a, root_b = find(path), find(dep)
+                if root_a != root_b:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    components = {}
+    for path in targets:
+        components.setdefault(find(path), []).append(path)
+
+    def size_of(paths):
+        return sum(len(project_files.get(p) or "") or NEW_FILE_WEIGHT for p in paths)
+
+    ordered = sorted(components.values(), key=lambda paths: (-size_of(paths), paths[0]))
+    bins = [[] for _ in range(max(1, min(max_groups, len(ordered))))]
+    sizes = [0] * len(bins)
+    for paths in ordered:
+        smallest = sizes.index(min(sizes))
+        bins[smallest].extend(paths)
+        sizes[smallest] += size_of(paths)
+
+    return [sorted(group) for group in bins if group]
@@ -6,29 +6,30 @@ Contains FastAPI endpoints for different AI agent tasks
 import os
 import json
 import asyncio
+import time
 from datetime import datetime
 from dotenv import load_dotenv, find_dotenv
 from fastapi import FastAPI, HTTPException, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 import base64
 from typing import Optional
-import urllib.request
-import urllib.error
 
 # Import from our modules
 from .models import (
     TokenManager, ProjectContext,
     manager_agent, planner_agent, codegen_agent,
     error_files_finder_agent, error_resolver_agent,
-    modifier_files_finder_agent, modifier_agent, code_conversation_agent, project_summary_agent, name_suggestion_agent, updating_and_error_summary_agent
+    modifier_files_finder_agent, modifier_agent, code_conversation_agent, project_summary_agent, name_suggestion_agent, updating_and_error_summary_agent,
+    plan_summary_agent, PLANNING_MODE, first_turn_router_agent, FIRST_TURN_ROUTER_ENABLED, BACKGROUND_NAMING_ENABLED
 )
 from .functions import (
     handle_error_resolution,
     clean_ai_output, extract_text_from_result_object,
     run_agent_with_token_limit, code_update,
-    stream_codegen_chunks, run_agent_with_token_limit_streaming, extract_json_from_text, handle_error_resolution_streaming, count_input_tokens_anthropic, 
+    stream_codegen_chunks, run_agent_with_token_limit_streaming, extract_json_from_text, handle_error_resolution_streaming, stream_autofix_resolution, count_input_tokens_anthropic, 
 )
 from .simple_database import (
     get_user, get_or_create_conversation, add_conversation_version,
@@ -36,10 +37,25 @@ from .simple_database import (
     update_current_json, update_current_json_with_history, get_undo_redo_status,
     add_ai_message, validate_conversation_id, create_new_conversation,
     get_conversation_full, list_conversations_basic, create_new_project_with_conversation, is_first_message_in_conversation, update_project_name,get_project_publish_info,
-    get_conversation_messages, verify_workspace_access, list_conversations_without_workspace, get_user_subscription, reserve_user_tokens
+    verify_workspace_access, list_conversations_without_workspace, get_user_subscription, reserve_user_tokens
 )
-from .credit_calculator import credits_for_messages, count_tokens as count_tokens_anthropic_exact
-from .prompts import codegen_prompt, error_resolving_prompt, code_modifier_prompt
+from .credit_calculator import credits_for_messages, credits_for_usage, count_tokens as count_tokens_anthropic_exact
+from .prompts import codegen_prompt, code_modifier_sliced_prompt
+from .stream_parser import ProjectStreamParser, TaggedSectionParser
+from .autofix import run_autofix_rules, autofix_stats
+from .metrics import increment, snapshot as metrics_snapshot
+from .context_builder import build_conversation_input
+from .token_counter import precompute_static_counts
+from .usage import start_usage_record, current_usage_record
+from .clients import get_notification_client, warm_up_clients, close_clients, client_pool_stats
+from .admission import start_admission, check_admission, stream_with_queue_events, AdmissionRejected, admission_stats
+from .generation_limits import GenerationLease, GenerationLimitExceeded, stream_with_lease, generation_limit_stats
+from .routing import routing_stats
+from .rate_limiter import OUTPUT_TOKEN_ESTIMATES
+from .task_classifier import local_task_decision, log_decision, classifier_stats
+from .project_naming import provisional_project_name, start_background_naming, stream_with_project_name
+from .prompt_cache import prompt_cache_stats
+from .complexity_gate import assess_new_project, local_project_summary, record_stage, record_skipped_stage
 
 
 _ = load_dotenv(find_dotenv())
@@ -56,6 +72,20 @@ app = FastAPI(
 )
 
 
+@app.on_event("startup")
+async def warm_up_worker():
+    """Open provider connections and count static system prompts before the first request"""
+    await asyncio.gather(
+        warm_up_clients(),
+        asyncio.to_thread(precompute_static_counts),
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown_worker():
+    await close_clients()
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["https://your-frontend-domain.com", "http://localhost:3000", "https://ai-web-builder-fe.vercel.app", "https://staron.ai"],  # Add your frontend domains
@@ -101,48 +131,88 @@ class UndoRedoResponse(BaseModel):
 # project_context = ProjectContext()
 
 
-async def get_manager_decision(user_input: str, conversation_id: str) -> str:
+async def get_manager_decision(user_input: str, conversation_id: str, has_initial_json: bool = True) -> str:
     """Get manager agent decision for task routing"""
+    # Greetings, questions, empty projects and confident model predictions skip the manager agent
+    local_task = local_task_decision(user_input, has_initial_json)
+    if local_task is not None:
+        return local_task
+
     try:
         # name_suggest = await run_agent_with_token_limit(name_suggestion_agent, user_input)
         # print(f"📝 Suggested project name: {name_suggest.final_output.strip()}")
         # print()
     
-        chat_history = get_conversation_messages(conversation_id)
-
-        if chat_history is None:
-            conversation_input = [{"role": "user", "content": user_input}]
-        else:
-            conversation_input = chat_history + [
-                {"role": "user", "content": user_input}
-            ]
+        conversation_input = await build_conversation_input(conversation_id, user_input, manager_agent.name)
     
         manager_result = await run_agent_with_token_limit(manager_agent, conversation_input)
         task_type = manager_result.final_output.strip()
         print(f"============📝 Manager decision: {task_type}==================")
 
-        try:
-            manager_decision = json.loads(task_type)
-            task = manager_decision.get("task", "")
-        except:
-            if "code_generation" in task_type:
-                task = "code_generation"
-            elif "error_resolution" in task_type:
-                task = "error_resolution"
-            elif "code_change" in task_type:
-                task = "code_change"
-            elif "code_continuation" in task_type:
-                task = "code_continuation"
-            elif "code_conversation" in task_type:
-                task = "code_conversation"
-            else:
-                task = "code_conversation"
-        
+        task = parse_task(task_type)
+        log_decision(user_input, has_initial_json, task)
         return task
+    except AdmissionRejected:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Manager decision failed: {str(e)}")
 
 
+def parse_task(task_type: str) -> str:
+    """Task name from a router's JSON output, or from a keyword when the JSON is broken"""
+    try:
+        manager_decision = json.loads(task_type)
+        task = manager_decision.get("task", "")
+    except:
+        if "code_generation" in task_type:
+            task = "code_generation"
+        elif "error_resolution" in task_type:
+            task = "error_resolution"
+        elif "code_change" in task_type:
+            task = "code_change"
+        elif "code_continuation" in task_type:
+            task = "code_continuation"
+        elif "code_conversation" in task_type:
+            task = "code_conversation"
+        else:
+            task = "code_conversation"
+
+    return task
+
+
+async def get_first_turn_route(user_input: str, conversation_id: str):
+    """Task and project name for the first message of a project, from one router call"""
+    conversation_input = await build_conversation_input(conversation_id, user_input, first_turn_router_agent.name)
+
+    router_result = await run_agent_with_token_limit(first_turn_router_agent, conversation_input)
+    output = router_result.final_output.strip()
+    print(f"============📝 First-turn route: {output}==================")
+
+    try:
+        project_name = str(extract_json_from_text(output).get("project_name") or "").strip()
+    except ValueError:
+        project_name = ""
+    return parse_task(clean_ai_output(output)), project_name
+
+
+async def compute_request_credits(system: str, messages: list) -> float:
+    """Credits for this request from provider-reported usage across all agents.
+
+    Falls back to counting ``system`` + ``messages`` locally when no provider
+    reported usage for the request.
+    """
+    usage = current_usage_record()
+    if usage is not None and not usage.is_empty():
+        return credits_for_usage(usage)
+    print("⚠️ No provider usage reported, counting tokens locally")
+    return await asyncio.to_thread(
+        credits_for_messages,
+        model="claude-sonnet-4-20250514",
+        system=system,
+        messages=messages,
+    )
+
+
 async def generate_project_name(user_input: str) -> str:
     name_suggest = await run_agent_with_token_limit(name_suggestion_agent, user_input)
     print(f"📝 Suggested project name: {name_suggest.final_output.strip()}")
@@ -189,7 +259,7 @@ def extract_user_id_from_token(token: str) -> int:
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid token: cannot extract user_id")
 
-def send_low_credit_notification(user_id: int, daily_remaining: int, total_remaining: int):
+async def send_low_credit_notification(user_id: int, daily_remaining: int, total_remaining: int):
     try:
         url = os.getenv("NOTIFICATIONS_API_URL", "https://api.staron.ai/api/v1/notifications/credit-balance-update/")
         payload = {
@@ -197,19 +267,16 @@ def send_low_credit_notification(user_id: int, daily_remaining: int, total_remai
             "daily_tokens_available": daily_remaining,
             "total_tokens_remaining": total_remaining,
         }
-        data = json.dumps(payload).encode("utf-8")
         headers = {"Content-Type": "application/json"}
         token = os.getenv("NOTIFICATIONS_API_TOKEN")
         # if token:
         #     headers["Authorization"] = f"Bearer {token}"
-        req = urllib.request.Request(url, data=data, headers=headers, method="POST")
-        with urllib.request.urlopen(req, timeout=5) as resp:
-            _ = resp.read()
+        _ = await get_notification_client().post(url, json=payload, headers=headers)
     except Exception:
         pass
 
 async def notify_low_credit_async(user_id: int, daily_remaining: int, total_remaining: int):
-    await asyncio.to_thread(send_low_credit_notification, user_id, daily_remaining, total_remaining)
+    await send_low_credit_notification(user_id, daily_remaining, total_remaining)
 
 
 
@@ -292,6 +359,9 @@ async def manager_endpoint(request: ManagerRequest, conversation_id: str):
         )
 
     try:
+        # Collects provider-reported token usage of every agent run for billing
+        start_usage_record()
+
         meta = get_conversation_full(conversation_id)
         if not meta or not isinstance(meta, dict) or not meta.get("user_id"):
             raise HTTPException(status_code=404, detail="Conversation not found")
@@ -309,46 +379,95 @@ async def manager_endpoint(request: ManagerRequest, conversation_id: str):
         except Exception as e:
             raise 
 
-        existing_json = get_current_json(conversation_id) or {}
-        has_initial_json = bool(existing_json) and isinstance(existing_json, dict) and len(existing_json.keys()) > 0
-
-        if is_first_message_in_conversation(conversation_id):
-            project_name = await generate_project_name(request.user_input)
-            update_project_name(conversation_id, project_name)
-        else:
-            project_name = None
-
+        # One lease per running generation, limited per user and per workspace across workers
+        lease = await GenerationLease(user_id_for_tokens, meta.get("workspace_id")).acquire()
         try:
-            task_type = await get_manager_decision(request.user_input, conversation_id)
-            print(f"🧠 Manager decided task type: {task_type}")
-        except Exception as e:
-            print(f"⚠️ Manager decision failed, using default task type: {e}")
-            task_type = "code_generation"
-
-        if not has_initial_json:
-            if task_type == "code_conversation":
-                return await code_conversation_function(request, conversation_id, project_name)
-
-            return await streaming_code_generation(request, conversation_id, project_name)
-
-
-        if task_type == "error_resolution":
-            return await error_resolution_function(request, conversation_id, existing_json)
-        if task_type == "code_change":
-            return await code_change_function(request, conversation_id, existing_json)
-        if task_type == "code_conversation":
-            return await code_conversation_function(request, conversation_id)
-        if task_type == "code_generation":
-            return await code_change_function(request, conversation_id, existing_json)
+            # Shed load before any LLM call when the provider queues are beyond the latency SLO
+            start_admission(sub.get("plan_id"), user_id_for_tokens)
+            check_admission()
 
+            existing_json = get_current_json(conversation_id) or {}
+            has_initial_json = bool(existing_json) and isinstance(existing_json, dict) and len(existing_json.keys()) > 0
 
-        return await streaming_code_generation(request, conversation_id)
+            first_message = is_first_message_in_conversation(conversation_id)
+            project_name = None
+            task_type = None
+            naming = None
+            if first_message and FIRST_TURN_ROUTER_ENABLED:
+                # The router call is only worth it when the task isn't already clear locally
+                task_type = local_task_decision(request.user_input, has_initial_json)
+            if first_message and FIRST_TURN_ROUTER_ENABLED and task_type is None:
+                # One call instead of name suggestion + manager; missing parts fall back to those agents
+                try:
+                    task_type, project_name = await get_first_turn_route(request.user_input, conversation_id)
+                    increment("first_turn_router.calls")
+                    log_decision(request.user_input, has_initial_json, task_type, first_turn_router_agent.name)
+                except AdmissionRejected:
+                    raise
+                except Exception as e:
+                    print(f"⚠️ First-turn router failed, routing separately: {e}")
+                    increment("first_turn_router.fallback")
+            if first_message:
+                if not project_name and BACKGROUND_NAMING_ENABLED:
+                    # Provisional name now, suggested name saved and streamed once it's ready
+                    project_name = provisional_project_name(request.user_input)
+                    naming = start_background_naming(conversation_id, request.user_input, generate_project_name)
+                elif not project_name:
+                    project_name = await generate_project_name(request.user_input)
+                update_project_name(conversation_id, project_name)
+
+            if task_type is None:
+                try:
+                    task_type = await get_manager_decision(request.user_input, conversation_id, has_initial_json)
+                    print(f"🧠 Manager decided task type: {task_type}")
+                except AdmissionRejected:
+                    raise
+                except Exception as e:
+                    print(f"⚠️ Manager decision failed, using default task type: {e}")
+                    task_type = "code_generation"
+
+            response = await dispatch_task(request, conversation_id, task_type, existing_json, has_initial_json, project_name)
+        except BaseException:
+            await lease.release()
+            raise
+        if naming is not None:
+            response.body_iterator = stream_with_project_name(response.body_iterator, naming)
+        # The lease is held until the stream ends or the client disconnects; the background task
+        # also releases it when the response finishes without iterating the stream
+        response.body_iterator = stream_with_lease(response.body_iterator, lease)
+        response.background = BackgroundTask(lease.release)
+        return response
         
+    except GenerationLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def dispatch_task(request: ManagerRequest, conversation_id: str, task_type: str, existing_json: dict, has_initial_json: bool, project_name: str = None):
+    """Start the streaming response for the task the manager picked"""
+    if not has_initial_json:
+        if task_type == "code_conversation":
+            return await code_conversation_function(request, conversation_id, project_name)
+
+        return await streaming_code_generation(request, conversation_id, project_name)
+
+
+    if task_type == "error_resolution":
+        return await error_resolution_function(request, conversation_id, existing_json)
+    if task_type == "code_change":
+        return await code_change_function(request, conversation_id, existing_json)
+    if task_type == "code_conversation":
+        return await code_conversation_function(request, conversation_id)
+    if task_type == "code_generation":
+        return await code_change_function(request, conversation_id, existing_json)
+
+
+    return await streaming_code_generation(request, conversation_id)
+
 async def streaming_code_generation(request: ManagerRequest, conversation_id: str, project_name: str = None):
     """Streaming code generation with database storage"""
     try:
@@ -356,71 +475,105 @@ async def streaming_code_generation(request: ManagerRequest, conversation_id: st
         meta_for_billing = get_conversation_full(conversation_id)
         user_id_for_tokens = meta_for_billing.get("user_id") if isinstance(meta_for_billing, dict) else None
        
-        try:
-            
-            chat_history = get_conversation_messages(conversation_id)
-
-            if chat_history is None:
-                conversation_input = [{"role": "user", "content": request.user_input}]
-            else:
-                conversation_input = chat_history + [
-                    {"role": "user", "content": request.user_input}
-                ]
+        # Simple requests skip the planner (and, in English, the summary agent)
+        stages = assess_new_project(request.user_input)
+        # In combined mode one streamed call returns both the summary and the plan
+        combined = stages["plan"] and PLANNING_MODE == "combined"
+        plan_data = f"Project plan for: {request.user_input}"
+        if combined:
+            try:
+                conversation_input = await build_conversation_input(conversation_id, request.user_input, plan_summary_agent.name)
+            except Exception as e:
+                print(f"⚠️ Could not build planner context: {e}")
+                conversation_input = request.user_input
+        elif stages["plan"]:
+            planner_start = time.perf_counter()
+            try:
+                conversation_input = await build_conversation_input(conversation_id, request.user_input, planner_agent.name)
 
-            plan_output = await run_agent_with_token_limit(planner_agent, conversation_input)
-            if hasattr(plan_output, 'final_output'):
-                plan_data = clean_ai_output(plan_output.final_output)
-            else:
-                plan_data = f"Project plan for: {request.user_input}"
-        except Exception as e:
-            print(f"⚠️ Planner agent error: {e}")
-            plan_data = f"Project plan for: {request.user_input}"
+                plan_output = await run_agent_with_token_limit(planner_agent, conversation_input)
+                if hasattr(plan_output, 'final_output'):
+                    plan_data = clean_ai_output(plan_output.final_output)
+                record_stage("planner", time.perf_counter() - planner_start)
+            except Exception as e:
+                print(f"⚠️ Planner agent error: {e}")
+        else:
+            record_skipped_stage("planner")
 
         data = f"Detect the language of the User Input: {request.user_input} \n\n Convert this Project Plan to detected language: \n\n{plan_data}"
 
-        codegen_input = f"Based on this project plan, only generate the React project:\n\n{plan_data}\n\nUser Request: {request.user_input} \n\n Only generate the spefic features requested by the user. Not include any extra features."
+        def codegen_request(plan):
+            return f"Based on this project plan, only generate the React project:\n\n{plan}\n\nUser Request: {request.user_input} \n\n Only generate the spefic features requested by the user. Not include any extra features."
+
+        codegen_input = codegen_request(plan_data)
         
         # Variables to collect streaming output
         ai_message = ""
         ai_json = {}
-        full_json_output = ""
-        
+
         async def generate():
-            nonlocal ai_message, ai_json, full_json_output
-            
-            try:
-                async for chunk in run_agent_with_token_limit_streaming(project_summary_agent, data, 1000):
-                    if chunk.strip():
-                        chunk = chunk.replace("```html","").replace("```", "").replace("html", "")
-                        formatted_chunk = chunk #+ '\n' if not chunk.endswith('\n') else chunk
-                        yield f"data: {json.dumps({'type': 'message', 'chunk': formatted_chunk})}\n\n"
-                        await asyncio.sleep(0.05)
-                        ai_message += chunk  
+            nonlocal ai_message, ai_json, plan_data, codegen_input
 
-                import re
+            try:
+                if combined:
+                    plan_start = time.perf_counter()
+                    sections = TaggedSectionParser()
+                    try:
+                        async for chunk in run_agent_with_token_limit_streaming(plan_summary_agent, conversation_input, OUTPUT_TOKEN_ESTIMATES[plan_summary_agent.name]):
+                            for section, text in sections.feed(chunk):
+                                if section == "summary":
+                                    yield f"data: {json.dumps({'type': 'message', 'chunk': text})}\n\n"
+                                    ai_message += text
+                        # Output that ignored the tags is still a usable plan
+                        plan_data = sections.text("plan") or clean_ai_output(sections.raw) or plan_data
+                        record_stage("plan_summary", time.perf_counter() - plan_start)
+                        record_skipped_stage("summary", "merged")
+                    except Exception as e:
+                        print(f"⚠️ Combined planner error: {e}")
+                    if not ai_message.strip():
+                        for line in local_project_summary(request.user_input).splitlines(keepends=True):
+                            yield f"data: {json.dumps({'type': 'message', 'chunk': line})}\n\n"
+                            ai_message += line
+                    codegen_input = codegen_request(plan_data)
+                elif stages["summary"]:
+                    summary_start = time.perf_counter()
+                    async for chunk in run_agent_with_token_limit_streaming(project_summary_agent, data):
+                        if chunk.strip():
+                            chunk = chunk.replace("```html","").replace("```", "").replace("html", "")
+                            formatted_chunk = chunk #+ '\n' if not chunk.endswith('\n') else chunk
+                            yield f"data: {json.dumps({'type': 'message', 'chunk': formatted_chunk})}\n\n"
+                            await asyncio.sleep(0.05)
+                            ai_message += chunk  
+                    record_stage("summary", time.perf_counter() - summary_start)
+                else:
+                    record_skipped_stage("summary")
+                    for line in local_project_summary(request.user_input).splitlines(keepends=True):
+                        yield f"data: {json.dumps({'type': 'message', 'chunk': line})}\n\n"
+                        ai_message += line
+
+                # Raw pieces go to the parser (fences are skipped there), so
+                # file names like "package.json" arrive intact
+                parser = ProjectStreamParser()
                 async for piece in stream_codegen_chunks(codegen_agent, codegen_input):
                     clean_piece = piece.replace("```json", "").replace("```", "").replace("json", "")
                     if clean_piece.strip():
                         yield f"data: {json.dumps({'type': 'json_chunk', 'chunk': clean_piece})}\n\n"
                         await asyncio.sleep(0.005)
-                        full_json_output += clean_piece  
-                
-                try:
-                    ai_json = json.loads(full_json_output)
-                except json.JSONDecodeError:
-                    try:
-                        # print("new code generation  new code generation  new code generation new code generation ")
-                        ai_json = full_json_output
-                        # print("ai_json", ai_json)
-                    except Exception as e:
-                        print(f"❌ Failed to extract JSON: {e}")
-                        ai_json = {
-                            "project_name": "Generated Project",
-                            "framework": "React",
-                            "files": {},
-                            "generated_from": request.user_input
-                        }
-                        
+                    for file_path, file_content in parser.feed(piece):
+                        yield f"data: {json.dumps({'type': 'file_complete', 'path': file_path, 'content': file_content})}\n\n"
+
+                ai_json = parser.result()
+                if not parser.complete:
+                    print(f"⚠️ Codegen JSON incomplete, keeping {len(parser.files)} completed files")
+                if not parser.files:
+                    print("❌ Failed to extract JSON: no files were generated")
+                    ai_json = {
+                        "project_name": "Generated Project",
+                        "framework": "React",
+                        "files": {},
+                        "generated_from": request.user_input
+                    }
+
             except Exception as e:
                 print(f"❌ Error in generate(): {e}")
                 raise HTTPException(status_code=500, detail=str(e))
@@ -447,7 +600,7 @@ async def streaming_code_generation(request: ManagerRequest, conversation_id: st
             except Exception as e:
                 print(f"❌ Error saving to database: {e}")
 
-            # Compute exact tokens and credits using Anthropic count_tokens and deduct from user's daily tokens
+            # Bill the provider-reported usage of every agent in this request and deduct from user's daily tokens
             try:
                 if user_id_for_tokens:
                     assistant_text = json.dumps(ai_json, indent=2) if isinstance(ai_json, (dict, list)) else str(ai_json)
@@ -456,12 +609,7 @@ async def streaming_code_generation(request: ManagerRequest, conversation_id: st
                         {"role": "assistant", "content": [{"type": "text", "text": assistant_text}]},
                     ]
 
-                    credit  = await asyncio.to_thread(
-                        credits_for_messages,
-                        model="claude-sonnet-4-20250514",
-                        system=codegen_prompt,
-                        messages=messages_json,
-                    )
+                    credit = await compute_request_credits(codegen_prompt, messages_json)
                     _ = reserve_user_tokens(int(user_id_for_tokens), int(credit))
             except Exception as bill_err:
                 print(f"⚠️ Failed to deduct tokens for code generation: {bill_err}")
@@ -470,7 +618,7 @@ async def streaming_code_generation(request: ManagerRequest, conversation_id: st
         
 
         return StreamingResponse(
-            generate(),
+            stream_with_queue_events(generate()),
             media_type="text/event-stream",
             headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
         )
@@ -491,19 +639,27 @@ async def error_resolution_function(request: ManagerRequest, conversation_id: st
                 yield f"data: {json.dumps({'type': 'error', 'chunk': 'project_context is required for error resolution'})}\n\n"
                 return
             
-            # Step 1: Get analysis from summary agent
-            async for chunk in run_agent_with_token_limit_streaming(updating_and_error_summary_agent, request.user_input):
-                if chunk.strip():
-                    chunk = chunk.replace("```html","").replace("```", "").replace("html", "")
-                    formatted_chunk = chunk
-                    yield f"data: {json.dumps({'type': 'message', 'chunk': formatted_chunk})}\n\n"
-                    await asyncio.sleep(0.05)
-                    ai_message += chunk  
+            # Deterministic fixes first: a matching rule resolves the error without any LLM call
+            autofix = run_autofix_rules(request.user_input, current_json.get("files", {}))
+            if autofix:
+                ai_message = f"<p>🛠️ {autofix['description']}</p>"
+                yield f"data: {json.dumps({'type': 'message', 'chunk': ai_message})}\n\n"
+                resolution_stream = stream_autofix_resolution(current_json, autofix)
+            else:
+                # Step 1: Get analysis from summary agent
+                async for chunk in run_agent_with_token_limit_streaming(updating_and_error_summary_agent, request.user_input):
+                    if chunk.strip():
+                        chunk = chunk.replace("```html","").replace("```", "").replace("html", "")
+                        formatted_chunk = chunk
+                        yield f"data: {json.dumps({'type': 'message', 'chunk': formatted_chunk})}\n\n"
+                        await asyncio.sleep(0.05)
+                        ai_message += chunk  
+                resolution_stream = handle_error_resolution_streaming(request.user_input, current_json, conversation_id, try_autofix=False)
             
             final_project_json = None
             ai_resolver_content = "" 
             
-            async for chunk, final_json, ai_content in handle_error_resolution_streaming(request.user_input, current_json, conversation_id):
+            async for chunk, final_json, ai_content in resolution_stream:
                 if chunk:
                     yield f"data: {json.dumps(chunk)}\n\n"
                     await asyncio.sleep(0.005)
@@ -554,7 +710,7 @@ async def error_resolution_function(request: ManagerRequest, conversation_id: st
             yield f"data: {json.dumps({'type': 'error', 'chunk': str(e)})}\n\n"
     
     return StreamingResponse(
-        generate(),
+        stream_with_queue_events(generate()),
         media_type="text/event-stream",
         headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
     )
@@ -584,7 +740,7 @@ async def code_change_function(request: UserRequest, conversation_id: str, curre
             final_project_json = None
             ai_modifier_content = ""  # ✅ Store the AI modifier output
             
-            async for chunk, final_json, ai_content in code_update(request.user_input, current_json):
+            async for chunk, final_json, ai_content in code_update(request.user_input, current_json, conversation_id):
                 if chunk:
                     # Stream chunk to frontend
                     yield f"data: {json.dumps(chunk)}\n\n"
@@ -625,12 +781,7 @@ async def code_change_function(request: UserRequest, conversation_id: str, curre
                             {"role": "assistant", "content": [{"type": "text", "text": assistant_text}]},
                         ]
                         
-                        credit = await asyncio.to_thread(
-                            credits_for_messages,
-                            model="claude-sonnet-4-20250514",
-                            system=code_modifier_prompt,
-                            messages=messages_json,
-                        )
+                        credit = await compute_request_credits(code_modifier_sliced_prompt, messages_json)
                         _ = reserve_user_tokens(int(uid), int(credit))
                         print(f"✅ Tokens deducted for AI modifier content: {credit}")
                     elif uid:
@@ -658,7 +809,7 @@ async def code_change_function(request: UserRequest, conversation_id: str, curre
             yield f"data: {json.dumps({'type': 'error', 'chunk': str(e)})}\n\n"
     
     return StreamingResponse(
-        generate(),
+        stream_with_queue_events(generate()),
         media_type="text/event-stream",
         headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
     )
@@ -674,16 +825,9 @@ async def code_conversation_function(request: ManagerRequest, conversation_id: s
             nonlocal ai_message
             
             try:
-                chat_history = get_conversation_messages(conversation_id)
-
-                if chat_history is None:
-                    conversation_input = [{"role": "user", "content": request.user_input}]
-                else:
-                    conversation_input = chat_history + [
-                        {"role": "user", "content": request.user_input}
-                    ]
+                conversation_input = await build_conversation_input(conversation_id, request.user_input, code_conversation_agent.name)
                 # Stream the conversation response
-                async for chunk in run_agent_with_token_limit_streaming(code_conversation_agent, conversation_input, 1000):
+                async for chunk in run_agent_with_token_limit_streaming(code_conversation_agent, conversation_input):
                     if chunk.strip():
                         chunk = chunk.replace("```html","").replace("```", "").replace("html", "")
                         formatted_chunk = chunk
@@ -715,7 +859,7 @@ async def code_conversation_function(request: ManagerRequest, conversation_id: s
             yield f"data: {json.dumps({'done': True, 'type': 'complete', 'conversation_id': conversation_id, 'project_name': project_name})}\n\n"
         
         return StreamingResponse(
-            generate(),
+            stream_with_queue_events(generate()),
             media_type="text/event-stream",
             headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
         )
@@ -842,6 +986,11 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/api/v1/metrics")
+async def metrics():
+    """In-process counters and timings for this worker"""
+    return {**metrics_snapshot(), "autofix": autofix_stats(), "clients": client_pool_stats(), "admission": admission_stats(), "generation_limits": generation_limit_stats(), "routing": routing_stats(), "classifier": classifier_stats(), "prompt_cache": prompt_cache_stats()}
+
 
 
 
@@ -0,0 +1,56 @@
+"""
+In-process metrics for AI Builder Version 2
+Counters and timings per worker, exposed through /api/v1/metrics
+"""
+
+import os
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timings = {}
+
+
+def increment(name, value=1):
+    """Add ``value`` to a counter"""
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name, seconds):
+    """Record one duration sample (seconds) for a timing"""
+    with _lock:
+        timing = _timings.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+        timing["count"] += 1
+        timing["total"] += seconds
+        timing["max"] = max(timing["max"], seconds)
+
+
+def get_counter(name):
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def get_timing_avg(name, default=0.0):
+    """Average of a timing, or ``default`` before its first sample"""
+    with _lock:
+        timing = _timings.get(name)
+        return timing["total"] / timing["count"] if timing and timing["count"] else default
+
+
+def snapshot():
+    """Copy of all metrics for this worker process"""
+    with _lock:
+        return {
+            "pid": os.getpid(),
+            "counters": dict(_counters),
+            "timings": {
+                name: {
+                    "count": timing["count"],
+                    "avg": timing["total"] / timing["count"] if timing["count"] else 0.0,
+                    "max": timing["max"],
+                }
+                for name, timing in _timings.items()
+            },
+        }
@@ -1,34 +1,88 @@
 import json
 import tiktoken
-import time
 import os
-from datetime import datetime
 from dotenv import load_dotenv, find_dotenv
 from agents import Agent, OpenAIChatCompletionsModel, AsyncOpenAI, ModelSettings
+from .clients import get_anthropic_chat_client, get_openai_client
 
 # Load environment variables
 _ = load_dotenv(find_dotenv())
 CLAUDE_API_KEY = os.getenv("CLAUDE_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
+# "full" returns complete files from the modifier/resolver, "patch" returns edit blocks
+EDIT_OUTPUT_MODE = os.getenv("EDIT_OUTPUT_MODE", "full").strip().lower()
+
+# Large modifications are split into import-independent groups run concurrently
+MODIFIER_MAX_PARALLEL_GROUPS = int(os.getenv("MODIFIER_MAX_PARALLEL_GROUPS", "4"))
+MODIFIER_FANOUT_MIN_FILES = int(os.getenv("MODIFIER_FANOUT_MIN_FILES", "4"))
+
+# Files at least this large are sent to the modifier/resolver as relevant excerpts
+SLICE_MIN_FILE_CHARS = int(os.getenv("SLICE_MIN_FILE_CHARS", "8000"))
+
+# Skip the modifier files finder agent when local retrieval is confident
+RETRIEVAL_SKIP_FINDER = os.getenv("RETRIEVAL_SKIP_FINDER", "true").strip().lower() in ("1", "true", "yes")
+
+# Route small edits to fast_llm_model; requests scoring above FAST_ROUTE_MAX_SCORE use llm_model
+MODEL_ROUTING_ENABLED = os.getenv("MODEL_ROUTING_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+FAST_ROUTE_MAX_SCORE = float(os.getenv("FAST_ROUTE_MAX_SCORE", "3.0"))
+
+# New projects scoring at or below PIPELINE_SIMPLE_MAX_SCORE skip the planner and summary agents
+PIPELINE_GATE_ENABLED = os.getenv("PIPELINE_GATE_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+PIPELINE_SIMPLE_MAX_SCORE = float(os.getenv("PIPELINE_SIMPLE_MAX_SCORE", "2.0"))
+# "combined": one call returns the plan and the user summary; "separate": planner then summary agent
+PLANNING_MODE = os.getenv("PLANNING_MODE", "combined").strip().lower()
+# First message of a project: one call returns the task and the project name
+FIRST_TURN_ROUTER_ENABLED = os.getenv("FIRST_TURN_ROUTER_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+# Name new projects locally and fetch the suggested name in the background (sent later as an SSE event)
+BACKGROUND_NAMING_ENABLED = os.getenv("BACKGROUND_NAMING_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+# How long the final event of a stream waits for the background name
+LATE_NAME_WAIT_SECONDS = float(os.getenv("LATE_NAME_WAIT_SECONDS", "5"))
+
+# Answer the manager's task decision locally (rules + naive Bayes) when at least this confident
+LOCAL_CLASSIFIER_ENABLED = os.getenv("LOCAL_CLASSIFIER_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+LOCAL_CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("LOCAL_CLASSIFIER_MIN_CONFIDENCE", "0.9"))
+# JSONL log of the manager's decisions, the classifier's training data (empty disables logging).
+# It stores the raw user messages: keep it on a private volume and out of backups you share.
+MANAGER_DECISION_LOG = os.getenv("MANAGER_DECISION_LOG", "manager_decisions.jsonl")
+# Above this size the log is rotated to <log>.1 (one rotated file is kept)
+MANAGER_DECISION_LOG_MAX_BYTES = int(os.getenv("MANAGER_DECISION_LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+
+# Race latency-sensitive agents against an alternate provider when the first token is late
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+# Seconds to wait for the primary's first token (its p95) before hedging
+HEDGE_FIRST_TOKEN_SECONDS = {
+    "Manager": 2.5,
+    "FirstTurnRouter": 2.5,
+    "NameSuggestion": 2.0,
+    "ProjectSummary": 3.0,
+    "UpdatingAndErrorSummary": 3.0,
+    **json.loads(os.getenv("HEDGE_FIRST_TOKEN_SECONDS", "{}")),
+}
+
 # Initialize external client and model
-external_client: AsyncOpenAI = AsyncOpenAI(
-    api_key=CLAUDE_API_KEY,
-    base_url="https://api.anthropic.com/v1/",
-)
+# Native Messages API rather than the OpenAI-compatible endpoint, which ignores prompt-caching markers
+external_client = get_anthropic_chat_client(CLAUDE_API_KEY)
 
 llm_model: OpenAIChatCompletionsModel = OpenAIChatCompletionsModel(
     model= "claude-sonnet-4-20250514", #"claude-haiku-4-5-20251001",#
     openai_client=external_client
 )
 
+# Faster model for small edits (see routing.py); output that fails to parse or validate escalates to llm_model
+fast_llm_model: OpenAIChatCompletionsModel = OpenAIChatCompletionsModel(
+    model=os.getenv("FAST_MODEL", "claude-haiku-4-5-20251001"),
+    openai_client=external_client
+)
+
 # Define web search tool configuration
 web_search_tool = {
     "type": "web_search_20250305",
     "name": "web_search"
 }
 
-external_client_2: AsyncOpenAI = AsyncOpenAI(
+external_client_2: AsyncOpenAI = get_openai_client(
+    "gemini",
     api_key=GEMINI_API_KEY,
     base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
 )
@@ -44,13 +98,9 @@ gemini_llm_model_2: OpenAIChatCompletionsModel = OpenAIChatCompletionsModel(
 )
  #"gemini-2.0-flash",
 class TokenManager:
-    """Enhanced Token Management Class for handling API rate limits"""
+    """Token counting and continuation state (rate limits live in rate_limiter.py)"""
     
-    def __init__(self, max_tokens_per_minute=8000, token_limit_threshold=7500):
-        self.max_tokens_per_minute = max_tokens_per_minute
-        self.token_limit_threshold = token_limit_threshold
-        self.tokens_used = 0
-        self.start_time = datetime.now()
+    def __init__(self):
         self.continuation_needed = False
         self.last_generated_content = ""
         try:
@@ -69,32 +119,6 @@ class TokenManager:
         except Exception:
             return max(1, len(str(text)) // 4)
 
-    def check_and_wait(self, estimated_response_tokens=500):
-        """Check token usage and wait if approaching limit"""
-        current_time = datetime.now()
-        elapsed_time = (current_time - self.start_time).total_seconds()
-        if elapsed_time >= 60:
-            self.tokens_used = 0
-            self.start_time = current_time
-            print("✅ Token counter reset - New minute started")
-            return
-        if self.tokens_used + estimated_response_tokens >= self.token_limit_threshold:
-            wait_time = 60 - elapsed_time
-            if wait_time > 0:
-                print(f"⏰ Token limit approaching ({self.tokens_used}/{self.token_limit_threshold})")
-                print(f"⏸️  Waiting {wait_time:.1f} seconds until next minute...")
-                time.sleep(wait_time)
-                self.tokens_used = 0
-                self.start_time = datetime.now()
-                print("✅ Wait complete - Continuing...")
-
-    def add_tokens(self, tokens):
-        """Add tokens to usage counter"""
-        self.tokens_used += tokens
-        if self.tokens_used > self.max_tokens_per_minute:
-            self.tokens_used = self.max_tokens_per_minute
-        print(f"📊 Tokens used this minute: {self.tokens_used}/{self.max_tokens_per_minute}")
-
     def set_continuation_needed(self, content):
         """Mark that continuation is needed and store the last content"""
         self.continuation_needed = True
@@ -180,8 +204,10 @@ class ProjectContext:
 # Import prompts from local module using relative import
 from .prompts import (
     manager_prompt, planner_prompt, codegen_prompt,
-    error_files_finder_prompt, error_resolving_prompt,
-    modifier_files_finder_prompt, code_modifier_prompt, code_conversation_prompt, project_summary_prompt, name_suggest_prompt, updating_and_error_summary_prompt
+    error_files_finder_prompt,
+    modifier_files_finder_prompt, code_conversation_prompt, project_summary_prompt, name_suggest_prompt, updating_and_error_summary_prompt,
+    code_modifier_patch_prompt, error_resolving_patch_prompt,
+    code_modifier_sliced_prompt, error_resolving_sliced_prompt, plan_with_summary_prompt, first_turn_router_prompt
 )
 
 
@@ -192,26 +218,51 @@ from .prompts import (
 #     reasoning=True  # Enable extended thinking
 # )
 
+# Ask OpenAI-compatible providers to report token usage on streamed responses (used for billing)
+usage_model_settings = ModelSettings(
+    include_usage=True,
+)
+
 gemini_model_settings = ModelSettings(
     temperature=0.2,
+    include_usage=True,
 )
 
 manager_agent = Agent(
     name="Manager",
     instructions=manager_prompt,
-    model=llm_model
+    model=llm_model,
+    model_settings=usage_model_settings
+)
+
+# First message of a project: task and project name in one call (FIRST_TURN_ROUTER_ENABLED)
+first_turn_router_agent = Agent(
+    name="FirstTurnRouter",
+    instructions=first_turn_router_prompt,
+    model=llm_model,
+    model_settings=usage_model_settings
 )
 
 planner_agent = Agent(
     name="ProjectPlanner",
     instructions=planner_prompt,
-    model=gemini_llm_model_2
+    model=gemini_llm_model_2,
+    model_settings=usage_model_settings
+)
+
+# Plan and localized user summary in one streamed call (PLANNING_MODE=combined)
+plan_summary_agent = Agent(
+    name="ProjectPlannerWithSummary",
+    instructions=plan_with_summary_prompt,
+    model=gemini_llm_model_2,
+    model_settings=usage_model_settings
 )
 
 codegen_agent = Agent(
     name="CodeGenerator", 
     instructions=codegen_prompt,
-    model=llm_model
+    model=llm_model,
+    model_settings=usage_model_settings
     # tools=[web_search_tool]  # Add tools parameter
 )
 
@@ -219,32 +270,52 @@ codegen_agent = Agent(
 error_files_finder_agent = Agent(
     name="ErrorFilesFinder",
     instructions=error_files_finder_prompt,
-    model=gemini_llm_model
+    model=gemini_llm_model,
+    model_settings=usage_model_settings
 )
 
 error_resolver_agent = Agent(
     name="ErrorResolver",
-    instructions=error_resolving_prompt,
-    model=llm_model
+    instructions=error_resolving_sliced_prompt,
+    model=llm_model,
+    model_settings=usage_model_settings
 )
 
 modifier_files_finder_agent = Agent(
     name="ChangeCodeAgent", 
     instructions=modifier_files_finder_prompt,
-    model=gemini_llm_model
+    model=gemini_llm_model,
+    model_settings=usage_model_settings
 )
 
 modifier_agent = Agent(
     name="CodeModifier",
-    instructions=code_modifier_prompt,
-    model=llm_model
+    instructions=code_modifier_sliced_prompt,
+    model=llm_model,
+    model_settings=usage_model_settings
+)
+
+# Patch-mode variants return search/replace edit blocks instead of full files
+patch_modifier_agent = Agent(
+    name="CodeModifierPatch",
+    instructions=code_modifier_patch_prompt,
+    model=llm_model,
+    model_settings=usage_model_settings
+)
+
+patch_error_resolver_agent = Agent(
+    name="ErrorResolverPatch",
+    instructions=error_resolving_patch_prompt,
+    model=llm_model,
+    model_settings=usage_model_settings
 )
 
 
 code_conversation_agent = Agent(
     name="CodeConversation",
     instructions=code_conversation_prompt,
-    model=gemini_llm_model
+    model=gemini_llm_model,
+    model_settings=usage_model_settings
 )
 
 project_summary_agent = Agent(
@@ -258,12 +329,33 @@ project_summary_agent = Agent(
 name_suggestion_agent = Agent(
     name="NameSuggestion",
     instructions=name_suggest_prompt,
-    model=gemini_llm_model
+    model=gemini_llm_model,
+    model_settings=usage_model_settings
 )
 
 
 updating_and_error_summary_agent = Agent(
     name="UpdatingAndErrorSummary",
     instructions=updating_and_error_summary_prompt,
-    model=gemini_llm_model
+    model=gemini_llm_model,
+    model_settings=usage_model_settings
 )
+
+
+# Alternate-provider copies of the latency-sensitive agents, used for hedged runs
+hedge_agents = {
+    agent.name: agent.clone(model=alternate_model)
+    for agent, alternate_model in (
+        (manager_agent, gemini_llm_model),
+        (first_turn_router_agent, gemini_llm_model),
+        (name_suggestion_agent, llm_model),
+        (project_summary_agent, llm_model),
+        (updating_and_error_summary_agent, llm_model),
+    )
+}
+
+# Fast-model copies of the edit agents, chosen by routing.py for small requests
+fast_agents = {
+    agent.name: agent.clone(name=f"{agent.name}Fast", model=fast_llm_model)
+    for agent in (modifier_agent, patch_modifier_agent, error_resolver_agent, patch_error_resolver_agent)
+}
@@ -0,0 +1,138 @@
+"""
+Edit-block applier for patch-mode agent output
+Applies search/replace edits with exact, whitespace-tolerant and fuzzy anchor matching
+"""
+
+import difflib
+
+# Minimum similarity for a fuzzy anchor match and the margin the best
+# candidate must keep over the runner-up to count as unambiguous
+FUZZY_MATCH_THRESHOLD = 0.9
+FUZZY_AMBIGUITY_MARGIN = 0.05
+
+
+def _normalize_line(line):
+    return " ".join(line.split())
+
+
+def _find_exact(content, search):
+    """Return the start offset of a unique exact match, None if absent"""
+    start = content.find(search)
+    if start == -1:
+        return None
+    if content.find(search, start + 1) != -1:
+        raise ValueError("search block matches more than one location")
+    return start
+
+
+def _find_line_window(lines, search_lines):
+    """Locate search lines ignoring indentation/spacing, then by fuzzy similarity.
+
+    Returns (first_line, last_line_exclusive) or None.
+    """
+    size = len(search_lines)
+    if size == 0 or size > len(lines):
+        return None
+
+    wanted = [_normalize_line(line) for line in search_lines]
+    normalized = [_normalize_line(line) for line in lines]
+
+    matches = [
+        i for i in range(len(lines) - size + 1)
+        if normalized[i:i + size] == wanted
+    ]
+    if len(matches) > 1:
+        raise ValueError("search block matches more than one location")
+    if matches:
+        return matches[0], matches[0] + size
+
+    # SequenceMatcher caches analysis of seq2, so keep the search text there
+    matcher = difflib.SequenceMatcher(None, "", "\n".join(wanted))
+    floor = FUZZY_MATCH_THRESHOLD - FUZZY_AMBIGUITY_MARGIN
+    scored = []
+    for i in range(len(lines) - size + 1):
+        matcher.set_seq1("\n".join(normalized[i:i + size]))
+        if matcher.real_quick_ratio() < floor or matcher.quick_ratio() < floor:
+            continue
+        scored.append((matcher.ratio(), i))
+    if not scored:
+        return None
+    scored.sort(reverse=True)
+
+    best_ratio, best_index = scored[0]
+    if best_ratio < FUZZY_MATCH_THRESHOLD:
+        return None
+    # Windows shifted by a line or two overlap the best match; only a
+    # separate region scoring nearly as well makes the anchor ambiguous
+    for ratio, index in scored[1:]:
+        if ratio <= best_ratio - FUZZY_AMBIGUITY_MARGIN:
+            break
+        if abs(index - best_index) >= size:
+            raise ValueError("search block fuzzily matches more than one location")
+    return best_index, best_index + size
+
+
+def apply_edit(content, search, replace):
+    """Apply one search/replace edit. Raises ValueError on a missing or ambiguous anchor."""
+    if not search:
+        if content.strip():
+            raise ValueError("empty search block on a non-empty file")
+        return replace
+
+    start = _find_exact(content, search)
+    if start is not None:
+        return content[:start] + replace + content[start + len(search):]
+
+    lines = content.split("\n")
+    search_lines = search.strip("\n").split("\n")
+    window = _find_line_window(lines, search_lines)
+    if window is None:
+        raise ValueError(f"search block not found: {search_lines[0][:80]!r}")
+
+    first, last = window
+    replacement = replace.strip("\n").split("\n") if replace.strip("\n") else []
+    return "\n".join(lines[:first] + replacement + lines[last:])
+
+
+def apply_edit_blocks(content, edits):
+    """Apply a list of {"search", "replace"} edits in order.
+
+    Every edit must land; any missing or ambiguous anchor aborts the whole
+    file so a partially patched file is never returned.
+    """
+    if not isinstance(edits, list):
+        raise ValueError("edits must be a list")
+    for index, edit in enumerate(edits):
+        if not isinstance(edit, dict):
+            raise ValueError(f"edit {index} is not an object")
+        search = edit.get("search", "")
+        replace = edit.get("replace", "")
+        if not isinstance(search, str) or not isinstance(replace, str):
+            raise ValueError(f"edit {index} has non-string search/replace")
+        try:
+            content = apply_edit(content, search, replace)
+        except ValueError as e:
+            raise ValueError(f"edit {index}: {e}")
+    return content
+
+
+def resolve_file_output(file_path, value, originals):
+    """Turn one agent output value into final file content.
+
+    ``value`` is either the complete file content (full-file mode) or
+    ``{"edits": [...]}`` (patch mode). Returns None when the patch cannot be
+    applied so the caller can fall back to full-file mode for that file.
+    """
+    if isinstance(value, str):
+        return value
+    if not isinstance(value, dict) or "edits" not in value:
+        print(f"⚠️ Unrecognized output for {file_path}: {type(value).__name__}")
+        return None
+    if file_path not in originals:
+        print(f"⚠️ Patch for unknown file {file_path}")
+        return None
+    try:
+        return apply_edit_blocks(originals[file_path] or "", value["edits"])
+    except ValueError as e:
+        print(f"⚠️ Patch failed for {file_path}: {e}")
+        return None
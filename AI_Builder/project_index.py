@@ -0,0 +1,95 @@
+"""
+Compact project index for file-selection agents
+Summarizes each file (size, imports, exports, routes) instead of sending its contents
+"""
+
+import json
+import re
+
+from .import_graph import parse_imports, resolve_import, is_source_file
+
+EXPORT_PATTERNS = (
+    # export default function Navbar / export default class Navbar
+    re.compile(r"export\s+default\s+(?:async\s+)?(?:function\*?|class)\s+([A-Za-z_$][\w$]*)"),
+    # export function x / export const x / export class X
+    re.compile(r"export\s+(?:async\s+)?(?:function\*?|const|let|var|class)\s+([A-Za-z_$][\w$]*)"),
+    # export default Navbar;
+    re.compile(r"export\s+default\s+([A-Za-z_$][\w$]*)\s*;?\s*$", re.MULTILINE),
+)
+EXPORT_LIST_PATTERN = re.compile(r"export\s*\{([^}]*)\}")
+ROUTE_PATTERNS = (
+    re.compile(r"<Route\b[^>]*?\bpath\s*=\s*[{]?\s*['\"`]([^'\"`]+)['\"`]"),
+    re.compile(r"\bpath\s*:\s*['\"`](/[^'\"`]*)['\"`]"),
+)
+
+
+def extract_exports(content):
+    """Names exported by a JS/JSX module, in source order"""
+    names = []
+    for pattern in EXPORT_PATTERNS:
+        for match in pattern.finditer(content):
+            if match.group(1) not in names and match.group(1) not in ("function", "class", "async"):
+                names.append(match.group(1))
+    for match in EXPORT_LIST_PATTERN.finditer(content):
+        for item in match.group(1).split(","):
+            name = item.split(" as ")[-1].strip()
+            if name and name not in names:
+                names.append(name)
+    return names
+
+
+def extract_routes(content):
+    """Route paths declared via <Route path=...> or route objects"""
+    routes = []
+    for pattern in ROUTE_PATTERNS:
+        for match in pattern.finditer(content):
+            if match.group(1) not in routes:
+                routes.append(match.group(1))
+    return routes
+
+
+def summarize_file(file_path, content, project_files):
+    """Index entry for one file; empty fields are omitted to keep it small"""
+    content = content if isinstance(content, str) else json.dumps(content)
+    entry = {"size": len(content)}
+
+    if file_path.endswith("package.json"):
+        try:
+            package = json.loads(content)
+            deps = list(package.get("dependencies", {}).keys()) + list(package.get("devDependencies", {}).keys())
+            if deps:
+                entry["dependencies"] = deps
+        except (json.JSONDecodeError, AttributeError):
+            pass
+        return entry
+
+    if not is_source_file(file_path):
+        return entry
+
+    imports = []
+    for specifier in parse_imports(content):
+        imports.append(resolve_import(file_path, specifier, project_files) or specifier)
+    if imports:
+        entry["imports"] = imports
+
+    if not file_path.endswith(".css"):
+        exports = extract_exports(content)
+        if exports:
+            entry["exports"] = exports
+        routes = extract_routes(content)
+        if routes:
+            entry["routes"] = routes
+    return entry
+
+
+def build_project_index(project):
+    """Structure-plus-symbols view of a project for the files finder agent"""
+    files = project.get("files", {}) if isinstance(project, dict) else {}
+    return {
+        "project_name": project.get("project_name", "") if isinstance(project, dict) else "",
+        "framework": project.get("framework", "") if isinstance(project, dict) else "",
+        "files": {
+            file_path: summarize_file(file_path, content, files)
+            for file_path, content in files.items()
+        },
+    }
@@ -0,0 +1,108 @@
+"""
+Project naming off the critical path for AI Builder Version 2
+A local provisional name is used right away; the suggested name is computed in the background,
+saved, and pushed to the client as a late SSE event
+"""
+
+import asyncio
+import json
+import re
+import time
+
+from .metrics import increment, observe
+from .models import LATE_NAME_WAIT_SECONDS
+from .simple_database import update_project_name
+
+MAX_NAME_WORDS = 3
+# Request phrasing that says nothing about the project itself
+STOPWORDS = {
+    "a", "an", "the", "me", "my", "i", "we", "our", "you", "your", "for", "with", "and", "or", "of", "to", "in", "on",
+    "that", "this", "it", "is", "are", "be", "some", "simple", "basic", "new", "please", "can", "could", "would",
+    "want", "need", "like", "create", "build", "make", "generate", "design", "develop", "code", "write", "using",
+    "app", "application", "website", "web", "site", "page", "project", "react", "hi", "hello", "hey",
+}
+WORD_PATTERN = re.compile(r"[^\W\d_]+", re.UNICODE)
+FINAL_EVENT_MARKER = '"done": true'
+
+# Keeps background naming tasks alive after the request that started them returns
+_background_tasks = set()
+
+
+def provisional_project_name(user_input):
+    """Kebab-case name from the first meaningful words of the request"""
+    words = [word for word in WORD_PATTERN.findall((user_input or "").lower()) if len(word) > 1 and word not in STOPWORDS]
+    return "-".join(words[:MAX_NAME_WORDS]) or "new-project"
+
+
+async def _suggest_and_save(conversation_id, user_input, suggest):
+    start = time.perf_counter()
+    try:
+        project_name = await suggest(user_input)
+    except Exception as e:
+        print(f"⚠️ Background project naming failed, keeping the provisional name: {e}")
+        increment("naming.failed")
+        return None
+    await asyncio.to_thread(update_project_name, conversation_id, project_name)
+    observe("naming.background", time.perf_counter() - start)
+    print(f"📝 Project renamed to {project_name}")
+    return project_name
+
+
+def start_background_naming(conversation_id, user_input, suggest):
+    """Run ``suggest(user_input)`` in the background and save the result as the project name"""
+    increment("naming.background_started")
+    task = asyncio.create_task(_suggest_and_save(conversation_id, user_input, suggest))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def _name_event(naming):
+    if naming.cancelled() or naming.exception() is not None or not naming.result():
+        return None
+    return f"data: {json.dumps({'type': 'project_name', 'project_name': naming.result()})}\n\n"
+
+
+async def stream_with_project_name(stream, naming):
+    """Relay an SSE stream, adding a project_name event as soon as background naming finishes.
+
+    The final (``done``) event waits up to LATE_NAME_WAIT_SECONDS for the
+    name so short responses still deliver it.
+    """
+    sent = False
+    next_item = asyncio.ensure_future(stream.__anext__())
+    try:
+        while True:
+            done, _ = await asyncio.wait({next_item} if sent else {next_item, naming}, return_when=asyncio.FIRST_COMPLETED)
+            if not sent and naming.done():
+                sent = True
+                event = _name_event(naming)
+                if event:
+                    yield event
+            if next_item not in done:
+                continue
+            try:
+                item = next_item.result()
+            except StopAsyncIteration:
+                break
+            if not sent and FINAL_EVENT_MARKER in item:
+                try:
+                    await asyncio.wait_for(asyncio.shield(naming), LATE_NAME_WAIT_SECONDS)
+                except asyncio.TimeoutError:
+                    increment("naming.missed_stream")
+                except Exception:
+                    pass
+                sent = True
+                event = _name_event(naming) if naming.done() else None
+                if event:
+                    yield event
+            yield item
+            next_item = asyncio.ensure_future(stream.__anext__())
+    finally:
+        if not next_item.done():
+            next_item.cancel()
+            try:
+                await next_item
+            except BaseException:
+                pass
+        await stream.aclose()
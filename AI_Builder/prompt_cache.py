@@ -0,0 +1,77 @@
+"""
+Provider prompt caching for AI Builder Version 2
+Marks the static system prompt of Claude requests (sent through anthropic_messages.py) as cacheable,
+and reports cache hits per agent. The chat history is not marked: context_builder.py rewrites its
+front every turn, so a prefix ending in the history would never be read back
+"""
+
+import os
+
+from dotenv import load_dotenv, find_dotenv
+
+from .metrics import get_counter, snapshot
+
+_ = load_dotenv(find_dotenv())
+
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+# Shorter system prompts are below the provider's minimum cacheable size (about 1024 tokens)
+PROMPT_CACHE_MIN_CHARS = int(os.getenv("PROMPT_CACHE_MIN_CHARS", "4000"))
+
+CACHE_CONTROL = {"type": "ephemeral"}
+SYSTEM_ROLES = ("system", "developer")
+
+
+def _content_chars(content):
+    if isinstance(content, str):
+        return len(content)
+    if isinstance(content, list):
+        return sum(len(part.get("text", "")) for part in content if isinstance(part, dict))
+    return 0
+
+
+def _mark(message):
+    """Put a cache breakpoint on the last text part of a message"""
+    content = message.get("content")
+    parts = [{"type": "text", "text": content}] if isinstance(content, str) else content
+    if not isinstance(parts, list) or not parts or not isinstance(parts[-1], dict) or parts[-1].get("type") != "text":
+        return False
+    parts[-1] = {**parts[-1], "cache_control": CACHE_CONTROL}
+    message["content"] = parts
+    return True
+
+
+def add_cache_markers(messages):
+    """Mark the leading system prompt once it is long enough to be cached.
+
+    Returns the number of cache breakpoints added; history and the new message are never marked.
+    """
+    markers = 0
+    prefix_chars = 0
+    for message in messages:
+        if not isinstance(message, dict) or message.get("role") not in SYSTEM_ROLES:
+            break
+        prefix_chars += _content_chars(message.get("content"))
+        if prefix_chars >= PROMPT_CACHE_MIN_CHARS and _mark(message):
+            markers += 1
+    return markers
+
+
+def prompt_cache_stats():
+    """Cached share of provider-reported input tokens per agent"""
+    agents = {}
+    for name in snapshot()["counters"]:
+        if name.startswith("usage.") and name.endswith(".cached_tokens"):
+            agent_name = name[len("usage."):-len(".cached_tokens")]
+            input_tokens = get_counter(f"usage.{agent_name}.input_tokens")
+            cached_tokens = get_counter(name)
+            agents[agent_name] = {
+                "input_tokens": input_tokens,
+                "cached_tokens": cached_tokens,
+                "hit_ratio": round(cached_tokens / input_tokens, 3) if input_tokens else 0.0,
+            }
+    return {
+        "enabled": PROMPT_CACHE_ENABLED,
+        "min_chars": PROMPT_CACHE_MIN_CHARS,
+        "marked_requests": get_counter("prompt_cache.marked_requests"),
+        "agents": agents,
+    }
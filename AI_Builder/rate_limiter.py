@@ -0,0 +1,239 @@
+"""
+Provider rate limiting for AI Builder Version 2
+Async token buckets per provider and per model, shared across workers through Redis
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+
+from dotenv import load_dotenv, find_dotenv
+
+from .metrics import increment, observe
+from .state_store import get_redis, mark_redis_failed
+from .token_counter import count_messages_locally, count_text_tokens
+
+_ = load_dotenv(find_dotenv())
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+# Longest a call waits for capacity before it goes ahead anyway (the debt delays later calls)
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "30"))
+# Without Redis each worker only gets its share of the limits
+WORKER_COUNT = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+# Per-minute limits keyed by provider or model name; override with PROVIDER_RATE_LIMITS (JSON)
+DEFAULT_RATE_LIMITS = {
+    "anthropic": {"requests_per_minute": 4000},
+    "gemini": {"requests_per_minute": 2000},
+    "claude-sonnet-4-20250514": {"requests_per_minute": 4000, "input_tokens_per_minute": 2000000, "output_tokens_per_minute": 400000},
+    "claude-haiku-4-5-20251001": {"requests_per_minute": 4000, "input_tokens_per_minute": 4000000, "output_tokens_per_minute": 800000},
+    "gemini-2.5-flash": {"requests_per_minute": 1000, "tokens_per_minute": 1000000},
+    "gemini-2.0-flash": {"requests_per_minute": 2000, "tokens_per_minute": 4000000},
+}
+RATE_LIMITS = {**DEFAULT_RATE_LIMITS, **json.loads(os.getenv("PROVIDER_RATE_LIMITS", "{}"))}
+
+# Expected output tokens per agent, reserved up front and reconciled with actual usage
+OUTPUT_TOKEN_ESTIMATES = {
+    "CodeGenerator": 16000,
+    "CodeModifier": 4000,
+    "CodeModifierPatch": 1500,
+    "ErrorResolver": 4000,
+    "ErrorResolverPatch": 1500,
+    "ProjectPlanner": 2000,
+    "ProjectPlannerWithSummary": 2500,
+}
+DEFAULT_OUTPUT_ESTIMATE = 1000
+
+LIMIT_KINDS = ("requests", "input_tokens", "output_tokens", "tokens")
+
+# KEYS: bucket keys. ARGV: now, force, ttl, then capacity, refill per second, cost for each key.
+# Takes the cost from every bucket or from none; returns the seconds to wait (as a string).
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local force = ARGV[2] == "1"
+local ttl = tonumber(ARGV[3])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+  local base = 3 + (i - 1) * 3
+  local capacity = tonumber(ARGV[base + 1])
+  local rate = tonumber(ARGV[base + 2])
+  local cost = tonumber(ARGV[base + 3])
+  local state = redis.call("HMGET", key, "level", "ts")
+  local level = tonumber(state[1]) or capacity
+  local ts = tonumber(state[2]) or now
+  level = math.min(capacity, level + math.max(0, now - ts) * rate)
+  levels[i] = level
+  if not force and cost > 0 and level < math.min(cost, capacity) then
+    wait = math.max(wait, (math.min(cost, capacity) - level) / rate)
+  end
+end
+if wait > 0 then
+  return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+  local base = 3 + (i - 1) * 3
+  local capacity = tonumber(ARGV[base + 1])
+  local cost = tonumber(ARGV[base + 3])
+  redis.call("HSET", key, "level", tostring(math.min(capacity, levels[i] - cost)), "ts", tostring(now))
+  redis.call("EXPIRE", key, ttl)
+end
+return "0"
+"""
+
+_scripts = {}
+_local_buckets = {}
+
+
+def provider_for_model(model_name):
+    if model_name.startswith("claude"):
+        return "anthropic"
+    if model_name.startswith("gemini"):
+        return "gemini"
+    return "openai"
+
+
+def agent_model_name(agent):
+    model = getattr(agent, "model", None)
+    return model if isinstance(model, str) else getattr(model, "model", "") or ""
+
+
+def bucket_specs(model_name):
+    """(key, capacity, refill per second, kind) for every configured limit of a model and its provider"""
+    specs = []
+    for scope in (provider_for_model(model_name), model_name):
+        limits = RATE_LIMITS.get(scope, {})
+        for kind in LIMIT_KINDS:
+            per_minute = limits.get(f"{kind}_per_minute")
+            if per_minute:
+                specs.append((f"ratelimit:{scope}:{kind}", float(per_minute), per_minute / 60.0, kind))
+    return specs
+
+
+def estimate_input_tokens(agent, input_data):
+    """Calibrated local estimate of the prompt size (instructions + input)"""
+    instructions = agent.instructions if isinstance(agent.instructions, str) else ""
+    try:
+        if isinstance(input_data, list):
+            return count_messages_locally(instructions, input_data)
+        return count_text_tokens(instructions) + count_text_tokens(str(input_data))
+    except RuntimeError:
+        return (len(instructions) + len(str(input_data))) // 4
+
+
+def _costs(kind, input_tokens, output_tokens, requests):
+    return {
+        "requests": requests,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "tokens": input_tokens + output_tokens,
+    }[kind]
+
+
+def _local_take(specs, costs, now, force):
+    """In-process version of TOKEN_BUCKET_SCRIPT"""
+    levels = []
+    wait = 0.0
+    for (key, capacity, rate, _), cost in zip(specs, costs):
+        capacity, rate = capacity / WORKER_COUNT, rate / WORKER_COUNT
+        level, ts = _local_buckets.get(key, (capacity, now))
+        level = min(capacity, level + max(0.0, now - ts) * rate)
+        levels.append(level)
+        if not force and cost > 0 and level < min(cost, capacity):
+            wait = max(wait, (min(cost, capacity) - level) / rate)
+    if wait > 0:
+        return wait
+    for (key, capacity, _, _), cost, level in zip(specs, costs, levels):
+        _local_buckets[key] = (min(capacity / WORKER_COUNT, level - cost), now)
+    return 0.0
+
+
+async def take(specs, costs, force=False):
+    """Take ``costs`` from all buckets atomically; returns seconds to wait (0 when taken)"""
+    if not specs:
+        return 0.0
+    now = time.time()
+    client = get_redis()
+    if client is not None:
+        try:
+            script = _scripts.get(id(client))
+            if script is None:
+                script = _scripts[id(client)] = client.register_script(TOKEN_BUCKET_SCRIPT)
+            args = [now, "1" if force else "0", 120]
+            for (_, capacity, rate, _), cost in zip(specs, costs):
+                args.extend([capacity, rate, cost])
+            return float(await script(keys=[spec[0] for spec in specs], args=args))
+        except Exception as e:
+            mark_redis_failed(e)
+    return _local_take(specs, costs, now, force)
+
+
+class Reservation:
+    """Tokens reserved for one agent run; ``settle`` replaces the estimate with actual usage"""
+
+    def __init__(self, agent_name, model_name, specs, input_tokens, output_tokens):
+        self.agent_name = agent_name
+        self.model_name = model_name
+        self.specs = specs
+        self.estimated_input = input_tokens
+        self.estimated_output = output_tokens
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.usage_seen = False
+
+    def add_usage(self, usage):
+        """Count a provider usage object towards this run"""
+        if usage is None:
+            return
+        self.input_tokens += getattr(usage, "input_tokens", 0) or 0
+        self.output_tokens += getattr(usage, "output_tokens", 0) or 0
+        self.usage_seen = True
+
+    async def settle(self):
+        """Return unused tokens to the buckets, or take the overrun"""
+        if not self.specs or not self.usage_seen:
+            return  # no usage reported: the estimate stays as the charge
+        delta_input = self.input_tokens - self.estimated_input
+        delta_output = self.output_tokens - self.estimated_output
+        costs = [_costs(kind, delta_input, delta_output, 0) for *_, kind in self.specs]
+        if any(costs):
+            await take(self.specs, costs, force=True)
+            increment(f"ratelimit.{self.model_name}.reconciled_tokens", delta_input + delta_output)
+
+
+async def reserve(agent, input_data, output_tokens=None):
+    """Wait (without blocking the event loop) until the agent's model has capacity, then reserve it"""
+    model_name = agent_model_name(agent)
+    specs = bucket_specs(model_name) if RATE_LIMIT_ENABLED else []
+    input_tokens = estimate_input_tokens(agent, input_data) if specs else 0
+    if output_tokens is None:
+        # Fast-route copies (routing.py) write the same kind of output as the agent they stand in for
+        estimate_name = agent.name if agent.name in OUTPUT_TOKEN_ESTIMATES else agent.name.removesuffix("Fast")
+        output_tokens = OUTPUT_TOKEN_ESTIMATES.get(estimate_name, DEFAULT_OUTPUT_ESTIMATE)
+    reservation = Reservation(agent.name, model_name, specs, input_tokens, output_tokens)
+    if not specs:
+        return reservation
+
+    costs = [_costs(kind, input_tokens, output_tokens, 1) for *_, kind in specs]
+    start = time.monotonic()
+    while True:
+        wait = await take(specs, costs)
+        if wait <= 0:
+            break
+        remaining = RATE_LIMIT_MAX_WAIT_SECONDS - (time.monotonic() - start)
+        if remaining <= 0:
+            print(f"⚠️ Rate limit wait for {model_name} exceeded {RATE_LIMIT_MAX_WAIT_SECONDS:.0f}s, proceeding")
+            increment(f"ratelimit.{model_name}.wait_exceeded")
+            await take(specs, costs, force=True)
+            break
+        print(f"⏸️ Rate limit reached for {model_name}, waiting {min(wait, remaining):.1f}s")
+        # Jitter so waiting workers don't all retry at the same instant
+        await asyncio.sleep(min(wait, remaining) + random.uniform(0, 0.05))
+
+    waited = time.monotonic() - start
+    if waited > 0.01:
+        increment(f"ratelimit.{model_name}.waits")
+        observe(f"ratelimit.{model_name}.wait", waited)
+    return reservation
@@ -0,0 +1,194 @@
+"""
+Local retrieval index for picking files to modify
+BM25 over file contents, paths, component names, routes and CSS classes, maintained per conversation
+"""
+
+import hashlib
+import math
+import re
+from collections import Counter, OrderedDict
+
+from .import_graph import cached_import_graph
+from .project_index import extract_exports, extract_routes
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Extra weight for terms from the path and exported/route names
+PATH_WEIGHT = 3
+SYMBOL_WEIGHT = 3
+ROUTE_WEIGHT = 2
+
+# Files whose path/exported names match the query are candidates; one stays
+# selected if it scores at least this share of the best such file
+SELECT_RATIO = 0.6
+MAX_SELECTED_FILES = 3
+MAX_RELATED_FILES = 3
+# Confident only if the selection covers this share of the query terms
+MIN_TERM_COVERAGE = 0.5
+
+# Projects larger than this get a narrowed index when the finder still runs
+NARROW_MIN_FILES = 30
+NARROW_TOP_FILES = 20
+CORE_FILES = ("src/App.jsx", "src/main.jsx", "src/index.css", "package.json")
+
+MAX_CACHED_CONVERSATIONS = 256
+_document_cache = OrderedDict()
+
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9]*")
+CAMEL_PATTERN = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+CREATION_PATTERN = re.compile(
+    r"\b(add|create|new|build|implement|make)\b[^.!?\n]{0,40}\b(page|pages|screen|route|component|modal|file|section|feature)\b",
+    re.IGNORECASE,
+)
+STOPWORDS = {
+    "the", "and", "for", "with", "make", "please", "can", "you", "this", "that", "from", "into", "all",
+    "should", "want", "need", "change", "update", "use", "using", "are", "its", "our", "their", "more",
+    "src", "jsx", "js", "import", "export", "default", "const", "return", "function", "react",
+    "class", "classname", "div", "span",
+}
+
+
+def tokenize(text):
+    """Lowercase terms with camelCase/PascalCase/kebab-case split and a light plural stem"""
+    terms = []
+    for identifier in IDENTIFIER_PATTERN.findall(text or ""):
+        for part in CAMEL_PATTERN.findall(identifier):
+            part = part.lower()
+            if len(part) < 3 or part.isdigit() or part in STOPWORDS:
+                continue
+            if len(part) > 3 and part.endswith("s") and not part.endswith("ss"):
+                part = part[:-1]
+            terms.append(part)
+    return terms
+
+
+def _document_terms(file_path, content):
+    """Weighted term counts and the "name" terms (path and exports) that say what a file defines"""
+    terms = Counter(tokenize(content))
+    name_terms = set()
+    for term in tokenize(file_path.replace("/", " ").replace(".", " ")):
+        terms[term] += PATH_WEIGHT
+        name_terms.add(term)
+    if file_path.endswith((".jsx", ".js", ".tsx", ".ts")):
+        for name in extract_exports(content):
+            for term in tokenize(name):
+                terms[term] += SYMBOL_WEIGHT
+                name_terms.add(term)
+        for route in extract_routes(content):
+            for term in tokenize(route):
+                terms[term] += ROUTE_WEIGHT
+    return terms, name_terms
+
+
+def _documents(conversation_id, project_files):
+    """Per-file term counts, re-tokenizing only files whose content hash changed"""
+    cache = {}
+    if conversation_id:
+        cache = _document_cache.pop(conversation_id, None) or {}
+        _document_cache[conversation_id] = cache
+        while len(_document_cache) > MAX_CACHED_CONVERSATIONS:
+            _document_cache.popitem(last=False)
+
+    documents = {}
+    for file_path, content in project_files.items():
+        if not isinstance(content, str):
+            continue
+        digest = hashlib.sha1(content.encode("utf-8")).hexdigest()
+        cached = cache.get(file_path)
+        if not cached or cached[0] != digest:
+            terms, name_terms = _document_terms(file_path, content)
+            cached = (digest, terms, sum(terms.values()), name_terms)
+            cache[file_path] = cached
+        documents[file_path] = cached
+
+    for stale_path in [path for path in cache if path not in documents]:
+        del cache[stale_path]
+    return documents
+
+
+def rank_files(conversation_id, project_files, query):
+    """BM25-ranked [(path, score, matched_terms, defines)] for a query, best first, score > 0 only.
+
+    ``defines`` is True when a matched term is part of the file's path or exported names.
+    """
+    query_terms = list(dict.fromkeys(tokenize(query)))
+    documents = _documents(conversation_id, project_files)
+    if not query_terms or not documents:
+        return []
+
+    doc_count = len(documents)
+    avg_length = sum(doc[2] for doc in documents.values()) / doc_count or 1
+    doc_freq = {term: sum(1 for doc in documents.values() if term in doc[1]) for term in query_terms}
+
+    ranked = []
+    for file_path, (_, terms, length, name_terms) in documents.items():
+        score = 0.0
+        matched = []
+        for term in query_terms:
+            tf = terms.get(term, 0)
+            if not tf:
+                continue
+            idf = math.log(1 + (doc_count - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            score += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+            matched.append(term)
+        if score > 0:
+            ranked.append((file_path, score, matched, any(term in name_terms for term in matched)))
+    ranked.sort(key=lambda item: (-item[1], item[0]))
+    return ranked
+
+
+def retrieve_files(conversation_id, project_files, query):
+    """Ranked candidates plus a confident selection that can replace the finder agent.
+
+    Returns {"ranked": [paths], "confident": bool, "files_to_modify": [...],
+    "related_files_to_update": [...]}; the selection lists are only filled
+    when confident.
+    """
+    ranked = rank_files(conversation_id, project_files, query)
+    result = {"ranked": [item[0] for item in ranked], "confident": False, "files_to_modify": [], "related_files_to_update": []}
+    if not ranked or CREATION_PATTERN.search(query or ""):
+        return result
+
+    # Only files that define what the query names (Navbar.jsx for "navbar") are targets;
+    # an outsider outscoring them means the query is about something else
+    defining = [item for item in ranked if item[3]]
+    if not defining or defining[0] is not ranked[0]:
+        return result
+    best = defining[0][1]
+    selected = [item for item in defining if item[1] >= SELECT_RATIO * best]
+    query_terms = set(tokenize(query))
+    covered = {term for item in selected for term in item[2]}
+    if len(selected) > MAX_SELECTED_FILES or len(covered) < MIN_TERM_COVERAGE * len(query_terms):
+        return result
+
+    # Related files: modules the selection imports (child components, hooks) that also match the query
+    graph = cached_import_graph(conversation_id, project_files)
+    scores = {item[0]: item[1] for item in ranked}
+    selected_paths = [item[0] for item in selected]
+    neighbours = []
+    for path in selected_paths:
+        for neighbour in graph.get(path, []):
+            if neighbour not in selected_paths and neighbour not in neighbours and neighbour in scores:
+                neighbours.append(neighbour)
+    neighbours.sort(key=lambda path: -scores[path])
+
+    result.update(
+        confident=True,
+        files_to_modify=selected_paths,
+        related_files_to_update=neighbours[:MAX_RELATED_FILES],
+    )
+    return result
+
+
+def narrow_project_index(project_index, ranked):
+    """Keep index entries only for top-ranked and core files of a large project; other paths are listed bare"""
+    files = project_index.get("files", {})
+    if len(files) <= NARROW_MIN_FILES or not ranked:
+        return project_index
+    keep = list(dict.fromkeys([path for path in ranked[:NARROW_TOP_FILES] if path in files] + [path for path in CORE_FILES if path in files]))
+    return {
+        **project_index,
+        "files": {path: files[path] for path in keep},
+        "other_files": [path for path in files if path not in keep],
+    }
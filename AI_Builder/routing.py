@@ -0,0 +1,127 @@
+"""
+Complexity-based model routing for AI Builder Version 2
+Small edits go to the fast model; output that fails to parse or validate escalates to the large model
+"""
+
+import re
+from collections import Counter
+
+from .autofix import JSX_ATTRIBUTES
+from .metrics import increment, observe, get_counter, snapshot
+from .models import MODEL_ROUTING_ENABLED, FAST_ROUTE_MAX_SCORE, fast_agents, llm_model, fast_llm_model
+from .slicing import split_slice_key
+
+# Score weights: per target file, per new file, per 8k characters of code, per 500 characters of query
+FILE_WEIGHT = 1.0
+NEW_FILE_WEIGHT = 1.0
+CODE_CHARS_UNIT = 8000
+QUERY_CHARS_UNIT = 500
+# Errors whose fix usually spans state or component structure, not a local edit
+COMPLEX_ERROR_TYPES = {"hook_error", "state_error", "router_error", "runtime_error", "unknown"}
+COMPLEX_ERROR_WEIGHT = 2.0
+
+# USD per million tokens (input, output), used for the per-route cost report
+MODEL_PRICES = {
+    "claude-sonnet-4-20250514": (3.0, 15.0),
+    "claude-haiku-4-5-20251001": (1.0, 5.0),
+}
+
+# JSX open/close tags; "<" right after an identifier is a TypeScript generic, not a tag
+OPEN_TAG_PATTERN = re.compile(rf"(?<![\w$.])<([A-Za-z][\w.]*)\b{JSX_ATTRIBUTES}(/?)>")
+CLOSE_TAG_PATTERN = re.compile(r"</([A-Za-z][\w.]*)\s*>")
+
+_routed_agents = set()
+
+
+def score_edit(files, query, error_type=None):
+    """Complexity score of an edit request from its target files, query and error type"""
+    new_files = sum(1 for content in files.values() if not content)
+    code_chars = sum(len(content or "") for content in files.values())
+    score = (
+        FILE_WEIGHT * (len(files) - new_files)
+        + NEW_FILE_WEIGHT * new_files
+        + code_chars / CODE_CHARS_UNIT
+        + len(query or "") / QUERY_CHARS_UNIT
+    )
+    if error_type is not None and error_type in COMPLEX_ERROR_TYPES:
+        score += COMPLEX_ERROR_WEIGHT
+    return round(score, 2)
+
+
+def route_edit(agent, fallback_agent, files, query, error_type=None):
+    """Pick the agents for an edit: (agent, fallback_agent, escalation_agent, route).
+
+    On the fast route the fallback for files that fail to apply or validate
+    is the large full-file modifier/resolver, and a response that can't be
+    parsed at all is escalated to the large ``agent``.
+    """
+    fast_agent = fast_agents.get(agent.name)
+    score = score_edit(files, query, error_type)
+    route = "fast" if MODEL_ROUTING_ENABLED and fast_agent is not None and score <= FAST_ROUTE_MAX_SCORE else "large"
+    print(f"🧭 {agent.name} routed to the {route} model (score {score})")
+    _routed_agents.add(agent.name)
+    increment(f"routing.{agent.name}.{route}")
+    if route == "large":
+        return agent, fallback_agent, None, route
+    large_full_file = fallback_agent or agent
+    return fast_agent, large_full_file, agent, route
+
+
+def jsx_is_balanced(content):
+    """Every JSX element and fragment is closed and braces pair up (catches truncated output)"""
+    opened = Counter(match.group(1) for match in OPEN_TAG_PATTERN.finditer(content) if not match.group(2))
+    closed = Counter(CLOSE_TAG_PATTERN.findall(content))
+    return opened == closed and content.count("<>") == content.count("</>") and content.count("{") == content.count("}")
+
+
+def validate_edit_output(key, content):
+    """Cheap structural check of a returned file; excerpts are left to the splice"""
+    file_path, line_range = split_slice_key(key)
+    if line_range is not None or not file_path.endswith((".jsx", ".tsx")):
+        return True
+    return jsx_is_balanced(content)
+
+
+def record_route_latency(agent_name, route, seconds):
+    observe(f"routing.{agent_name}.{route}.latency", seconds)
+
+
+def record_escalation(agent, reason):
+    """Count a fast-route run whose output (or part of it) went to the large model"""
+    for base_name, fast_agent in fast_agents.items():
+        if fast_agent is agent:
+            increment(f"routing.{base_name}.fast.escalated")
+            increment(f"routing.{base_name}.fast.escalated.{reason}")
+            return
+
+
+def _route_cost(agent_name, model_name):
+    input_tokens = get_counter(f"usage.{agent_name}.input_tokens")
+    output_tokens = get_counter(f"usage.{agent_name}.output_tokens")
+    input_price, output_price = MODEL_PRICES.get(model_name, (0.0, 0.0))
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cost_usd": round((input_tokens * input_price + output_tokens * output_price) / 1_000_000, 4),
+    }
+
+
+def routing_stats():
+    """Per-agent, per-route request counts, escalations, latency and token cost"""
+    timings = snapshot()["timings"]
+    stats = {}
+    for agent_name in sorted(_routed_agents):
+        fast_agent = fast_agents.get(agent_name)
+        routes = {"large": (agent_name, llm_model.model)}
+        if fast_agent is not None:
+            routes["fast"] = (fast_agent.name, fast_llm_model.model)
+        stats[agent_name] = {
+            route: {
+                "requests": get_counter(f"routing.{agent_name}.{route}"),
+                "escalated": get_counter(f"routing.{agent_name}.{route}.escalated"),
+                "latency": timings.get(f"routing.{agent_name}.{route}.latency"),
+                **_route_cost(usage_name, model_name),
+            }
+            for route, (usage_name, model_name) in routes.items()
+        }
+    return stats
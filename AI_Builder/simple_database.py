@@ -612,14 +612,14 @@ def get_conversation_full(conversation_id: str):
     """Return the full conversation row details by id.
 
     Includes: id, user_id, session_name, is_active, current_json, history_jsons,
-    version_index, created_at, updated_at. Messages are fetched separately from ai_conversations_aimessage.
+    version_index, created_at, updated_at, workspace_id. Messages are fetched separately from ai_conversations_aimessage.
     """
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute(
             """
-            SELECT id, user_id, session_name, is_active, current_json, history_jsons, version_index, created_at, updated_at
+            SELECT id, user_id, session_name, is_active, current_json, history_jsons, version_index, created_at, updated_at, workspace_id
             FROM ai_conversations_aiconversation
             WHERE id = %s
             """,
@@ -638,6 +638,7 @@ def get_conversation_full(conversation_id: str):
             'version_index': r[6],
             'created_at': r[7].isoformat() if r[7] else None,
             'updated_at': r[8].isoformat() if r[8] else None,
+            'workspace_id': str(r[9]) if r[9] else None,
         }
     except Exception as e:
         print(f"Error getting full conversation: {e}")
@@ -0,0 +1,168 @@
+"""
+Relevance slicing for large files sent to the modifier/resolver agents
+Only the regions that matter are sent; returned excerpts are spliced back locally
+"""
+
+import re
+
+from .import_graph import is_source_file
+
+# Excerpt keys look like "src/App.jsx::L120-L164" (1-based, inclusive)
+SLICE_KEY_PATTERN = re.compile(r"^(.+)::L(\d+)-L(\d+)$")
+
+# Lines kept around each relevant line, and blocks small enough to send whole
+SLICE_CONTEXT_LINES = 20
+SLICE_MAX_BLOCK_LINES = 120
+# Above this share of the file, slicing saves too little to be worth it
+SLICE_MAX_COVERAGE = 0.6
+
+TOP_LEVEL_PATTERN = re.compile(r"^(?:export\s+)?(?:default\s+)?(?:async\s+)?(?:function|class|const|let|var)\b")
+DECLARED_NAME_PATTERN = re.compile(r"\b(?:function|class|const|let|var)\s+([A-Za-z_$][\w$]*)")
+QUOTED_PATTERN = re.compile(r"""["'“”‘’`]([^"'“”‘’`\n]{3,60})["'“”‘’`]""")
+WORD_PATTERN = re.compile(r"[A-Za-z][\w$-]{3,}")
+STOPWORDS = {
+    "this", "that", "with", "from", "have", "make", "into", "when", "then", "there", "their", "them",
+    "should", "would", "could", "please", "want", "need", "also", "just", "like", "page", "file", "files",
+    "code", "change", "update", "add", "remove", "error", "fix", "component", "section", "some", "more",
+    "react", "return", "const", "function", "import", "export", "default", "className",
+}
+
+
+def make_slice_key(file_path, start, end):
+    return f"{file_path}::L{start}-L{end}"
+
+
+def split_slice_key(key):
+    """Return (file_path, (start, end)) for an excerpt key, (key, None) otherwise"""
+    match = SLICE_KEY_PATTERN.match(key)
+    if not match:
+        return key, None
+    return match.group(1), (int(match.group(2)), int(match.group(3)))
+
+
+def _import_header_end(lines):
+    """Number of leading lines holding imports (and comments/blank lines between them)"""
+    end = 0
+    in_import = False
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped.startswith("import ") or in_import:
+            in_import = not (stripped.endswith(";") or re.search(r"""from\s+['"][^'"]+['"]""", stripped) or re.match(r"""import\s+['"]""", stripped))
+            end = i + 1
+        elif stripped and not stripped.startswith(("//", "/*", "*")):
+            break
+    return end
+
+
+def _top_level_blocks(lines, header_end):
+    """(start, end) 0-based half-open ranges of top-level declarations"""
+    starts = [i for i in range(header_end, len(lines)) if TOP_LEVEL_PATTERN.match(lines[i])]
+    if not starts or starts[0] != header_end:
+        starts.insert(0, header_end)
+    return [(start, end) for start, end in zip(starts, starts[1:] + [len(lines)]) if start < end]
+
+
+def _relevant_terms(query, content):
+    """Symbols declared/used in the file and query keywords worth matching"""
+    declared = set(DECLARED_NAME_PATTERN.findall(content))
+    terms = set()
+    for word in WORD_PATTERN.findall(query):
+        if word in declared or f"<{word}" in content:
+            terms.add(word)
+        elif word.lower() not in STOPWORDS:
+            terms.add(word.lower())
+    for phrase in QUOTED_PATTERN.findall(query):
+        terms.add(phrase.strip().lower())
+    return terms
+
+
+def _relevant_lines(lines, query, error_lines):
+    hits = {line - 1 for line in error_lines if 0 < line <= len(lines)}
+    terms = _relevant_terms(query, "\n".join(lines)) if query else set()
+    if terms:
+        symbols = [re.compile(rf"(?<![\w$]){re.escape(term)}(?![\w$])") for term in terms if term[:1].isupper()]
+        keywords = [term for term in terms if not term[:1].isupper()]
+        for i, line in enumerate(lines):
+            lowered = line.lower()
+            if any(pattern.search(line) for pattern in symbols) or any(keyword in lowered for keyword in keywords):
+                hits.add(i)
+    return sorted(hits)
+
+
+def _merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def plan_file_slices(content, query="", error_lines=()):
+    """Line ranges (0-based, half-open) worth sending for one file, or None to send it whole"""
+    lines = content.split("\n")
+    hits = _relevant_lines(lines, query, error_lines)
+    if not hits:
+        return None
+
+    header_end = _import_header_end(lines)
+    blocks = _top_level_blocks(lines, header_end)
+    ranges = [(0, header_end)] if header_end else []
+    for hit in hits:
+        if hit < header_end:
+            continue
+        block = next(((start, end) for start, end in blocks if start <= hit < end), (hit, hit + 1))
+        if block[1] - block[0] <= SLICE_MAX_BLOCK_LINES:
+            ranges.append(block)
+        else:
+            ranges.append((max(block[0], hit - SLICE_CONTEXT_LINES), min(block[1], hit + SLICE_CONTEXT_LINES + 1)))
+
+    ranges = _merge_ranges(ranges)
+    covered = sum(end - start for start, end in ranges)
+    if covered > SLICE_MAX_COVERAGE * len(lines):
+        return None
+    return ranges
+
+
+def slice_files(files, min_chars, query="", locations=()):
+    """Replace large files by relevant excerpts.
+
+    Returns ``(agent_files, sliced)``: the {key: content} dict to send (whole
+    files keep their path as key) and {path: [excerpt keys]} for the files
+    that were cut into excerpts.
+    """
+    error_lines = {}
+    for location in locations or ():
+        if location.get("line"):
+            error_lines.setdefault(location["path"], []).append(location["line"])
+
+    agent_files, sliced = {}, {}
+    for file_path, content in files.items():
+        if not isinstance(content, str) or len(content) < min_chars or not is_source_file(file_path):
+            agent_files[file_path] = content
+            continue
+        ranges = plan_file_slices(content, query, error_lines.get(file_path, ()))
+        if not ranges:
+            agent_files[file_path] = content
+            continue
+        lines = content.split("\n")
+        sliced[file_path] = []
+        for start, end in ranges:
+            key = make_slice_key(file_path, start + 1, end)
+            agent_files[key] = "\n".join(lines[start:end])
+            sliced[file_path].append(key)
+    return agent_files, sliced
+
+
+def splice_slices(content, updates):
+    """Write returned excerpts ({key: new excerpt}) back into the full file content"""
+    lines = content.split("\n")
+    for key in sorted(updates, key=lambda k: split_slice_key(k)[1][0], reverse=True):
+        start, end = split_slice_key(key)[1]
+        excerpt = updates[key]
+        # Models often add a trailing newline the original excerpt didn't have
+        if excerpt.endswith("\n") and lines[end - 1] != "":
+            excerpt = excerpt[:-1]
+        lines[start - 1:end] = excerpt.split("\n")
+    return "\n".join(lines)
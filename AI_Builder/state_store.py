@@ -0,0 +1,88 @@
+"""
+Shared key-value state for AI Builder Version 2
+Uses Redis when REDIS_URL is set and reachable, otherwise an in-process store
+"""
+
+import json
+import os
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv, find_dotenv
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis is optional; everything falls back to the local store
+    aioredis = None
+
+_ = load_dotenv(find_dotenv())
+REDIS_URL = os.getenv("REDIS_URL")
+
+# After a Redis error, use the local store for this long before retrying
+REDIS_RETRY_SECONDS = 30
+MAX_LOCAL_KEYS = 10000
+
+_client = None
+_redis_down_until = 0.0
+_local = OrderedDict()
+
+
+def get_redis():
+    """Shared async Redis client, or None when not configured or recently failing"""
+    global _client
+    if not REDIS_URL or aioredis is None or time.monotonic() < _redis_down_until:
+        return None
+    if _client is None:
+        _client = aioredis.from_url(REDIS_URL, decode_responses=True, socket_timeout=0.5, socket_connect_timeout=0.5)
+    return _client
+
+
+def mark_redis_failed(error):
+    """Switch to the local fallback for a while after a Redis error"""
+    global _redis_down_until
+    if time.monotonic() >= _redis_down_until:
+        print(f"⚠️ Redis unavailable, using in-process state for {REDIS_RETRY_SECONDS}s: {error}")
+    _redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+
+def _local_get(key):
+    entry = _local.get(key)
+    if entry is None:
+        return None
+    value, expires_at = entry
+    if expires_at is not None and time.monotonic() > expires_at:
+        del _local[key]
+        return None
+    _local.move_to_end(key)
+    return value
+
+
+def _local_set(key, value, ttl):
+    _local[key] = (value, time.monotonic() + ttl if ttl else None)
+    _local.move_to_end(key)
+    while len(_local) > MAX_LOCAL_KEYS:
+        _local.popitem(last=False)
+
+
+async def get_json(key):
+    """Load a JSON value, None if missing"""
+    client = get_redis()
+    if client is not None:
+        try:
+            raw = await client.get(key)
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            mark_redis_failed(e)
+    return _local_get(key)
+
+
+async def set_json(key, value, ttl=None):
+    """Store a JSON-serializable value, optionally expiring after ``ttl`` seconds"""
+    client = get_redis()
+    if client is not None:
+        try:
+            await client.set(key, json.dumps(value), ex=ttl)
+            return
+        except Exception as e:
+            mark_redis_failed(e)
+    _local_set(key, value, ttl)
@@ -0,0 +1,291 @@
+"""
+Incremental JSON parser for streamed agent output
+Emits each project file as soon as its JSON value is complete
+"""
+
+import json
+import re
+
+# Characters that end a fast scan through string contents
+_STRING_SPECIAL = re.compile(r'["\\]')
+_WHITESPACE = " \t\r\n"
+
+
+class ProjectStreamParser:
+    """Incremental tokenizer for project JSON produced by the code agents.
+
+    Feed raw model text with ``feed()``; every call returns the
+    ``(path, content)`` pairs whose values closed inside that chunk.
+    Text before the first ``{`` (e.g. a ```json fence) and after the root
+    object is ignored.
+
+    ``files_key="files"`` matches the codegen format
+    (``{"project_name": ..., "files": {path: content}}``), while
+    ``files_key=None`` treats every top-level member as a file, which is the
+    modifier/resolver format (``{path: content}``).
+
+    Only the decoded values are kept, so the growing document is never held
+    a second time as raw text.
+    """
+
+    def __init__(self, files_key="files"):
+        self.files_key = files_key
+        self.project = {}
+        self.files = {}
+        if files_key is not None:
+            self.project[files_key] = self.files
+        self.started = False
+        self.complete = False
+
+        self._stack = []          # open containers: {"kind", "key", "files"}
+        self._in_string = False
+        self._string_is_key = False
+        self._escape = False
+        self._in_scalar = False
+        self._key_buf = []
+        self._capture = None      # raw pieces of the value being captured
+        self._capture_depth = 0
+        self._capture_target = None
+        self._completed = []
+
+    # -------------------
+    # Public API
+    # -------------------
+
+    def feed(self, chunk):
+        """Consume a chunk of model output and return newly completed files"""
+        self._completed = []
+        if not chunk or self.complete:
+            return self._completed
+
+        i = 0
+        n = len(chunk)
+        while i < n and not self.complete:
+            if self._in_string:
+                i = self._scan_string(chunk, i)
+                continue
+
+            c = chunk[i]
+            i += 1
+
+            if not self.started:
+                if c == "{":
+                    self.started = True
+                    self._stack.append({"kind": "{", "key": None, "files": self.files_key is None})
+                continue
+
+            if c in _WHITESPACE:
+                if self._in_scalar:
+                    self._end_scalar()
+                continue
+
+            if c == '"':
+                if self._in_scalar:
+                    self._end_scalar()
+                frame = self._stack[-1]
+                expecting_key = frame["kind"] == "{" and frame.get("expect_key", True)
+                if expecting_key and self._capture is None:
+                    self._string_is_key = True
+                    self._key_buf = []
+                else:
+                    # Value string, or a key nested inside a captured value
+                    if not expecting_key:
+                        self._start_value(c)
+                    self._string_is_key = False
+                    self._append('"')
+                self._in_string = True
+            elif c == ":":
+                self._stack[-1]["expect_key"] = False
+                self._append(c)
+            elif c == ",":
+                if self._in_scalar:
+                    self._end_scalar()
+                frame = self._stack[-1]
+                if frame["kind"] == "{":
+                    frame["expect_key"] = True
+                self._append(c)
+            elif c in "{[":
+                self._start_value(c)
+                self._append(c)
+                parent = self._stack[-1]
+                is_files = (
+                    c == "{"
+                    and self._capture is None
+                    and len(self._stack) == 1
+                    and parent["key"] == self.files_key
+                )
+                self._stack.append({"kind": c, "key": None, "files": is_files})
+            elif c in "}]":
+                if self._in_scalar:
+                    self._end_scalar()
+                self._stack.pop()
+                self._append(c)
+                if not self._stack:
+                    self.complete = True
+                    break
+                self._end_value()
+            else:
+                if not self._in_scalar:
+                    self._start_value(c)
+                    self._in_scalar = True
+                self._append(c)
+
+        return self._completed
+
+    def result(self):
+        """Return the object assembled so far (complete or partial)"""
+        if self.files_key is None:
+            return self.files
+        return self.project
+
+    # -------------------
+    # Internals
+    # -------------------
+
+    def _scan_string(self, chunk, i):
+        """Fast-forward through string contents; returns the next index"""
+        if self._escape:
+            self._append_string(chunk[i])
+            self._escape = False
+            return i + 1
+
+        match = _STRING_SPECIAL.search(chunk, i)
+        if match is None:
+            self._append_string(chunk[i:])
+            return len(chunk)
+
+        j = match.start()
+        if j > i:
+            self._append_string(chunk[i:j])
+        if chunk[j] == "\\":
+            self._append_string("\\")
+            self._escape = True
+            return j + 1
+
+        # Closing quote
+        self._in_string = False
+        if self._string_is_key:
+            self._string_is_key = False
+            self._stack[-1]["key"] = json.loads('"' + "".join(self._key_buf) + '"')
+            self._key_buf = []
+        else:
+            self._append('"')
+            self._end_value()
+        return j + 1
+
+    def _append_string(self, text):
+        if self._string_is_key:
+            self._key_buf.append(text)
+        else:
+            self._append(text)
+
+    def _append(self, text):
+        if self._capture is not None:
+            self._capture.append(text)
+
+    def _start_value(self, first_char):
+        """Begin capturing a value if it sits at a capture point"""
+        if self._capture is not None:
+            return
+        frame = self._stack[-1]
+        depth = len(self._stack)
+        if frame["files"]:
+            target = ("file", frame["key"])
+        elif depth == 1:
+            if frame["key"] == self.files_key and first_char == "{":
+                return
+            target = ("top", frame["key"])
+        else:
+            return
+        self._capture = []
+        self._capture_depth = depth
+        self._capture_target = target
+
+    def _end_scalar(self):
+        self._in_scalar = False
+        self._end_value()
+
+    def _end_value(self):
+        """Finish a captured value once the stack is back at its depth"""
+        if self._capture is None or len(self._stack) != self._capture_depth:
+            return
+        raw = "".join(self._capture)
+        self._capture = None
+        kind, key = self._capture_target
+        self._capture_target = None
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError as e:
+            print(f"⚠️ Stream parser could not decode value for {key}: {e}")
+            return
+        if kind == "file":
+            self.files[key] = value
+            self._completed.append((key, value))
+        else:
+            self.project[key] = value
+
+
+def _partial_tag_length(text, tags):
+    """Length of the longest suffix of ``text`` that could be the start of one of ``tags``"""
+    for length in range(min(len(text), max(len(tag) for tag in tags) - 1), 0, -1):
+        suffix = text[-length:]
+        if any(tag.startswith(suffix) for tag in tags):
+            return length
+    return 0
+
+
+class TaggedSectionParser:
+    """Splits streamed ``<name>...</name>`` sections (e.g. summary and plan) as they arrive.
+
+    ``feed()`` returns ``(section, text)`` pieces; a tag split across chunks
+    is held back until the next chunk. Text outside the sections is ignored
+    but kept in ``raw`` for output that ignored the format.
+    """
+
+    def __init__(self, sections=("summary", "plan")):
+        self.sections = {name: [] for name in sections}
+        self.current = None
+        self._open_tags = {f"<{name}>": name for name in sections}
+        self._buffer = ""
+        self._raw = []
+
+    def feed(self, chunk):
+        self._raw.append(chunk)
+        self._buffer += chunk
+        pieces = []
+        while self._buffer:
+            if self.current is None:
+                found = [(self._buffer.find(tag), tag) for tag in self._open_tags if tag in self._buffer]
+                if found:
+                    index, tag = min(found)
+                    self.current = self._open_tags[tag]
+                    self._buffer = self._buffer[index + len(tag):]
+                    continue
+                keep = _partial_tag_length(self._buffer, self._open_tags)
+                self._buffer = self._buffer[len(self._buffer) - keep:] if keep else ""
+                break
+
+            close_tag = f"</{self.current}>"
+            index = self._buffer.find(close_tag)
+            if index >= 0:
+                text, self._buffer = self._buffer[:index], self._buffer[index + len(close_tag):]
+                self._emit(text, pieces)
+                self.current = None
+                continue
+            keep = _partial_tag_length(self._buffer, [close_tag])
+            text, self._buffer = self._buffer[:len(self._buffer) - keep], self._buffer[len(self._buffer) - keep:]
+            self._emit(text, pieces)
+            break
+        return pieces
+
+    def _emit(self, text, pieces):
+        if text:
+            self.sections[self.current].append(text)
+            pieces.append((self.current, text))
+
+    def text(self, section):
+        return "".join(self.sections[section]).strip()
+
+    @property
+    def raw(self):
+        return "".join(self._raw)
@@ -0,0 +1,225 @@
+"""
+Local task classifier for AI Builder Version 2
+Rules from the manager prompt plus a naive Bayes model trained on logged manager decisions;
+the manager agent is only asked when neither is confident.
+The decision log holds raw user messages (see MANAGER_DECISION_LOG); file I/O and retraining
+run in worker threads, off the event loop.
+"""
+
+import asyncio
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from .metrics import increment
+from .models import LOCAL_CLASSIFIER_ENABLED, LOCAL_CLASSIFIER_MIN_CONFIDENCE, MANAGER_DECISION_LOG, MANAGER_DECISION_LOG_MAX_BYTES
+
+TASKS = ("code_generation", "error_resolution", "code_change", "code_conversation")
+
+# The model answers only once it has seen this many decisions; older log lines beyond the limit are ignored
+MIN_TRAINING_EXAMPLES = 200
+MAX_TRAINING_EXAMPLES = 50000
+RETRAIN_SECONDS = 3600
+
+GREETING_PATTERN = re.compile(
+    r"^\s*(hi+|hello+|hey+|hiya|yo|salam|assalam[ou]?\s*alaikum|as-salamu alaykum|good (morning|afternoon|evening)|"
+    r"thanks?|thank you|thx|ok(ay)?|cool|great|nice)\b[\s!.,?]*(there|team|bro|buddy|friend)?[\s!.,?]*$",
+    re.IGNORECASE,
+)
+QUESTION_PATTERN = re.compile(r"^\s*(what|why|how|which|who|when|where|is|are|does|do|can you explain|could you explain)\b.*\?\s*$", re.IGNORECASE | re.DOTALL)
+# A question that still asks for an edit ("how do I make the header blue? do it") is left to the model
+EDIT_REQUEST_PATTERN = re.compile(r"\b(change|update|add|remove|make|fix|create|build|replace|move|rename)\b", re.IGNORECASE)
+# Error signatures only ("TypeError: ...", stack frames, compiler output), not the word "error" in a feature request
+ERROR_PATTERN = re.compile(
+    r"\b[A-Z]\w*(Error|Exception):|\bUncaught\b|Failed to compile|Cannot read propert(y|ies) of|"
+    r"is not defined\b|is not a function\b|Module not found|Unexpected token\b.*\(\d+:\d+\)|"
+    r"\bat \S+ \(?\S+\.(jsx?|tsx?|mjs):\d+|\S+\.(jsx?|tsx?|mjs):\d+:\d+",
+)
+WORD_PATTERN = re.compile(r"[^\W\d_]+|\d+|\?", re.UNICODE)
+
+_model = None
+_trained_at = 0.0
+_retraining = None
+_log_lock = threading.Lock()
+# Keeps pending log writes alive until they finish
+_background_tasks = set()
+
+
+def features(text, has_project):
+    """Lowercased words and word pairs, plus whether the project already has code"""
+    words = WORD_PATTERN.findall((text or "").lower())[:200]
+    tokens = ["__project__" if has_project else "__empty__"]
+    tokens.extend(words)
+    tokens.extend(f"{first} {second}" for first, second in zip(words, words[1:]))
+    return tokens
+
+
+class NaiveBayesClassifier:
+    """Multinomial naive Bayes over ``features``, with Laplace smoothing"""
+
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+        self.examples = 0
+        self.label_counts = Counter()
+        self.token_counts = defaultdict(Counter)
+        self.token_totals = Counter()
+        self.vocabulary = set()
+
+    def fit(self, examples):
+        """Train on (text, has_project, task) triples"""
+        for text, has_project, task in examples:
+            tokens = features(text, has_project)
+            self.examples += 1
+            self.label_counts[task] += 1
+            self.token_counts[task].update(tokens)
+            self.token_totals[task] += len(tokens)
+            self.vocabulary.update(tokens)
+        return self
+
+    def predict(self, text, has_project):
+        """(task, probability) of the most likely task"""
+        if not self.examples:
+            return None, 0.0
+        tokens = features(text, has_project)
+        vocabulary_size = len(self.vocabulary)
+        scores = {}
+        for task, count in self.label_counts.items():
+            denominator = self.token_totals[task] + self.alpha * vocabulary_size
+            counts = self.token_counts[task]
+            scores[task] = math.log(count / self.examples) + sum(
+                math.log((counts[token] + self.alpha) / denominator) for token in tokens if token in self.vocabulary
+            )
+        best = max(scores, key=scores.get)
+        total = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1.0 / total
+
+
+def rule_decision(text, has_project):
+    """(task, confidence, rule) for the cases the manager prompt decides deterministically, else None"""
+    text = text or ""
+    if GREETING_PATTERN.match(text):
+        return "code_conversation", 0.97, "greeting"
+    if QUESTION_PATTERN.match(text) and not EDIT_REQUEST_PATTERN.search(text):
+        return "code_conversation", 0.92, "question"
+    if not has_project:
+        return "code_generation", 0.92, "empty_project"
+    if ERROR_PATTERN.search(text) and not EDIT_REQUEST_PATTERN.search(text):
+        return "error_resolution", 0.9, "error_message"
+    return None
+
+
+def classify(text, has_project, model=None):
+    """(task, confidence, source) from the rules, then the model; task is None when neither applies"""
+    decision = rule_decision(text, has_project)
+    if decision is not None:
+        task, confidence, rule = decision
+        return task, confidence, f"rule:{rule}"
+    if model is not None and model.examples >= MIN_TRAINING_EXAMPLES:
+        task, confidence = model.predict(text, has_project)
+        return task, confidence, "model"
+    return None, 0.0, "none"
+
+
+def load_decisions(path=MANAGER_DECISION_LOG, limit=MAX_TRAINING_EXAMPLES):
+    """Latest logged (text, has_project, task) decisions, including the rotated log"""
+    examples = []
+    for log_path in (f"{path}.1", path) if path else ():
+        if not os.path.exists(log_path):
+            continue
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("task") in TASKS:
+                    examples.append((record.get("text", ""), bool(record.get("has_project")), record["task"]))
+    return examples[-limit:]
+
+
+def _append_decision(line):
+    # Workers append whole lines in O_APPEND mode; a rotation race between workers only loses old lines
+    with _log_lock:
+        try:
+            if os.path.exists(MANAGER_DECISION_LOG) and os.path.getsize(MANAGER_DECISION_LOG) >= MANAGER_DECISION_LOG_MAX_BYTES:
+                os.replace(MANAGER_DECISION_LOG, f"{MANAGER_DECISION_LOG}.1")
+            with open(MANAGER_DECISION_LOG, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            print(f"⚠️ Could not log manager decision: {e}")
+
+
+def log_decision(text, has_project, task, source="manager"):
+    """Append an LLM routing decision to the training log (in a worker thread when called from async code)"""
+    if not MANAGER_DECISION_LOG or task not in TASKS:
+        return
+    line = json.dumps({"text": text, "has_project": has_project, "task": task, "source": source, "ts": time.time()}) + "\n"
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _append_decision(line)
+        return
+    write = loop.create_task(asyncio.to_thread(_append_decision, line))
+    _background_tasks.add(write)
+    write.add_done_callback(_background_tasks.discard)
+
+
+def _train():
+    global _model, _trained_at
+    model = NaiveBayesClassifier().fit(load_decisions(MANAGER_DECISION_LOG))
+    _model, _trained_at = model, time.monotonic()
+    print(f"🧮 Task classifier trained on {model.examples} logged decisions")
+
+
+def _retrain_done(task):
+    global _retraining
+    _retraining = None
+    if not task.cancelled() and task.exception() is not None:
+        print(f"⚠️ Task classifier retraining failed: {task.exception()}")
+
+
+def get_model():
+    """Naive Bayes model trained on the decision log, retrained hourly.
+
+    From async code a missing or stale model is retrained in a worker thread
+    while the previous one (or the rules alone) keeps answering.
+    """
+    global _retraining
+    if _model is not None and time.monotonic() - _trained_at <= RETRAIN_SECONDS:
+        return _model
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _train()
+        return _model
+    if _retraining is None:
+        _retraining = loop.create_task(asyncio.to_thread(_train))
+        _retraining.add_done_callback(_retrain_done)
+    return _model
+
+
+def local_task_decision(text, has_project):
+    """Task when the local classifier is confident enough to skip the manager agent, else None"""
+    if not LOCAL_CLASSIFIER_ENABLED:
+        return None
+    task, confidence, source = classify(text, has_project, get_model())
+    if task is None or confidence < LOCAL_CLASSIFIER_MIN_CONFIDENCE:
+        increment("classifier.uncertain")
+        return None
+    increment(f"classifier.{source.split(':')[0]}")
+    print(f"🧮 Local task decision: {task} ({source}, {confidence:.2f})")
+    return task
+
+
+def classifier_stats():
+    model = _model
+    return {
+        "enabled": LOCAL_CLASSIFIER_ENABLED,
+        "min_confidence": LOCAL_CLASSIFIER_MIN_CONFIDENCE,
+        "training_examples": model.examples if model is not None else 0,
+        "model_active": model is not None and model.examples >= MIN_TRAINING_EXAMPLES,
+    }
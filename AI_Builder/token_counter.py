@@ -0,0 +1,92 @@
+"""
+Local token counting for billing
+Calibrated tiktoken estimate of Anthropic input tokens; credit_calculator falls back to the API on demand
+"""
+
+import os
+
+import tiktoken
+from dotenv import load_dotenv, find_dotenv
+
+from . import prompts
+
+_ = load_dotenv(find_dotenv())
+
+# Anthropic tokens per cl100k token; measure with `python -m AI_Builder.benchmarks calibrate`
+TOKEN_CALIBRATION_FACTOR = float(os.getenv("TOKEN_CALIBRATION_FACTOR", "1.1"))
+# "local" counts with the calibrated tokenizer, "api" always calls count_tokens
+TOKEN_COUNT_MODE = os.getenv("TOKEN_COUNT_MODE", "local").strip().lower()
+
+# Fixed framing the API adds per request and per message
+REQUEST_OVERHEAD_TOKENS = 8
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+_static_counts = {}
+
+
+def get_encoding():
+    """cl100k_base encoding, or None if it can't be loaded (e.g. offline without a cache)"""
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"⚠️ Local tokenizer unavailable, token counts fall back to the API: {e}")
+            _encoding = False
+    return _encoding or None
+
+
+def raw_token_count(text):
+    """Uncalibrated cl100k token count"""
+    encoding = get_encoding()
+    if encoding is None:
+        raise RuntimeError("local tokenizer unavailable")
+    return len(encoding.encode(text or "", disallowed_special=()))
+
+
+def count_text_tokens(text):
+    """Calibrated estimate of Anthropic tokens for a piece of text"""
+    if not text:
+        return 0
+    cached = _static_counts.get(text)
+    if cached is not None:
+        return cached
+    return round(raw_token_count(text) * TOKEN_CALIBRATION_FACTOR)
+
+
+def precompute_static_counts(texts=None):
+    """Count static texts (all system prompts by default) once so billing only tokenizes dynamic parts"""
+    if texts is None:
+        texts = [value for name, value in vars(prompts).items() if name.endswith("_prompt") and isinstance(value, str)]
+    try:
+        for text in texts:
+            if text and text not in _static_counts:
+                _static_counts[text] = round(raw_token_count(text) * TOKEN_CALIBRATION_FACTOR)
+    except RuntimeError:
+        return 0
+    print(f"🔢 Precomputed token counts for {len(_static_counts)} static prompts")
+    return len(_static_counts)
+
+
+def content_text(content):
+    """Text parts of a message content (string or list of content blocks)"""
+    if isinstance(content, str):
+        return [content]
+    texts = []
+    for block in content or []:
+        if isinstance(block, dict) and block.get("type") == "text":
+            texts.append(block.get("text", ""))
+        elif isinstance(block, str):
+            texts.append(block)
+    return texts
+
+
+def count_messages_locally(system, messages):
+    """Calibrated local estimate of count_tokens(system, messages)"""
+    total = REQUEST_OVERHEAD_TOKENS + count_text_tokens(system)
+    for message in messages:
+        total += MESSAGE_OVERHEAD_TOKENS
+        for text in content_text(message.get("content")):
+            total += count_text_tokens(text)
+    return total
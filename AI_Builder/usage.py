@@ -0,0 +1,91 @@
+"""
+Per-request token usage reported by the model providers
+Every agent run adds to the UsageRecord of the request it belongs to
+"""
+
+import contextvars
+
+from .metrics import increment
+
+_current_usage = contextvars.ContextVar("request_usage", default=None)
+
+
+class UsageRecord:
+    """Provider-reported token usage for one API request, broken down by agent"""
+
+    def __init__(self):
+        self.agents = {}
+
+    def add(self, agent_name, input_tokens=0, output_tokens=0, cached_tokens=0, requests=1):
+        entry = self.agents.setdefault(agent_name, {"requests": 0, "input_tokens": 0, "output_tokens": 0, "cached_tokens": 0})
+        entry["requests"] += requests
+        entry["input_tokens"] += input_tokens
+        entry["output_tokens"] += output_tokens
+        entry["cached_tokens"] += cached_tokens
+
+    def total(self, field):
+        return sum(entry[field] for entry in self.agents.values())
+
+    @property
+    def input_tokens(self):
+        return self.total("input_tokens")
+
+    @property
+    def output_tokens(self):
+        return self.total("output_tokens")
+
+    @property
+    def cached_tokens(self):
+        return self.total("cached_tokens")
+
+    def is_empty(self):
+        return not self.agents
+
+    def summary(self):
+        return {
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_tokens": self.cached_tokens,
+            "agents": self.agents,
+        }
+
+
+def start_usage_record():
+    """Begin collecting usage for the current request (tasks started later share it)"""
+    record = UsageRecord()
+    _current_usage.set(record)
+    return record
+
+
+def current_usage_record():
+    return _current_usage.get()
+
+
+def usage_from_stream_event(event):
+    """Usage from a raw ``response.completed`` stream event, None for any other event"""
+    if getattr(event, "type", None) != "raw_response_event":
+        return None
+    data = getattr(event, "data", None)
+    if getattr(data, "type", None) != "response.completed":
+        return None
+    return getattr(getattr(data, "response", None), "usage", None)
+
+
+def record_usage(agent_name, usage):
+    """Add a provider usage object (Responses or Agents SDK ``Usage``) to the current request"""
+    if usage is None:
+        return
+    details = getattr(usage, "input_tokens_details", None)
+    input_tokens = getattr(usage, "input_tokens", 0) or 0
+    output_tokens = getattr(usage, "output_tokens", 0) or 0
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    if not input_tokens and not output_tokens:
+        return  # provider didn't report usage
+
+    increment(f"usage.{agent_name}.input_tokens", input_tokens)
+    increment(f"usage.{agent_name}.output_tokens", output_tokens)
+    increment(f"usage.{agent_name}.cached_tokens", cached_tokens)
+
+    record = current_usage_record()
+    if record is not None:
+        record.add(agent_name, input_tokens, output_tokens, cached_tokens)
@@ -0,0 +1,8 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# AI_Builder.models builds the provider clients at import time
+os.environ.setdefault("CLAUDE_API_KEY", "test-key")
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
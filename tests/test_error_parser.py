@@ -0,0 +1,19 @@
+from AI_Builder.error_parser import parse_error_message
+
+PROJECT_FILES = {
+    "package.json": "{}",
+    "src/App.jsx": "export default function App() {}",
+    "src/main.jsx": "import App from './App.jsx'",
+}
+
+
+def test_locates_json_file():
+    result = parse_error_message("Error in package.json: Unexpected token } in JSON at position 120", PROJECT_FILES)
+    assert result["confident"]
+    assert result["primary_error_file"] == "package.json"
+
+
+def test_js_extension_does_not_swallow_jsx_or_json():
+    result = parse_error_message("src/App.jsx:12:5 and package.json", PROJECT_FILES)
+    assert [location["path"] for location in result["locations"]] == ["src/App.jsx", "package.json"]
+    assert result["locations"][0]["line"] == 12
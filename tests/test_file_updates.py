@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+from agents import Agent
+
+from AI_Builder import functions
+from AI_Builder.functions import stream_file_updates_with_fallback
+
+BIG_FILE = "import React from 'react';\n\n" + "\n\n".join(
+    f"function Section{index}() {{\n  return <section className=\"section-{index}\">Section {index} content goes here</section>;\n}}"
+    for index in range(120)
+) + "\n\nexport default function App() {\n  return <main><Section7 /></main>;\n}\n"
+ORIGINALS = {"src/App.jsx": BIG_FILE}
+SLICE_HINTS = {"query": "Change the text of Section7"}
+AGENT = Agent(name="CodeModifier", instructions="test")
+
+
+def run(monkeypatch, outputs, unresolved):
+    """Feed the scripted agent outputs (one per call) through the full-file route (no fallback agent)"""
+    inputs = []
+
+    async def fake_run(agent, input_data, estimated_response_tokens=None):
+        inputs.append(json.loads(input_data)["files"])
+        yield json.dumps(outputs[len(inputs) - 1])
+
+    async def scenario():
+        make_input = lambda files: json.dumps({"files": files})
+        return [item async for item in stream_file_updates_with_fallback(AGENT, None, make_input, ORIGINALS, [], SLICE_HINTS, unresolved=unresolved)]
+
+    monkeypatch.setattr(functions, "run_agent_with_token_limit_streaming", fake_run)
+    return asyncio.run(scenario()), inputs
+
+
+def test_invented_excerpt_range_is_retried_whole_with_same_agent(monkeypatch):
+    fixed = BIG_FILE.replace("Section 7 content", "Section seven")
+    unresolved = []
+    updates, inputs = run(monkeypatch, [{"src/App.jsx::L1-L2": "import React from 'react';"}, {"src/App.jsx": fixed}], unresolved)
+    assert all("::L" in key for key in inputs[0])
+    assert inputs[1] == {"src/App.jsx": BIG_FILE}
+    assert updates == [("src/App.jsx", fixed)]
+    assert unresolved == []
+
+
+def test_whole_file_output_for_sliced_file_is_retried_whole(monkeypatch):
+    fixed = BIG_FILE.replace("Section 7 content", "Section seven")
+    unresolved = []
+    updates, inputs = run(monkeypatch, [{"src/App.jsx": "export default function App() {}"}, {"src/App.jsx": fixed}], unresolved)
+    assert inputs[1] == {"src/App.jsx": BIG_FILE}
+    assert updates == [("src/App.jsx", fixed)]
+
+
+def test_file_left_unchanged_is_reported(monkeypatch):
+    unresolved = []
+    updates, _ = run(monkeypatch, [{"src/App.jsx": "export default function App() {}"}, {"src/App.jsx::L1-L2": "import React from 'react';"}], unresolved)
+    assert updates == []
+    assert unresolved == ["src/App.jsx"]
+
+
+def test_failed_group_is_reported(monkeypatch):
+    async def fake_run(agent, input_data, estimated_response_tokens=None):
+        files = json.loads(input_data)["files"]
+        if "src/b.jsx" in files:
+            raise RuntimeError("provider error")
+        yield json.dumps({path: content + "// edited" for path, content in files.items()})
+
+    async def scenario():
+        make_input_for = lambda index: lambda files: json.dumps({"files": files})
+        groups = [["src/a.jsx"], ["src/b.jsx"]]
+        originals = {"src/a.jsx": "a", "src/b.jsx": "b"}
+        failed_groups = []
+        updates = [item async for item in functions.stream_file_updates_parallel(AGENT, None, make_input_for, groups, originals, [], failed_groups=failed_groups)]
+        return updates, failed_groups
+
+    monkeypatch.setattr(functions, "run_agent_with_token_limit_streaming", fake_run)
+    updates, failed_groups = asyncio.run(scenario())
+    assert updates == [(0, "src/a.jsx", "a// edited")]
+    assert failed_groups == [1]
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from AI_Builder import generation_limits
+from AI_Builder.generation_limits import GenerationLease, GenerationLimitExceeded, stream_with_lease
+
+
+async def _events():
+    yield "data: {}\n\n"
+
+
+def test_lease_of_never_started_stream_is_released(monkeypatch):
+    monkeypatch.setattr(generation_limits, "LEASE_RENEW_SECONDS", 0.01)
+    monkeypatch.setattr(generation_limits, "LEASE_START_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(generation_limits, "USER_MAX_CONCURRENT_GENERATIONS", 1)
+
+    async def scenario():
+        lease = await GenerationLease("user-never-started").acquire()
+        wrapper = stream_with_lease(_events(), lease)
+        await wrapper.aclose()  # client left before Starlette iterated the body
+        with pytest.raises(GenerationLimitExceeded):
+            await GenerationLease("user-never-started").acquire()
+        await asyncio.sleep(0.2)
+        assert lease.released and lease._renew_task is None
+        await (await GenerationLease("user-never-started").acquire()).release()
+
+    asyncio.run(scenario())
+
+
+def test_renewal_stops_after_max_lifetime(monkeypatch):
+    monkeypatch.setattr(generation_limits, "LEASE_RENEW_SECONDS", 0.01)
+    monkeypatch.setattr(generation_limits, "LEASE_MAX_SECONDS", 0.05)
+
+    async def scenario():
+        lease = await GenerationLease("user-long-stream").acquire()
+        lease.started = True
+        await asyncio.sleep(0.2)
+        assert lease._renew_task is None and not lease.released
+        await lease.release()
+
+    asyncio.run(scenario())
+
+
+def test_release_is_idempotent():
+    async def scenario():
+        lease = await GenerationLease("user-twice").acquire()
+        wrapper = stream_with_lease(_events(), lease)
+        assert [item async for item in wrapper] == ["data: {}\n\n"]
+        assert lease.released
+        await lease.release()
+
+    asyncio.run(scenario())
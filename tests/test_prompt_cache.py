@@ -0,0 +1,52 @@
+import asyncio
+
+from agents import Agent, OpenAIChatCompletionsModel, Runner
+
+from AI_Builder.benchmarks import _cache_markers, _start_stand_in_server
+from AI_Builder.clients import get_anthropic_chat_client
+from AI_Builder.prompt_cache import CACHE_CONTROL, PROMPT_CACHE_MIN_CHARS, add_cache_markers
+
+LONG_SYSTEM_PROMPT = "You are a React code generator. " * (PROMPT_CACHE_MIN_CHARS // 20)
+HISTORY = [
+    {"role": "user", "content": "Build a landing page for a coffee shop"},
+    {"role": "assistant", "content": "Here is the landing page. " * 400},
+]
+
+
+def test_marks_long_system_prompt_only():
+    messages = [{"role": "system", "content": LONG_SYSTEM_PROMPT}, *HISTORY, {"role": "user", "content": "Add a footer"}]
+    assert add_cache_markers(messages) == 1
+    assert messages[0]["content"][-1]["cache_control"] == CACHE_CONTROL
+    assert all(isinstance(message["content"], str) for message in messages[1:])
+
+
+def test_short_system_prompt_is_not_marked():
+    messages = [{"role": "system", "content": "You are helpful."}, *HISTORY, {"role": "user", "content": "Add a footer"}]
+    assert add_cache_markers(messages) == 0
+    assert messages[0]["content"] == "You are helpful."
+
+
+async def _request_bodies(instructions):
+    received = []
+    server = await _start_stand_in_server(received)
+    port = server.sockets[0].getsockname()[1]
+    client = get_anthropic_chat_client("stand-in", f"http://127.0.0.1:{port}/v1/")
+    agent = Agent(name="CacheProbe", instructions=instructions, model=OpenAIChatCompletionsModel(model="stand-in", openai_client=client))
+    try:
+        await Runner.run(agent, HISTORY + [{"role": "user", "content": "Add a footer"}])
+    finally:
+        server.close()
+        await server.wait_closed()
+    return received
+
+
+def test_messages_request_carries_system_prompt_marker():
+    body, = asyncio.run(_request_bodies(LONG_SYSTEM_PROMPT))
+    assert _cache_markers(body) == ["system"]
+    assert body["system"][-1]["cache_control"] == CACHE_CONTROL
+    assert [message["role"] for message in body["messages"]] == ["user", "assistant", "user"]
+
+
+def test_messages_request_without_marker_for_short_system_prompt():
+    body, = asyncio.run(_request_bodies("You are helpful."))
+    assert _cache_markers(body) == []
@@ -0,0 +1,37 @@
+import asyncio
+
+from AI_Builder import task_classifier
+from AI_Builder.task_classifier import get_model, load_decisions, log_decision, rule_decision
+
+
+def test_error_rule_ignores_feature_requests():
+    assert rule_decision("Add a 404 Error page", True) is None
+    assert rule_decision("TypeError: Cannot read properties of undefined (reading 'map')", True)[0] == "error_resolution"
+
+
+def test_decision_log_is_rotated(tmp_path, monkeypatch):
+    log_path = str(tmp_path / "decisions.jsonl")
+    monkeypatch.setattr(task_classifier, "MANAGER_DECISION_LOG", log_path)
+    monkeypatch.setattr(task_classifier, "MANAGER_DECISION_LOG_MAX_BYTES", 300)
+    for index in range(10):
+        log_decision(f"make the header blue {index}", True, "code_change")
+    assert (tmp_path / "decisions.jsonl.1").exists()
+    examples = load_decisions(log_path)
+    assert examples[-1] == ("make the header blue 9", True, "code_change")
+    assert len(examples) < 10  # older lines beyond one rotation are dropped
+
+
+def test_logging_and_retraining_run_off_the_event_loop(tmp_path, monkeypatch):
+    log_path = str(tmp_path / "decisions.jsonl")
+    monkeypatch.setattr(task_classifier, "MANAGER_DECISION_LOG", log_path)
+    monkeypatch.setattr(task_classifier, "_model", None)
+
+    async def scenario():
+        log_decision("make the header blue", True, "code_change")
+        assert get_model() is None  # retraining started in a worker thread
+        while task_classifier._retraining is not None or task_classifier._background_tasks:
+            await asyncio.sleep(0.01)
+        return get_model()
+
+    assert asyncio.run(scenario()) is not None
+    assert load_decisions(log_path) == [("make the header blue", True, "code_change")]